@@ -0,0 +1,92 @@
+"""
+bench_decode.py
+
+Benchmark of ajax archive payload decoding: the row by row Game building the scraper used to do
+against the batch column decoder of oddsportal.decode, the hot spot when re-parsing pages in bulk
+
+Usage: python benchmarks/bench_decode.py [--fixtures DIR] [--pages N] [--rows N] [--repeat N]
+
+"""
+
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import load_responses
+from oddsportal.decode import decode_response
+from oddsportal.models import Game
+
+BASE_URL = 'https://www.oddsportal.com'
+URL = BASE_URL + '/basketball/usa/nba/results/#/page/1'
+RETRIEVAL_TIMESTAMP = 1700000000
+
+
+def decode_per_row(response_text, possible_outcomes):
+    result = json.loads(response_text)
+    games = []
+    for item in result['d']['rows']:
+        game = Game()
+        games.append(game)
+        game.game_datetime = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(item['date-start-timestamp']))
+        game.retrieval_timestamp = RETRIEVAL_TIMESTAMP
+        game.retrieval_url = URL
+        game.num_possible_outcomes = possible_outcomes
+        game.team_home = item['home-name']
+        game.team_away = item['away-name']
+        game.game_url = BASE_URL + item['url']
+        sh, sa = item['homeResult'], item['awayResult']
+        game.score_home = int(sh) if sh else None
+        game.score_away = int(sa) if sa else None
+        if item['home-winner'] == 'win':
+            game.outcome = 'HOME'
+        elif item['home-winner'] == 'lost':
+            game.outcome = 'AWAY'
+        else:
+            game.outcome = 'DRAW'
+        odds = item['odds']
+        if odds:
+            game.odds_home = float(odds[0]['avgOdds'])
+            game.odds_away = float(odds[1]['avgOdds'])
+            game.odds_draw = None if len(odds) < 3 else float(odds[2]['avgOdds'])
+    return games
+
+
+def decode_batch(response_text, possible_outcomes):
+    return decode_response(response_text, URL, BASE_URL, possible_outcomes, RETRIEVAL_TIMESTAMP)
+
+
+def bench(decoder, responses, repeat):
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        for _, response_text in responses:
+            decoder(response_text, 3)
+    return time.perf_counter() - started_at
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fixtures', type=str, nargs='?', help='Directory of saved *.json ajax archive payloads (default synthetic payloads)')
+    parser.add_argument('--pages', type=int, default=200, help='Synthetic payloads to generate (default 200)')
+    parser.add_argument('--rows', type=int, default=50, help='Rows per synthetic payload (default 50)')
+    parser.add_argument('--repeat', type=int, default=5, help='Passes over the payloads (default 5)')
+    args = parser.parse_args()
+
+    responses = load_responses(args.fixtures, count=args.pages, rows=args.rows)
+    if not responses:
+        sys.exit('No payloads to benchmark')
+    mismatches = [name for name, response_text in responses
+                  if [g.to_dict() for g in decode_per_row(response_text, 3)] != [g.to_dict() for g in decode_batch(response_text, 3)]]
+    for name in mismatches:
+        print('Decoding differs on', name)
+
+    rows = sum(len(json.loads(response_text)['d']['rows']) for _, response_text in responses) * args.repeat
+    results = [('per row', bench(decode_per_row, responses, args.repeat)),
+               ('batch', bench(decode_batch, responses, args.repeat))]
+    for name, seconds in results:
+        print('%-10s %8.3f s  %10.0f rows/s' % (name, seconds, rows / seconds))
+    print('speedup    %8.1fx over %d payloads, %d mismatches' % (results[0][1] / results[1][1], len(responses), len(mismatches)))
@@ -0,0 +1,104 @@
+"""
+bench_e2e.py
+
+Offline end to end benchmark: serves a generated league from a local stand-in of the site, then
+discovers its seasons with Crawler.get_seasons_for_league, paginates them with
+fill_in_season_pagination_links and scrapes them with Scraper.populate_games_into_season, reporting
+throughput, latency percentiles per stage and peak memory
+
+Usage: python benchmarks/bench_e2e.py [--seasons 30] [--pages 50] [--mode browserless|browser] [--driver http|chrome]
+
+"""
+
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.standin import HttpDriver
+from benchmarks.standin import start_server
+from oddsportal import Cache
+from oddsportal import Crawler
+from oddsportal import Scraper
+from oddsportal.driverpool import launch_chrome_driver
+from oddsportal.metrics import METRICS
+
+
+def report_phase(name, seconds, pages, games=None):
+    line = '%-12s %8.2f s  %8.1f pages/s' % (name, seconds, pages / seconds if seconds else 0.0)
+    if games is not None:
+        line += '  %10.0f games/s' % (games / seconds if seconds else 0.0)
+    print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seasons', type=int, default=30, help='Seasons of the stand-in league (default 30)')
+    parser.add_argument('--pages', type=int, default=50, help='Results pages per season (default 50)')
+    parser.add_argument('--rows', type=int, default=50, help='Games per results page (default 50)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds the stand-in server adds to every response (default 0)')
+    parser.add_argument('--port', type=int, default=8765, help='Port of the stand-in server (default 8765)')
+    parser.add_argument('--mode', choices=['browserless', 'browser'], default='browserless', help='How season pages are scraped (default browserless)')
+    parser.add_argument('--driver', choices=['http', 'chrome'], default='http', help='Driver for crawling and browser mode, http needs no Chrome (default http)')
+    parser.add_argument('--rps', type=float, default=1000, help='Ajax requests per second, browserless only (default 1000)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Ajax requests in flight, browserless only (default 8)')
+    parser.add_argument('--compact-games', action='store_true', help='Hold games as typed columns instead of objects')
+    parser.add_argument('--trace-memory', action='store_true', help='Also report the peak Python heap, slower')
+    args = parser.parse_args()
+
+    server, site = start_server(port=args.port, seasons=args.seasons, pages=args.pages, rows=args.rows, latency=args.latency)
+    cache_directory = tempfile.TemporaryDirectory()
+    driver = launch_chrome_driver() if args.driver == 'chrome' else HttpDriver()
+    if args.trace_memory:
+        tracemalloc.start()
+    try:
+        started_at = time.perf_counter()
+        crawler = Crawler(driver=driver, wait_on_page_load=15, base_url=site.base_url)
+        seasons = crawler.get_seasons_for_league(site.get_league_url())
+        report_phase('discovery', time.perf_counter() - started_at, 1)
+
+        started_at = time.perf_counter()
+        for season in seasons:
+            crawler.fill_in_season_pagination_links(season)
+            season.sport = 'basketball'
+            season.league = 'usa/nba'
+            season.possible_outcomes = 2
+            if args.compact_games:
+                season.make_compact()
+        report_phase('pagination', time.perf_counter() - started_at, len(seasons))
+
+        # A fresh cache, so every page goes over the wire
+        cache = Cache(path=os.path.join(cache_directory.name, 'cache.sqlite3'))
+        if args.mode == 'browserless':
+            scraper = Scraper(browserless=True, request_delay=0, rps=args.rps, concurrency=args.concurrency, cache=cache,
+                              base_url=site.base_url)
+        else:
+            scraper = Scraper(wait_on_page_load=15, driver=driver, cache=cache, base_url=site.base_url)
+        started_at = time.perf_counter()
+        for season in seasons:
+            scraper.populate_games_into_season(season)
+        scrape_seconds = time.perf_counter() - started_at
+        pages = sum(len(season.urls) for season in seasons)
+        games = sum(len(season.games) for season in seasons)
+        report_phase('scrape', scrape_seconds, pages, games)
+        cache.close()
+
+        print()
+        print('%d seasons, %d pages, %d games (expected %d)' % (len(seasons), pages, games, args.seasons * args.pages * args.rows))
+        for stage, summary in sorted(METRICS.get_summary()['stages'].items()):
+            print('%-12s n=%-6d mean %7.2f ms  p50 %7.2f ms  p90 %7.2f ms  p99 %7.2f ms  max %7.2f ms' % (
+                stage, summary['count'], 1000 * summary['mean'], 1000 * summary['p50'], 1000 * summary['p90'],
+                1000 * summary['p99'], 1000 * summary['max']))
+        print('peak RSS     %8.1f MB' % (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+        if args.trace_memory:
+            print('peak heap    %8.1f MB' % (tracemalloc.get_traced_memory()[1] / 1024 / 1024))
+    finally:
+        driver.quit()
+        server.terminate()
+        cache_directory.cleanup()
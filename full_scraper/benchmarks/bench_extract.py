@@ -0,0 +1,71 @@
+"""
+bench_extract.py
+
+Micro-benchmark of the page extraction done for every results page: the pyquery DOM path the
+scraper used to take against the precompiled patterns of oddsportal.extract
+
+Usage: python benchmarks/bench_extract.py [--fixtures DIR] [--repeat N]
+
+"""
+
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import load_pages
+from oddsportal import extract
+from oddsportal.readiness import SEASON_LINKS_SELECTOR
+from pyquery import PyQuery as pyquery
+
+
+def extract_with_pyquery(html_source):
+    html_querying = pyquery(html_source)
+    no_data_div = html_querying.find('div.message-info > ul > li > div.cms')
+    no_data = no_data_div != None and no_data_div.text() == 'No data available'
+    scripts = html_querying.find('script')
+    url_param_dom = [s.text for s in scripts if s.text and 'pageOut' in s.text]
+    tournament_params = json.loads(url_param_dom[0].split("'")[1]) if url_param_dom else None
+    pagination_links = html_querying.find('a.pagination-link')
+    page_count = int(pagination_links[-2].attrib['data-number']) if len(pagination_links) > 1 else None
+    season_links = [(a.text, a.attrib['href']) for a in html_querying.find(SEASON_LINKS_SELECTOR)]
+    return no_data, tournament_params, page_count, season_links
+
+
+def extract_with_patterns(html_source):
+    return (extract.is_no_data(html_source), extract.extract_tournament_params(html_source),
+            extract.extract_page_count(html_source), extract.extract_season_links(html_source))
+
+
+def bench(extractor, pages, repeat):
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        for _, html_source in pages:
+            extractor(html_source)
+    return time.perf_counter() - started_at
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fixtures', type=str, nargs='?', help='Directory of saved *.html results pages (default synthetic pages)')
+    parser.add_argument('--repeat', type=int, default=20, help='Passes over the pages (default 20)')
+    args = parser.parse_args()
+
+    pages = load_pages(args.fixtures)
+    if not pages:
+        sys.exit('No pages to benchmark')
+    mismatches = [name for name, html_source in pages if extract_with_pyquery(html_source) != extract_with_patterns(html_source)]
+    for name in mismatches:
+        print('Extraction differs on', name)
+
+    total_bytes = sum(len(html_source) for _, html_source in pages) * args.repeat
+    results = [('pyquery', bench(extract_with_pyquery, pages, args.repeat)),
+               ('patterns', bench(extract_with_patterns, pages, args.repeat))]
+    for name, seconds in results:
+        print('%-10s %8.3f s  %8.2f ms/page  %8.1f MB/s' % (name, seconds, 1000 * seconds / (len(pages) * args.repeat),
+                                                         total_bytes / seconds / 1e6))
+    print('speedup    %8.1fx over %d pages, %d mismatches' % (results[0][1] / results[1][1], len(pages), len(mismatches)))
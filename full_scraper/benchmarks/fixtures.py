@@ -0,0 +1,126 @@
+"""
+fixtures.py
+
+Synthetic stand-ins for saved Odds Portal pages and ajax archive payloads, shaped like the real ones
+around the parts the scraper reads, pages padded with the kind of bulk a real page carries
+
+"""
+
+
+import glob
+import json
+import os
+import random
+
+
+SEASON_LINKS_PREFIX = '<div id="app"><div><div class="w-full"><div><main><div class="relative w-full bg-white-main"><div class="flex flex-col"><div>'
+SEASON_LINKS_SUFFIX = '</div></div></div></main></div></div></div></div>'
+
+
+def gen_filler(rng, blocks):
+    """
+    Returns:
+        (str) markup and scripts standing in for the rest of a page
+    """
+    parts = []
+    for i in range(blocks):
+        parts.append('<div class="flex items-center border-b"><span class="text-xs">%d</span>'
+                     '<a href="/basketball/usa/nba/team-%d/" class="truncate">Team %d</a>'
+                     '<p class="height-content">%.2f</p></div>' % (i, rng.randint(0, 99), i, rng.uniform(1, 5)))
+        if i % 50 == 0:
+            parts.append('<script>window.dataLayer = window.dataLayer || []; dataLayer.push({"block": %d});</script>' % i)
+    return ''.join(parts)
+
+
+def gen_results_page(rng, page_count=20, season_count=20, blocks=2000, no_data=False, season_links=None,
+                     tournament_id='ABCdef12'):
+    """
+    Params:
+        season_links (list) of (season name, href), season_count NBA seasons of the real site when None
+        tournament_id (str) "id" of the pageOut params
+
+    Returns:
+        (str) a league results page with season links, pagination and the pageOut script
+    """
+    if season_links is None:
+        season_links = [('%d/%d' % (year, year + 1), 'https://www.oddsportal.com/basketball/usa/nba-%d-%d/results/' % (year, year + 1))
+                        for year in range(2023 - season_count, 2023)]
+    season_links = ''.join('<a class="flex items-center" href="%s">%s</a>' % (href, name) for name, href in season_links)
+    pagination = ''.join('<a class="pagination-link" data-number="%d" href="#/page/%d/">%d</a>' % (i, i, i)
+                         for i in range(1, page_count + 1))
+    pagination += '<a class="pagination-link" data-number="%d" href="#/page/%d/">next</a>' % (2, 2)
+    notice = '<div class="message-info"><ul><li><div class="cms">No data available</div></li></ul></div>' if no_data else ''
+    return ''.join([
+        '<html><head><title>NBA Results</title>',
+        '<script>var bookmakersData = {}; var pageVar = "";</script>',
+        '</head><body>',
+        SEASON_LINKS_PREFIX,
+        '<div class="flex flex-wrap gap-2">', season_links, '</div>',
+        SEASON_LINKS_SUFFIX,
+        gen_filler(rng, blocks),
+        notice,
+        '<div class="pagination">', pagination, '</div>',
+        '<script>var page = new PageTournament(); pageOut(\'{"id":"%s","sid":3,"cid":200,"archive":true}\');</script>' % tournament_id,
+        gen_filler(rng, blocks // 4),
+        '</body></html>',
+    ])
+
+
+def gen_archive_response(rng, rows=50, teams=30, outcomes=2):
+    """
+    Returns:
+        (str) an ajax archive JSON payload with the given number of d.rows
+    """
+    items = []
+    for i in range(rows):
+        home, away = rng.sample(range(teams), 2)
+        winner = rng.choice(['win', 'lost', 'draw'] if outcomes == 3 else ['win', 'lost'])
+        odds = [{'avgOdds': round(rng.uniform(1.05, 8), 2)} for _ in range(outcomes)]
+        items.append({
+            'date-start-timestamp': 1577836800 + rng.randint(0, 3 * 10 ** 7),
+            'home-name': 'Team %d' % home,
+            'away-name': 'Team %d' % away,
+            'url': '/basketball/usa/nba/team-%d-team-%d-%08x/' % (home, away, rng.getrandbits(32)),
+            'homeResult': str(rng.randint(80, 130)),
+            'awayResult': str(rng.randint(80, 130)),
+            'home-winner': winner,
+            'odds': odds if rng.random() > 0.02 else [],
+        })
+    return json.dumps({'s': 1, 'd': {'total': rows, 'onePage': rows, 'rows': items}})
+
+
+def load_pages(directory=None, count=10, seed=0):
+    """
+    Params:
+        directory (str) of saved *.html pages, synthetic pages are generated when None
+
+    Returns:
+        (list) of (name, html source)
+    """
+    if directory:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+            with open(path, encoding='utf-8') as f:
+                pages.append((os.path.basename(path), f.read()))
+        return pages
+    rng = random.Random(seed)
+    return [('synthetic-%d' % i, gen_results_page(rng, page_count=rng.randint(1, 30), no_data=i % 5 == 4))
+            for i in range(count)]
+
+
+def load_responses(directory=None, count=200, rows=50, seed=0):
+    """
+    Params:
+        directory (str) of saved *.json ajax archive payloads, synthetic ones are generated when None
+
+    Returns:
+        (list) of (name, response text)
+    """
+    if directory:
+        responses = []
+        for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+            with open(path, encoding='utf-8') as f:
+                responses.append((os.path.basename(path), f.read()))
+        return responses
+    rng = random.Random(seed)
+    return [('synthetic-%d' % i, gen_archive_response(rng, rows=rows, outcomes=3 if i % 2 else 2)) for i in range(count)]
@@ -0,0 +1,180 @@
+"""
+standin.py
+
+Local stand-in for oddsportal.com serving generated results pages, pagination and
+ajax-sport-country-tournament-archive_ JSON at a configurable scale, plus a plain HTTP stand-in
+for the Chrome driver so the crawler and scraper can be driven without a browser
+
+"""
+
+
+from benchmarks.fixtures import gen_archive_response
+from benchmarks.fixtures import gen_results_page
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from pyquery import PyQuery as pyquery
+
+import multiprocessing
+import random
+import re
+import requests
+import time
+
+
+LEAGUE_PATH = '/basketball/usa/nba/results/'
+SEASON_PATH_PATTERN = re.compile(r'^/basketball/usa/nba-(\d+)-\d+/results/$')
+ARCHIVE_PATH_PATTERN = re.compile(r'^/ajax-sport-country-tournament-archive_/\d+/S(\d+)/X0/1/0/page/(\d+)/?$')
+LAST_YEAR = 2023
+
+
+class StandInSite(object):
+    """
+    Generated site of one league with a number of seasons of a number of pages each. Pages are generated
+    from a seed per season/page, so every run of a benchmark sees the same content.
+    """
+
+    def __init__(self, base_url, seasons=30, pages=50, rows=50, blocks=500, latency=0.0, seed=0):
+        """
+        Params:
+            base_url (str) the site is served at, links on its pages point there
+            seasons (int) number of seasons of the league
+            pages (int) results pages per season
+            rows (int) games per ajax archive page
+            blocks (int) of filler markup per results page
+            latency (float) seconds added to every response
+        """
+        self.base_url = base_url
+        self.seasons = seasons
+        self.pages = pages
+        self.rows = rows
+        self.blocks = blocks
+        self.latency = latency
+        self.seed = seed
+        self.season_links = [('%d/%d' % (year, year + 1), self.get_season_url(i))
+                             for i, year in enumerate(range(LAST_YEAR, LAST_YEAR - seasons, -1))]
+
+    def get_season_url(self, season_index):
+        # Like the real site, the live season lives at the league's own results URL
+        if season_index == 0:
+            return self.base_url + LEAGUE_PATH
+        year = LAST_YEAR - season_index
+        return self.base_url + '/basketball/usa/nba-%d-%d/results/' % (year, year + 1)
+
+    def get_league_url(self):
+        return self.base_url + LEAGUE_PATH
+
+    def get_season_index(self, path):
+        if path == LEAGUE_PATH:
+            return 0
+        match = SEASON_PATH_PATTERN.match(path)
+        if not match:
+            return None
+        season_index = LAST_YEAR - int(match.group(1))
+        return season_index if 0 < season_index < self.seasons else None
+
+    def render(self, path):
+        """
+        Returns:
+            (tuple) of status, content type and body for a request path
+        """
+        match = ARCHIVE_PATH_PATTERN.match(path)
+        if match:
+            season_index, page = int(match.group(1)), int(match.group(2))
+            if season_index >= self.seasons or not 0 < page <= self.pages:
+                return 404, 'text/plain', 'Not found'
+            rng = random.Random('%d-%d-%d' % (self.seed, season_index, page))
+            return 200, 'application/json', gen_archive_response(rng, rows=self.rows)
+        season_index = self.get_season_index(path)
+        if season_index is None:
+            return 404, 'text/plain', 'Not found'
+        rng = random.Random('%d-%d' % (self.seed, season_index))
+        return 200, 'text/html', gen_results_page(rng, page_count=self.pages, blocks=self.blocks, season_links=self.season_links,
+                                                  tournament_id='S%d' % season_index)
+
+
+def serve(site, host, port):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if site.latency:
+                time.sleep(site.latency)
+            status, content_type, body = site.render(self.path.split('?')[0])
+            body = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type + '; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+def start_server(port=8765, host='127.0.0.1', **site_options):
+    """
+    Serve a StandInSite from a separate process, so its CPU and memory don't count against the client.
+
+    Returns:
+        (tuple) of the server process, to terminate when done, and the StandInSite it serves
+    """
+    site = StandInSite('http://%s:%d' % (host, port), **site_options)
+    process = multiprocessing.Process(target=serve, args=(site, host, port), daemon=True)
+    process.start()
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            requests.get(site.get_league_url(), timeout=1)
+            break
+        except requests.ConnectionError:
+            if time.monotonic() > deadline:
+                process.terminate()
+                raise RuntimeError('Stand-in server did not start on port %d' % port)
+            time.sleep(0.05)
+    return process, site
+
+
+class HttpDriver(object):
+    """
+    Stand-in for the Chrome WebDriver loading pages with plain HTTP requests. It covers what Crawler,
+    Scraper and PageReadiness call on a driver, with pyquery for css selectors and the pageOut check.
+    """
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.page_source = ''
+        self.current_url = None
+        self.document = None
+
+    def get(self, url):
+        self.current_url = url
+        self.page_source = self.session.get(url.split('#')[0], timeout=30).text
+        self.document = None
+
+    def find_elements_by_css_selector(self, css_selector):
+        if self.document is None:
+            self.document = pyquery(self.page_source)
+        return list(self.document.find(css_selector))
+
+    def execute_script(self, script):
+        # Only the pageOut readiness script is ever run
+        return 'pageOut' in self.page_source
+
+    def implicitly_wait(self, seconds):
+        pass
+
+    def set_page_load_timeout(self, seconds):
+        pass
+
+    def set_script_timeout(self, seconds):
+        pass
+
+    def maximize_window(self):
+        pass
+
+    def quit(self):
+        self.session.close()
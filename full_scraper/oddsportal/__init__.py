@@ -1,4 +1,7 @@
+from .cache import Cache
+from .checkpoint import Checkpoint
 from .crawler import Crawler
+from .driverpool import DriverPool
 from .models import Collection
 from .models import DataRepository
 from .models import Game
@@ -0,0 +1,176 @@
+"""
+archive.py
+
+Append-only archive of every raw ajax payload and results page HTML fetched, compressed and indexed
+by URL and fetch time, so output can be rebuilt offline after a parser or schema change
+
+"""
+
+
+from .models import Season
+from .store import LazySqlite
+
+import gzip
+import logging
+import os
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class ArchiveEntry(object):
+    """
+    Index record of one archived response.
+    """
+    FIELDS = ('id', 'url', 'kind', 'fetched_at', 'sport', 'league', 'season', 'season_index', 'possible_outcomes',
+              'page', 'segment', 'offset', 'length')
+
+    def __init__(self, row):
+        for field, value in zip(self.FIELDS, row):
+            setattr(self, field, value)
+
+    def to_season(self):
+        """
+        Returns:
+            (Season) carrying the identity of the entry's season, without URLs or games
+        """
+        season = Season(self.season)
+        season.sport = self.sport
+        season.league = self.league
+        season.index = self.season_index
+        season.possible_outcomes = self.possible_outcomes
+        return season
+
+
+class ResponseArchive(LazySqlite):
+    """
+    Raw responses appended to segment files, each response its own gzip member, with a SQLite index of
+    where each one lives. Nothing is ever rewritten, a page fetched again is appended again, and
+    readers pick the latest fetch. Every process writes its own segments, rolled over at max_segment_bytes,
+    so workers sharing the archive never interleave.
+    """
+    SHARED = True
+    DEFAULT_PATH = 'archive'
+    DEFAULT_MAX_SEGMENT_BYTES = 256 * 1024 * 1024
+    AJAX = 'ajax'
+    HTML = 'html'
+
+    def __init__(self, path=DEFAULT_PATH, max_segment_bytes=DEFAULT_MAX_SEGMENT_BYTES):
+        """
+        Params:
+            path (str) directory holding the segments and index.sqlite3
+            max_segment_bytes (int) size after which a new segment file is started
+        """
+        LazySqlite.__init__(self, path)
+        self.max_segment_bytes = max_segment_bytes
+        self.segment_prefix = None
+        self.segment_count = 0
+        self.segment = None
+        self.segment_file = None
+
+    def get_fresh_state(self):
+        # Each worker appends to segments of its own
+        state = LazySqlite.get_fresh_state(self)
+        state.update({'segment_prefix': None, 'segment': None, 'segment_file': None})
+        return state
+
+    def get_db_path(self):
+        return os.path.join(self.path, 'index.sqlite3')
+
+    def on_connect(self, conn):
+        conn.execute('''CREATE TABLE IF NOT EXISTS responses
+                        (id integer PRIMARY KEY, url text, kind text, fetched_at real,
+                        sport text, league text, season text, season_index integer, possible_outcomes integer,
+                        page integer, segment text, offset integer, length integer)''')
+        conn.execute('CREATE INDEX IF NOT EXISTS responses_url ON responses (url, fetched_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS responses_page ON responses (sport, league, kind, season, page)')
+
+    def get_segment_path(self, segment):
+        return os.path.join(self.path, segment)
+
+    def open_segment(self):
+        """
+        Returns:
+            (file) the segment to append to, a new one once the current one is full
+        """
+        if self.segment_file is not None and self.segment_file.tell() < self.max_segment_bytes:
+            return self.segment_file
+        if self.segment_file is not None:
+            self.segment_file.close()
+        # Segments are never shared between processes, so an offset is always where this process wrote
+        if self.segment_prefix is None:
+            self.segment_prefix = 'responses-%d-%d' % (int(time.time()), os.getpid())
+            self.segment_count = 0
+        self.segment_count += 1
+        self.segment = '%s-%05d.gz' % (self.segment_prefix, self.segment_count)
+        self.segment_file = open(self.get_segment_path(self.segment), 'ab')
+        return self.segment_file
+
+    def store(self, url, kind, body, season=None, page=None, fetched_at=None):
+        """
+        Params:
+            url (str) the response was fetched for, the results page URL for ajax payloads
+            kind (str) AJAX or HTML
+            body (str) raw response text
+            season (Season) the response belongs to, if known
+            page (int) page number within the season, if known
+            fetched_at (float) epoch seconds, defaults to now
+        """
+        block = gzip.compress(body.encode('utf-8'), compresslevel=6)
+        identity = (season.sport, season.league, season.name, season.index, season.possible_outcomes) if season else (None,) * 5
+        with self.lock:
+            conn = self.connect()
+            segment_file = self.open_segment()
+            offset = segment_file.tell()
+            segment_file.write(block)
+            segment_file.flush()
+            conn.execute('''INSERT INTO responses (url, kind, fetched_at, sport, league, season, season_index,
+                            possible_outcomes, page, segment, offset, length) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                         (url, kind, fetched_at or time.time()) + identity + (page, self.segment, offset, len(block)))
+            conn.commit()
+
+    def read(self, entry):
+        """
+        Returns:
+            (str) the raw response of an ArchiveEntry
+        """
+        with open(self.get_segment_path(entry.segment), 'rb') as segment_file:
+            segment_file.seek(entry.offset)
+            return gzip.decompress(segment_file.read(entry.length)).decode('utf-8')
+
+    def get_latest(self, url):
+        """
+        Returns:
+            (ArchiveEntry) of the latest fetch of a URL, or None
+        """
+        with self.lock:
+            row = self.connect().execute('SELECT ' + ', '.join(ArchiveEntry.FIELDS) + ''' FROM responses
+                                            WHERE url=? ORDER BY fetched_at DESC LIMIT 1''', (url,)).fetchone()
+        return ArchiveEntry(row) if row else None
+
+    def get_season_entries(self, sport, league, kind=AJAX):
+        """
+        Returns:
+            (dict) season name -> list of ArchiveEntry of the latest fetch of each of its pages, in page order
+        """
+        with self.lock:
+            rows = self.connect().execute('SELECT ' + ', '.join(ArchiveEntry.FIELDS) + ''' FROM responses
+                                             WHERE sport=? AND league=? AND kind=? ORDER BY season_index, season, page, fetched_at''',
+                                          (sport, league, kind)).fetchall()
+        latest = dict()
+        for row in rows:
+            entry = ArchiveEntry(row)
+            # Later fetches of a page come last and replace earlier ones
+            latest[(entry.season, entry.page)] = entry
+        seasons = dict()
+        for entry in latest.values():
+            seasons.setdefault(entry.season, []).append(entry)
+        return seasons
+
+    def close(self):
+        with self.lock:
+            if self.segment_file is not None:
+                self.segment_file.close()
+                self.segment_file = None
+        LazySqlite.close(self)
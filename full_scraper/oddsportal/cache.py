@@ -1,28 +1,178 @@
-import pathlib
+"""
+cache.py
+
+Single-file SQLite cache of parsed games, keyed on (sport, league, season, page)
+
+"""
+
+
+from .metrics import METRICS
+from .store import LazySqlite
+
+import logging
 import pickle
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class Cache(LazySqlite):
+    """
+    Indexed cache of parsed games per results page.
+    Entries of the live season expire after live_ttl seconds, entries of closed seasons after closed_ttl
+    (never when None). Once the stored size goes over max_bytes, least recently used entries are evicted.
+    The stored size is kept as a running total and the access times of hits are held back and written along
+    with the next store, so a lookup costs a single indexed statement and never commits.
+    """
+    SHARED = True
+    DEFAULT_PATH = 'cache/oddsportal.sqlite3'
+    DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+    DEFAULT_LIVE_TTL = 60 * 60  # seconds
+    DEFAULT_CLOSED_TTL = None  # seconds, None to keep forever
+    ACCESS_FLUSH_SIZE = 256  # hits whose access time is held back before it is written
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=DEFAULT_MAX_BYTES, live_ttl=DEFAULT_LIVE_TTL,
+                 closed_ttl=DEFAULT_CLOSED_TTL):
+        LazySqlite.__init__(self, path)
+        self.max_bytes = max_bytes
+        self.live_ttl = live_ttl
+        self.closed_ttl = closed_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bytes stored, read once on connect, then kept up to date by this process
+        self.total_bytes = 0
+        # Key -> access time of hits not yet written
+        self.pending_accesses = dict()
+
+    def get_fresh_state(self):
+        state = LazySqlite.get_fresh_state(self)
+        state['pending_accesses'] = dict()
+        return state
+
+    def on_connect(self, conn):
+        conn.execute('''CREATE TABLE IF NOT EXISTS pages
+                        (sport text, league text, season text, page integer,
+                        games blob, size integer, is_live integer,
+                        created_at real, accessed_at real, expires_at real,
+                        PRIMARY KEY (sport, league, season, page))''')
+        conn.execute('CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at)')
+        self.total_bytes = conn.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+
+    def on_close(self, conn):
+        self.flush_accesses(conn)
+
+    @staticmethod
+    def gen_key(season, page):
+        """
+        Params:
+            season (Season) the page belongs to
+            page (int) page number within the season
+
+        Returns:
+            (tuple) of sport, league, season name and page number
+        """
+        return (season.sport, season.league, season.name, page)
+
+    def get(self, season, page):
+        """
+        Returns:
+            (list) of cached games, empty on a miss or an expired entry
+        """
+        with METRICS.timer('stage_seconds', stage='cache_get'):
+            games = self.lookup(season, page)
+        METRICS.inc('cache_lookups_total', result='hit' if games else 'miss')
+        return games
 
-from oddsportal import Season
+    def lookup(self, season, page):
+        key = self.gen_key(season, page)
+        now = time.time()
+        with self.lock:
+            conn = self.connect()
+            row = conn.execute('SELECT games, expires_at, size FROM pages WHERE sport=? AND league=? AND season=? AND page=?',
+                               key).fetchone()
+            if row is None:
+                self.misses += 1
+                return []
+            if row[1] is not None and row[1] < now:
+                conn.execute('DELETE FROM pages WHERE sport=? AND league=? AND season=? AND page=?', key)
+                conn.commit()
+                self.total_bytes -= row[2]
+                self.pending_accesses.pop(key, None)
+                self.misses += 1
+                return []
+            self.pending_accesses[key] = now
+            if len(self.pending_accesses) >= self.ACCESS_FLUSH_SIZE:
+                self.flush_accesses(conn)
+                conn.commit()
+            self.hits += 1
+        return pickle.loads(row[0])
 
+    def flush_accesses(self, conn):
+        """
+        Write the access times of the hits held back, in the caller's transaction.
+        """
+        if not self.pending_accesses:
+            return
+        conn.executemany('UPDATE pages SET accessed_at=? WHERE sport=? AND league=? AND season=? AND page=?',
+                         [(accessed_at,) + key for key, accessed_at in self.pending_accesses.items()])
+        self.pending_accesses.clear()
 
-class Cache(object):
+    def set(self, season, page, games):
+        with METRICS.timer('stage_seconds', stage='cache_set'):
+            self.store(season, page, games)
 
-    def __init__(self, season: Season):
-        self.base = pathlib.Path('/data/odds')
-        self.season = season
-        if not self.base.exists():
-            self.base.mkdir(parents=True, exist_ok=True)
+    def store(self, season, page, games):
+        key = self.gen_key(season, page)
+        blob = pickle.dumps(games, protocol=pickle.HIGHEST_PROTOCOL)
+        is_live = season.index == 0
+        ttl = self.live_ttl if is_live else self.closed_ttl
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        with self.lock:
+            conn = self.connect()
+            replaced = conn.execute('SELECT size FROM pages WHERE sport=? AND league=? AND season=? AND page=?',
+                                    key).fetchone()
+            conn.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         key + (blob, len(blob), int(is_live), now, now, expires_at))
+            self.total_bytes += len(blob) - (replaced[0] if replaced else 0)
+            # The entry was just written with a fresh access time, the hits held back go out with it
+            self.pending_accesses.pop(key, None)
+            self.flush_accesses(conn)
+            self.evict(conn)
+            conn.commit()
 
-    def gen_key(self, url):
-        key = url.replace('https://www.oddsportal.com/', '')
-        return f"{key.replace('/', '.')}-{len(self.season.urls)}"
+    def evict(self, conn):
+        """
+        Drop least recently used entries until the cache fits in max_bytes.
+        """
+        if not self.max_bytes or self.total_bytes <= self.max_bytes:
+            return
+        # Other processes may share the file, so the total is recounted before anything is dropped
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+        self.total_bytes = total
+        if total <= self.max_bytes:
+            return
+        # Least recently used by the access times of this process too
+        self.flush_accesses(conn)
+        rows = conn.execute('SELECT rowid, size FROM pages ORDER BY accessed_at').fetchall()
+        evicted = []
+        for rowid, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((rowid,))
+            total -= size
+        conn.executemany('DELETE FROM pages WHERE rowid=?', evicted)
+        self.total_bytes = total
+        self.evictions += len(evicted)
+        logger.info('Cache evicted %d entries to stay under %d bytes', len(evicted), self.max_bytes)
 
-    def get(self, url):
-        f = self.base.joinpath(self.gen_key(url))
-        if not f.exists():
-            return []
-        b = f.read_bytes()
-        return pickle.loads(b)
-    def set(self, url, obj):
-        f = self.base.joinpath(self.gen_key(url))
-        b = pickle.dumps(obj)
-        f.write_bytes(b)
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,136 @@
+"""
+catalog.py
+
+Persistent catalog of the seasons of every league and the pagination of every season, so planning a run
+doesn't rediscover what can't have changed
+
+"""
+
+
+from .models import Season
+from .store import LazySqlite
+
+import json
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class LeagueCatalog(LazySqlite):
+    """
+    SQLite record of the seasons discovered per league and the page URLs of each season. Unlike Checkpoint it
+    outlives runs. The season list of a league expires after league_ttl, as a new season shows up about once a
+    year. Pagination of the live season expires after live_ttl, as does pagination that could not be confirmed
+    (no page count found, maybe a page that failed to load). Confirmed pagination of a closed season never
+    expires, those seasons are never paginated again.
+    """
+    DEFAULT_PATH = 'catalog/oddsportal.sqlite3'
+    DEFAULT_LEAGUE_TTL = 24 * 60 * 60  # seconds
+    DEFAULT_LIVE_TTL = 60 * 60  # seconds
+
+    def __init__(self, path=DEFAULT_PATH, league_ttl=DEFAULT_LEAGUE_TTL, live_ttl=DEFAULT_LIVE_TTL, refresh=False):
+        """
+        Params:
+            refresh (bool) treat everything recorded as expired, so it is all discovered and recorded again
+        """
+        LazySqlite.__init__(self, path)
+        self.refresh = refresh
+        self.league_ttl = league_ttl
+        self.live_ttl = live_ttl
+
+    def on_connect(self, conn):
+        conn.execute('''CREATE TABLE IF NOT EXISTS leagues
+                        (sport text, league text, root_url text, discovered_at real,
+                        PRIMARY KEY (sport, league))''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS seasons
+                        (sport text, league text, season text, season_index integer, root_url text,
+                        urls text, paginated_at real, expires_at real,
+                        PRIMARY KEY (sport, league, season))''')
+
+    def save_seasons(self, sport, league, root_url, seasons):
+        """
+        Record the seasons discovered for a league. Pagination already known for a season is kept as long as
+        its root URL is the same, the live season's page count expires on its own.
+        """
+        if not seasons:
+            return
+        now = time.time()
+        with self.lock:
+            conn = self.connect()
+            conn.execute('INSERT OR REPLACE INTO leagues VALUES (?, ?, ?, ?)', (sport, league, root_url, now))
+            conn.execute('DELETE FROM seasons WHERE sport=? AND league=? AND season NOT IN (%s)' %
+                         ', '.join('?' * len(seasons)), (sport, league) + tuple(season.name for season in seasons))
+            for season in seasons:
+                conn.execute('''INSERT INTO seasons VALUES (?, ?, ?, ?, ?, NULL, NULL, NULL)
+                                ON CONFLICT (sport, league, season) DO UPDATE SET season_index=excluded.season_index,
+                                urls=CASE WHEN root_url=excluded.root_url THEN urls END,
+                                root_url=excluded.root_url''',
+                             (sport, league, season.name, season.index, season.urls[0]))
+            conn.commit()
+
+    def get_seasons(self, sport, league):
+        """
+        Returns:
+            (list) of Season of the league with only their root URLs, or None if the league was never
+            discovered or its season list expired
+        """
+        if self.refresh:
+            return None
+        with self.lock:
+            conn = self.connect()
+            row = conn.execute('SELECT discovered_at FROM leagues WHERE sport=? AND league=?', (sport, league)).fetchone()
+            if row is None or row[0] + self.league_ttl < time.time():
+                return None
+            rows = conn.execute('''SELECT season, season_index, root_url FROM seasons WHERE sport=? AND league=?
+                                   ORDER BY season_index''', (sport, league)).fetchall()
+        seasons = []
+        for name, index, root_url in rows:
+            season = Season(name)
+            season.index = index
+            season.sport = sport
+            season.league = league
+            season.urls = [root_url]
+            seasons.append(season)
+        return seasons
+
+    def save_season_urls(self, season, confirmed=True):
+        """
+        Record the page URLs of a paginated season.
+
+        Params:
+            confirmed (bool) False if the page count was not found, so the pagination is only kept a while
+        """
+        now = time.time()
+        expires_at = now + self.live_ttl if season.index == 0 or not confirmed else None
+        with self.lock:
+            conn = self.connect()
+            conn.execute('UPDATE seasons SET urls=?, paginated_at=?, expires_at=? WHERE sport=? AND league=? AND season=?',
+                         (json.dumps(season.urls), now, expires_at, season.sport, season.league, season.name))
+            conn.commit()
+
+    def get_season_urls(self, season):
+        """
+        Returns:
+            (list) of the season's page URLs, or None if it was never paginated or its pagination expired
+        """
+        if self.refresh:
+            return None
+        with self.lock:
+            row = self.connect().execute('SELECT urls, expires_at FROM seasons WHERE sport=? AND league=? AND season=?',
+                                         (season.sport, season.league, season.name)).fetchone()
+        if row is None or row[0] is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return json.loads(row[0])
+
+    def get_stats(self):
+        now = time.time()
+        with self.lock:
+            conn = self.connect()
+            leagues = conn.execute('SELECT COUNT(*) FROM leagues').fetchone()[0]
+            seasons, paginated, permanent = conn.execute('''SELECT COUNT(*),
+                                                            COALESCE(SUM(urls IS NOT NULL AND (expires_at IS NULL OR expires_at >= ?)), 0),
+                                                            COALESCE(SUM(urls IS NOT NULL AND expires_at IS NULL), 0) FROM seasons''',
+                                                         (now,)).fetchone()
+        return {'leagues': leagues, 'seasons': seasons, 'paginated': paginated, 'closed': permanent}
@@ -0,0 +1,146 @@
+"""
+checkpoint.py
+
+Durable per-page progress of a run, so a crashed multi-season run can resume where it stopped
+
+"""
+
+
+from .models import Season
+from .store import LazySqlite
+
+import json
+import logging
+import pickle
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class Checkpoint(LazySqlite):
+    """
+    SQLite record of the seasons discovered for each league, the pagination of each season and the
+    parsed games of every completed page. Unlike Cache nothing is ever evicted or expired, the
+    records only go away when a new run is started without resuming.
+    """
+    SHARED = True
+    DEFAULT_PATH = 'checkpoints/oddsportal.sqlite3'
+
+    def __init__(self, path=DEFAULT_PATH):
+        LazySqlite.__init__(self, path)
+
+    def on_connect(self, conn):
+        conn.execute('''CREATE TABLE IF NOT EXISTS seasons
+                        (sport text, league text, season text, season_index integer,
+                        possible_outcomes integer, urls text, paginated integer, completed integer,
+                        PRIMARY KEY (sport, league, season))''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS pages
+                        (sport text, league text, season text, page integer, url text,
+                        games blob, completed_at real,
+                        PRIMARY KEY (sport, league, season, page))''')
+
+    def reset(self):
+        """
+        Forget all progress, for a run that starts over instead of resuming.
+        """
+        with self.lock:
+            conn = self.connect()
+            conn.execute('DELETE FROM seasons')
+            conn.execute('DELETE FROM pages')
+            conn.commit()
+        logger.info('Checkpoint %s reset for a new run', self.path)
+
+    def save_seasons(self, sport, league, seasons):
+        """
+        Record the seasons discovered for a league, keeping any progress already made on them.
+        """
+        with self.lock:
+            conn = self.connect()
+            for season in seasons:
+                conn.execute('''INSERT OR IGNORE INTO seasons VALUES (?, ?, ?, ?, ?, ?, 0, 0)''',
+                             (sport, league, season.name, season.index, season.possible_outcomes,
+                              json.dumps(season.urls)))
+            conn.commit()
+
+    def get_seasons(self, sport, league):
+        """
+        Returns:
+            (list) of Season recorded for the league, in discovery order, with no games populated
+        """
+        with self.lock:
+            rows = self.connect().execute('''SELECT season, season_index, possible_outcomes, urls FROM seasons
+                                             WHERE sport=? AND league=? ORDER BY season_index''',
+                                          (sport, league)).fetchall()
+        seasons = []
+        for name, index, possible_outcomes, urls in rows:
+            season = Season(name)
+            season.index = index
+            season.possible_outcomes = possible_outcomes
+            season.sport = sport
+            season.league = league
+            season.urls = json.loads(urls)
+            seasons.append(season)
+        return seasons
+
+    def save_season_pagination(self, season):
+        with self.lock:
+            conn = self.connect()
+            conn.execute('UPDATE seasons SET urls=?, paginated=1 WHERE sport=? AND league=? AND season=?',
+                         (json.dumps(season.urls), season.sport, season.league, season.name))
+            conn.commit()
+
+    def is_season_paginated(self, season):
+        return self.get_season_flag(season, 'paginated')
+
+    def complete_season(self, season):
+        with self.lock:
+            conn = self.connect()
+            conn.execute('UPDATE seasons SET completed=1 WHERE sport=? AND league=? AND season=?',
+                         (season.sport, season.league, season.name))
+            conn.commit()
+        logger.info('Checkpoint season [%s] complete', season.name)
+
+    def is_season_complete(self, season):
+        return self.get_season_flag(season, 'completed')
+
+    def get_season_flag(self, season, flag):
+        with self.lock:
+            row = self.connect().execute('SELECT ' + flag + ' FROM seasons WHERE sport=? AND league=? AND season=?',
+                                         (season.sport, season.league, season.name)).fetchone()
+        return bool(row and row[0])
+
+    def save_page(self, season, page, url, games):
+        blob = pickle.dumps(games, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            conn = self.connect()
+            conn.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         (season.sport, season.league, season.name, page, url, blob, time.time()))
+            conn.commit()
+
+    def get_page(self, season, page):
+        """
+        Returns:
+            (list) of games of a completed page, or None if the page is not complete
+        """
+        with self.lock:
+            row = self.connect().execute('SELECT games FROM pages WHERE sport=? AND league=? AND season=? AND page=?',
+                                         (season.sport, season.league, season.name, page)).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(row[0])
+
+    def count_completed_pages(self, season):
+        with self.lock:
+            return self.connect().execute('SELECT COUNT(*) FROM pages WHERE sport=? AND league=? AND season=?',
+                                          (season.sport, season.league, season.name)).fetchone()[0]
+
+    def get_season_pages(self, season):
+        """
+        Returns:
+            (list) of (page, games) of every completed page of the season, in page order
+        """
+        with self.lock:
+            rows = self.connect().execute('''SELECT page, games FROM pages WHERE sport=? AND league=? AND season=?
+                                             ORDER BY page''', (season.sport, season.league, season.name)).fetchall()
+        return [(page, pickle.loads(games)) for page, games in rows]
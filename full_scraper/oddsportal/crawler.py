@@ -6,18 +6,30 @@ Logic for the overall Odds Portal scraping utility focused on crawling
 """
 
 
+from . import extract
+from .driverpool import launch_chrome_driver
+from .metrics import METRICS
 from .models import Season
+from .readiness import PageReadiness
+from .readiness import SEASON_LINKS_SELECTOR
+from .scraper import BASE_URL
 from pyquery import PyQuery as pyquery
-from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import TimeoutException
 from selenium.common.exceptions import WebDriverException
 
 import logging
+import requests
 import time
 
 
 logger = logging.getLogger(__name__)
 
+HTML_HEADERS = {
+    'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'accept-language': 'en-US,en;q=0.9',
+    'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
+}
+
 
 class Crawler(object):
     """
@@ -26,64 +38,89 @@ class Crawler(object):
     """
     WAIT_TIME = 3  # max waiting time for a page to load
     
-    def __init__(self, driver=None, wait_on_page_load=3):
+    def __init__(self, driver=None, wait_on_page_load=3, base_url=BASE_URL, archive=None, http_first=True,
+                 launch_browser=True):
         """
         Constructor
+
+        Params:
+            base_url (str) of the site, i.e. a local stand-in for benchmarks
+            archive (ResponseArchive) to append the HTML of every results page loaded to
+            http_first (bool) read season links and page counts from a plain HTTP request of the page first,
+                and only load it in the browser when they are not in the served HTML
+            launch_browser (bool) launch Chrome when no driver is given, without one the crawler is HTTP only
         """
+        self.base_url = base_url
+        self.archive = archive
+        self.wait_on_page_load = wait_on_page_load
+        if wait_on_page_load == None:
+            self.wait_on_page_load = 3
+        self.http_first = http_first
+        self.session = requests.Session()
+        # Browser page loads made, for the driver pool to count against the driver
+        self.page_loads = 0
         if driver:
             self.driver = driver
+        elif launch_browser:
+            self.driver = launch_chrome_driver()
         else:
-            self.base_url = 'https://www.oddsportal.com'
-            self.wait_on_page_load = wait_on_page_load
-            if wait_on_page_load == None:
-                self.wait_on_page_load = 3
-            self.options = webdriver.ChromeOptions()
-            self.options.add_argument('--headless')
-            self.options.add_argument('--no-sandbox')
-            self.options.add_argument('--disable-gpu')
-            self.driver = webdriver.Chrome('./chromedriver/chromedriver', chrome_options=self.options)
-            self.driver.maximize_window()
-            logger.info('Chrome browser opened in headless mode')
+            self.driver = None
+        self.readiness = PageReadiness(self.driver) if self.driver else None
         
         # exception when no driver created
     def get_driver(self):
         return self.driver
 
-    def go_to_link(self, link, wait=0, sleep_time=0, check_element='login'):
+    def go_to_link(self, link, wait=0, ready='login'):
         """
         returns True if no error
         False whe page not found
+
+        Params:
+            wait (int) max seconds to wait for the page to be ready, defaults to wait_on_page_load
+            ready (str) DOM signal to wait for, a key of readiness.CONDITIONS
         """
-        self.driver.implicitly_wait(wait if wait > 0 else self.wait_on_page_load)
+        timeout = wait if wait > 0 else self.wait_on_page_load
+        # Readiness is waited for explicitly, an implicit wait would stall every absent-element poll
+        self.driver.implicitly_wait(0)
         self.driver.set_page_load_timeout(15)
         self.driver.set_script_timeout(15)
+        started_at = time.monotonic()
+        self.page_loads += 1
         try:
             self.driver.get(link)
-        except:
+        except TimeoutException:
             logger.info('driver load url not finished and timeout')
             self.driver.execute_script("window.stop()")
-        time.sleep(sleep_time)
         logger.info('Crawler go to link: %s', link)
-        # Workaround for ajax page loading issue
-        try:
-            # If no Login button, page not found
-            # self.driver.find_element_by_css_selector('.button-dark')
-            # self.driver.find_element_by_css_selector('.loginModalBtn')
-            if check_element == 'login':
-                self.driver.find_element_by_css_selector('.loginModalBtn')
-            else:
-                self.driver.find_element_by_css_selector('.pagination-link')
-        except NoSuchElementException:
-            logger.warning('Problem with link, crawler could not find Login button - %s', link)
-            print('Page source:\n', self.driver.page_source)
+        if not self.readiness.wait_for(link, ready, timeout, started_at):
+            logger.warning('Problem with link, crawler could not find %s signal - %s', ready, link)
+            logger.debug('Page source:\n%s', self.driver.page_source)
             return False
         return True
 
     def get_html_source(self):
         return self.driver.page_source
-    
+
+    def fetch_html(self, url):
+        """
+        Returns:
+            (str) HTML of a page as served over plain HTTP, before any script runs, or None if the request failed
+        """
+        try:
+            with METRICS.timer('stage_seconds', stage='http_page'):
+                ret = self.session.get(url.split('#')[0], headers=HTML_HEADERS, timeout=15)
+        except requests.RequestException:
+            logger.warning('HTTP request of %s failed', url, exc_info=True)
+            return None
+        if ret.status_code != 200:
+            logger.warning('HTTP request of %s failed with %s', url, ret.status_code)
+            return None
+        return ret.text
+
     def close_browser(self):
-        time.sleep(2)
+        if not self.driver:
+            return
         try:
             self.driver.quit()
             logger.info('Browser closed')
@@ -100,21 +137,34 @@ class Crawler(object):
         """
         seasons = []
         logger.info('Getting all seasons for league via %s', main_league_results_url)
-        if not self.go_to_link(main_league_results_url, wait=15, sleep_time=5):
-            logger.warning('League results URL loaded might failed %s', main_league_results_url)
-            # Going to send back empty list so this is not processed further
-            # return seasons
-        html_source = self.get_html_source()
-        html_querying = pyquery(html_source)
-        # season_links = html_querying.find('div.main-menu2.main-menu-gray > ul.main-filter > li > span > strong > a')
-        season_links = html_querying.find('#app > div > div.w-full > div > main > div.relative.w-full.bg-white-main > div.flex.flex-col > div > div.flex.flex-wrap > a')
+        season_links = None
+        if self.http_first:
+            html_source = self.fetch_html(main_league_results_url)
+            if html_source is not None:
+                self.archive_html(main_league_results_url, html_source)
+                season_links = extract.extract_season_links(html_source)
+            if season_links:
+                logger.info('Read season links of %s over HTTP', main_league_results_url)
+        if not season_links:
+            if self.driver is None:
+                logger.warning('No season links in the HTML served for %s and no browser to load it', main_league_results_url)
+                return seasons
+            if not self.go_to_link(main_league_results_url, wait=15, ready='season_links'):
+                logger.warning('League results URL loaded might failed %s', main_league_results_url)
+                # Going to send back empty list so this is not processed further
+                # return seasons
+            html_source = self.get_html_source()
+            self.archive_html(main_league_results_url, html_source)
+            season_links = extract.extract_season_links(html_source)
+            if not season_links:
+                # Markup the fast path doesn't recognise, go through the full DOM
+                html_querying = pyquery(html_source)
+                season_links = [(a.text, a.attrib['href']) for a in html_querying.find(SEASON_LINKS_SELECTOR)]
         logger.info('Extracted links to %d seasons', len(season_links))
-        for i, season_link in enumerate(season_links):
-            this_season = Season(season_link.text)
+        for i, (season_name, season_url) in enumerate(season_links):
+            this_season = Season(season_name)
             # Start the Season's list of URLs with just the root one
-            # this_season_url = self.base_url + season_link.attrib['href']
-            this_season_url = season_link.attrib['href']
-            this_season.urls.append(this_season_url)
+            this_season.urls.append(season_url)
             this_season.index = i
             seasons.append(this_season)
         return seasons
@@ -123,22 +173,49 @@ class Crawler(object):
         """
         Params:
             (Season) object with just one entry in its urls field, to be modified
+
+        Returns:
+            (bool) True if the page count or "No data available" was found, False if the season was left
+            at its root URL without either, i.e. a single page season or a page that failed to load
         """
         first_url_in_season = season.urls[0]
-        self.go_to_link(first_url_in_season, wait=60, sleep_time=5, check_element='pagination')
+        if self.http_first:
+            html_source = self.fetch_html(first_url_in_season)
+            if html_source is not None:
+                self.archive_html(first_url_in_season, html_source, season, 1)
+                if self.read_pagination(season, html_source):
+                    logger.info('Read pagination of season [%s] over HTTP', season.name)
+                    return True
+            if self.driver is None:
+                logger.info('No pagination in the HTML served for %s and no browser to load it', first_url_in_season)
+                return False
+        self.go_to_link(first_url_in_season, wait=60, ready='pagination')
         html_source = self.get_html_source()
-        html_querying = pyquery(html_source)
+        self.archive_html(first_url_in_season, html_source, season, 1)
+        return self.read_pagination(season, html_source)
+
+    def read_pagination(self, season, html_source):
+        """
+        Returns:
+            (bool) True if the season's page count or "No data available" was found in the HTML
+        """
+        first_url_in_season = season.urls[0]
         # Check if the page says "No data available"
-        no_data_div = html_querying.find('div.message-info > ul > li > div.cms')
-        if no_data_div != None and no_data_div.text() == 'No data available':
+        if extract.is_no_data(html_source):
             # Yes, found "No data available"
+            METRICS.inc('page_failures_total', reason='no_data')
             logger.warning('Found "No data available", skipping %s', first_url_in_season)
-            return
+            return True
         # Just need to locate the final pagination tag
-        pagination_links = html_querying.find('a.pagination-link')
-        if pagination_links:
-            page_count = int(pagination_links[-2].attrib['data-number'])
-            season.urls = [f'{first_url_in_season}#/page/{i + 1}' for i in range(page_count)]
-            if page_count == 1:
-                logger.info('Check page source: \n %s', html_source)
+        page_count = extract.extract_page_count(html_source)
+        if not page_count:
+            return False
+        season.urls = [f'{first_url_in_season}#/page/{i + 1}' for i in range(page_count)]
+        if page_count == 1:
+            logger.info('Check page source: \n %s', html_source)
+        return True
+
+    def archive_html(self, url, html_source, season=None, page=None):
+        if self.archive is not None:
+            self.archive.store(url, self.archive.HTML, html_source, season=season, page=page)
 
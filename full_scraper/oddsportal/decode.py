@@ -0,0 +1,96 @@
+"""
+decode.py
+
+Batch decoding of ajax archive payloads straight into typed columns, one pass over the rows with
+no per game objects and no time formatting (that is left to output)
+
+"""
+
+
+from .models import GameColumns
+
+import json
+import math
+import sys
+
+
+# home-winner -> GameColumns.OUTCOMES code, anything else is a draw
+WINNER_CODES = {'win': 1, 'lost': 2}
+DRAW_CODE = 3
+
+
+def decode_response(response_text, url, base_url, possible_outcomes, retrieval_timestamp):
+    """
+    Params:
+        response_text (str) ajax archive JSON payload
+        url (str) results page the payload belongs to
+        base_url (str) prefixed to each game's relative URL
+        possible_outcomes (int) of the season's sport
+        retrieval_timestamp (int) epoch seconds when the page was retrieved
+
+    Returns:
+        (GameColumns) the games of the payload's d.rows
+    """
+    return decode_rows(json.loads(response_text)['d']['rows'], url, base_url, possible_outcomes, retrieval_timestamp)
+
+
+def decode_rows(rows, url, base_url, possible_outcomes, retrieval_timestamp):
+    """
+    Returns:
+        (GameColumns) the games of a payload's d.rows, see decode_response
+    """
+    columns = GameColumns()
+    count = len(rows)
+    if not count:
+        return columns
+    missing = GameColumns.MISSING
+    teams, team_ids = columns.teams, columns.team_ids
+    # Bound methods hoisted out of the loop
+    add_game_timestamp = columns.game_timestamp.append
+    add_score_home = columns.score_home.append
+    add_score_away = columns.score_away.append
+    add_odds_home = columns.odds_home.append
+    add_odds_away = columns.odds_away.append
+    add_odds_draw = columns.odds_draw.append
+    add_outcome = columns.outcome.append
+    add_team_home = columns.team_home.append
+    add_team_away = columns.team_away.append
+    add_game_url = columns.game_url.append
+    get_winner_code = WINNER_CODES.get
+    nan = math.nan
+
+    for row in rows:
+        add_game_timestamp(int(row['date-start-timestamp']))
+        for name, add_team in ((row['home-name'], add_team_home), (row['away-name'], add_team_away)):
+            team_id = team_ids.get(name)
+            if team_id is None:
+                team_id = team_ids[name] = len(teams)
+                # Interned, so every page and season of a league shares one copy of each name
+                teams.append(sys.intern(name))
+            add_team(team_id)
+        add_game_url(base_url + row['url'])
+        score = row['homeResult']
+        add_score_home(int(score) if score else missing)
+        score = row['awayResult']
+        add_score_away(int(score) if score else missing)
+        add_outcome(get_winner_code(row['home-winner'], DRAW_CODE))
+        odds = row['odds']
+        if odds:
+            value = odds[0]['avgOdds']
+            add_odds_home(float(value) if value is not None and value != '' else nan)
+            value = odds[1]['avgOdds']
+            add_odds_away(float(value) if value is not None and value != '' else nan)
+            value = odds[2]['avgOdds'] if len(odds) > 2 else None
+            add_odds_draw(float(value) if value is not None and value != '' else nan)
+        else:
+            add_odds_home(nan)
+            add_odds_away(nan)
+            add_odds_draw(nan)
+
+    # Constant across a page
+    columns.retrieval_timestamp.extend([retrieval_timestamp] * count)
+    columns.num_possible_outcomes.extend([int(possible_outcomes)] * count)
+    columns.urls.append(url)
+    columns.url_ids[url] = 0
+    columns.retrieval_url.extend([0] * count)
+    return columns
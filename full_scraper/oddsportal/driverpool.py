@@ -0,0 +1,191 @@
+"""
+driverpool.py
+
+Pool of warm headless Chrome instances, leased to one task at a time and recycled after a
+number of pages or a crash
+
+"""
+
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
+
+import logging
+import queue
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+def launch_chrome_driver():
+    """
+    Returns:
+        (WebDriver) a new headless Chrome instance
+    """
+    options = webdriver.ChromeOptions()
+    options.add_argument('--headless')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-gpu')
+    # Return from driver.get at DOMContentLoaded, readiness of what each step needs is waited for explicitly
+    capabilities = DesiredCapabilities.CHROME.copy()
+    capabilities['pageLoadStrategy'] = 'eager'
+    driver = webdriver.Chrome('./chromedriver/chromedriver', chrome_options=options, desired_capabilities=capabilities)
+    driver.maximize_window()
+    logger.info('Chrome browser opened in headless mode')
+    return driver
+
+
+def quit_driver(driver):
+    if driver is None:
+        return
+    try:
+        driver.quit()
+    except WebDriverException:
+        logger.warning('WebDriverException on closing browser - maybe closed?')
+
+
+class DriverLease(object):
+    """
+    A driver owned by one task until it is given back to the pool.
+    """
+
+    def __init__(self, driver, slot):
+        self.driver = driver
+        self.slot = slot
+        self.pages = 0
+
+    def record_pages(self, count=1):
+        """
+        Count page loads against this driver, so the pool knows when to recycle it.
+        """
+        self.pages += count
+
+
+class DriverPool(object):
+    """
+    Pre-launches size drivers and hands each one to a single task at a time.
+    A driver is replaced by a fresh one after max_pages page loads, or when a task fails while holding it.
+    """
+    DEFAULT_MAX_PAGES = 200
+
+    def __init__(self, size, max_pages=DEFAULT_MAX_PAGES, factory=launch_chrome_driver):
+        """
+        Params:
+            size (int) number of drivers kept warm
+            max_pages (int) page loads after which a driver is recycled, 0 to never recycle
+            factory (callable) returning a new driver
+        """
+        if size < 1:
+            raise ValueError('Driver pool needs at least one driver')
+        self.size = size
+        self.max_pages = max_pages
+        self.factory = factory
+        self.available = queue.Queue()
+        self.lock = threading.Lock()
+        self.started_at = None
+        self.leases = 0
+        self.recycles = 0
+        self.crashes = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.closed = False
+
+    def start(self, warm=True):
+        """
+        Launch every driver up front, in parallel, so the first tasks don't pay for browser start-up.
+
+        Params:
+            warm (bool) False to launch each driver only when its slot is first leased, for runs that may
+                not need a browser at all
+        """
+        self.started_at = time.monotonic()
+        if not warm:
+            for slot in range(self.size):
+                self.available.put(DriverLease(None, slot))
+            logger.info('Driver pool started with %d drivers to launch on demand', self.size)
+            return self
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            drivers = list(executor.map(lambda _: self.factory(), range(self.size)))
+        for slot, driver in enumerate(drivers):
+            self.available.put(DriverLease(driver, slot))
+        logger.info('Driver pool started with %d warm drivers', self.size)
+        return self
+
+    @contextmanager
+    def lease(self):
+        """
+        Borrow a driver for the duration of a with block, waiting for one to be free if needed.
+
+        Yields:
+            (DriverLease) owned exclusively by the caller until the block exits
+        """
+        if self.started_at is None:
+            raise RuntimeError('Driver pool must be started before leasing drivers')
+        waiting_since = time.monotonic()
+        lease = self.available.get()
+        if lease.driver is None:
+            try:
+                lease.driver = self.factory()
+            except Exception:
+                self.available.put(lease)
+                raise
+        leased_at = time.monotonic()
+        with self.lock:
+            self.leases += 1
+            self.wait_seconds += leased_at - waiting_since
+        crashed = False
+        try:
+            yield lease
+        except Exception:
+            crashed = True
+            raise
+        finally:
+            with self.lock:
+                self.busy_seconds += time.monotonic() - leased_at
+            self.give_back(lease, crashed)
+
+    def give_back(self, lease, crashed):
+        if self.closed:
+            quit_driver(lease.driver)
+            return
+        if crashed or (self.max_pages and lease.pages >= self.max_pages):
+            logger.info('Recycling driver %d after %d pages%s', lease.slot, lease.pages, ' and a crash' if crashed else '')
+            quit_driver(lease.driver)
+            with self.lock:
+                self.recycles += 1
+                if crashed:
+                    self.crashes += 1
+            lease = DriverLease(None, lease.slot)
+            try:
+                lease.driver = self.factory()
+            except Exception:
+                # Left empty, the next lease of this slot launches it again
+                logger.error('Could not relaunch driver %d', lease.slot, exc_info=True)
+        self.available.put(lease)
+
+    def get_stats(self):
+        elapsed = time.monotonic() - self.started_at if self.started_at is not None else 0.0
+        with self.lock:
+            return {
+                'size': self.size,
+                'leases': self.leases,
+                'recycles': self.recycles,
+                'crashes': self.crashes,
+                'avg_wait_seconds': self.wait_seconds / self.leases if self.leases else 0.0,
+                'utilization': self.busy_seconds / (elapsed * self.size) if elapsed else 0.0,
+            }
+
+    def close(self):
+        self.closed = True
+        while True:
+            try:
+                lease = self.available.get_nowait()
+            except queue.Empty:
+                break
+            quit_driver(lease.driver)
+        logger.info('Driver pool closed')
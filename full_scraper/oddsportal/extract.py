@@ -0,0 +1,155 @@
+"""
+extract.py
+
+Targeted extraction of the few things read from a results page (the "pageOut" tournament params,
+the pagination count, the season links and the "No data available" notice) with precompiled
+patterns over the raw page source, without building a DOM, and the league a results URL belongs to
+
+"""
+
+
+import html
+import json
+import re
+
+
+SCRIPT_PATTERN = re.compile(r'<script\b[^>]*>(.*?)</script\s*>', re.S | re.I)
+QUOTED_PATTERN = re.compile(r"'([^']*)'")
+NO_DATA_TEXT = 'No data available'
+NO_DATA_PATTERN = re.compile(NO_DATA_TEXT + r'\s*<')
+NO_DATA_TAG_PATTERN = re.compile(r'<div\b[^>]*>\s*$', re.I)
+A_TAG_PATTERN = re.compile(r'<a\b([^>]*)>(.*?)</a\s*>', re.S | re.I)
+ATTRIBUTE_PATTERN = re.compile(r'([\w:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+FLEX_WRAP_DIV_PATTERN = re.compile(r'<div\b[^>]*\bclass="(?=[^"]*\bflex-wrap\b)(?=(?:[^"]*\s)?flex(?:\s[^"]*)?")[^"]*"[^>]*>', re.I)
+DIV_TAG_PATTERN = re.compile(r'<(/?)div\b[^>]*>', re.I)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+# /<sport>/<area>/<league>[-<year>[-<year>]]/results/, the years only on the URLs of past seasons
+RESULTS_URL_PATTERN = re.compile(r'^(?:https?://[^/]+)?/[^/]+/([^/]+)/([^/#?]+?)(?:-\d{4}(?:-\d{4})?)?/results/?(?:[#?]|$)')
+
+
+def get_attributes(tag_attributes):
+    """
+    Returns:
+        (dict) attribute name -> unescaped value of the attributes part of a tag
+    """
+    return {name.lower(): html.unescape(double if double is not None else single)
+            for name, double, single in ATTRIBUTE_PATTERN.findall(tag_attributes)}
+
+
+def has_class(attributes, class_name):
+    return class_name in attributes.get('class', '').split()
+
+
+def extract_tournament_params(html_source):
+    """
+    Returns:
+        (dict) the "pageOut" params of a results page, with "sid" and "id", or None when not found
+    """
+    position = html_source.find('pageOut')
+    while position >= 0:
+        # Only a script holding pageOut counts, the params are its first single quoted string
+        script_start = html_source.rfind('<script', 0, position)
+        if script_start >= 0 and html_source.rfind('</script', script_start, position) < 0:
+            match = SCRIPT_PATTERN.match(html_source, script_start)
+            if match:
+                quoted = QUOTED_PATTERN.search(match.group(1))
+                return json.loads(quoted.group(1)) if quoted else None
+        position = html_source.find('pageOut', position + 1)
+    return None
+
+
+def get_enclosing_tag(html_source, position):
+    """
+    Returns:
+        (str) the tag the given position of the page source falls in, or None when it is in text
+    """
+    start = html_source.rfind('<', 0, position)
+    if start < 0 or html_source.rfind('>', start, position) >= 0:
+        return None
+    end = html_source.find('>', position)
+    return html_source[start:end + 1] if end >= 0 else None
+
+
+def is_no_data(html_source):
+    """
+    Returns:
+        (bool) True when the page says "No data available"
+    """
+    position = html_source.find(NO_DATA_TEXT)
+    while position >= 0:
+        # The notice is the whole text of a div.cms
+        tag_start = html_source.rfind('<', 0, position)
+        if tag_start >= 0 and NO_DATA_PATTERN.match(html_source, position):
+            tag = NO_DATA_TAG_PATTERN.match(html_source, tag_start, position)
+            if tag and has_class(get_attributes(tag.group(0)), 'cms'):
+                return True
+        position = html_source.find(NO_DATA_TEXT, position + 1)
+    return False
+
+
+def extract_page_count(html_source):
+    """
+    Returns:
+        (int) number of pages of a season's results, read from the last numbered pagination link
+        (the very last one is "next"), or None without pagination
+    """
+    pagination_links = []
+    position = html_source.find('pagination-link')
+    while position >= 0:
+        tag = get_enclosing_tag(html_source, position)
+        if tag and tag[:2].lower() == '<a' and tag[2:3].isspace():
+            attributes = get_attributes(tag)
+            if has_class(attributes, 'pagination-link'):
+                pagination_links.append(attributes)
+            position += len(tag)
+        position = html_source.find('pagination-link', position + 1)
+    if len(pagination_links) < 2 or 'data-number' not in pagination_links[-2]:
+        return None
+    return int(pagination_links[-2]['data-number'])
+
+
+def get_element_end(html_source, start):
+    """
+    Returns:
+        (int) position of the </div> closing the div whose opening tag ends at start
+    """
+    depth = 1
+    for match in DIV_TAG_PATTERN.finditer(html_source, start):
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            return match.start()
+    return len(html_source)
+
+
+def extract_season_links(html_source):
+    """
+    Returns:
+        (list) of (season name, href) of the season selector links of a league results page, in page order,
+        empty when the selector is not found
+    """
+    for div in FLEX_WRAP_DIV_PATTERN.finditer(html_source):
+        body = html_source[div.end():get_element_end(html_source, div.end())]
+        links = []
+        for match in A_TAG_PATTERN.finditer(body):
+            attributes = get_attributes(match.group(1))
+            if 'href' in attributes and '/results/' in attributes['href']:
+                name = html.unescape(TAG_PATTERN.sub('', match.group(2))).strip()
+                links.append((name, attributes['href']))
+        if links:
+            return links
+    return []
+
+
+def extract_league(results_url):
+    """
+    Params:
+        results_url (str) results URL of a league or one of its seasons, i.e. ".../soccer/england/premier-league-2015-2016/results/"
+
+    Returns:
+        (str) "area/league" of its slugs, i.e. "england/premier-league", the same for every season of a league and
+        for soccer_to_sql, or None when the URL is not a results URL
+    """
+    match = RESULTS_URL_PATTERN.match(results_url)
+    if match is None:
+        return None
+    return match.group(1) + '/' + match.group(2)
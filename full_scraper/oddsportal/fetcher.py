@@ -0,0 +1,278 @@
+"""
+fetcher.py
+
+Concurrent page fetching for the Odds Portal scraping utility, bounded by a per-host
+requests-per-second budget and a window of requests in flight that both adapt to how the site
+responds, with failed requests retried after a jittered exponential backoff
+
+"""
+
+
+from .metrics import METRICS
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import asyncio
+import logging
+import random
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Verdicts on a response, see classify_response
+OK = 'ok'
+RETRY = 'retry'  # failed, worth another attempt at the same pace
+THROTTLED = 'throttled'  # the site is pushing back, slow down then try again
+FAILED = 'failed'  # will fail whenever it is tried
+
+THROTTLE_STATUSES = (403, 429, 503)
+PERMANENT_STATUSES = (404, 410)
+
+
+def classify_response(result):
+    """
+    Params:
+        result (requests.Response) or the exception a request raised
+
+    Returns:
+        (str) OK, RETRY, THROTTLED or FAILED
+    """
+    if isinstance(result, Exception):
+        # Timeouts and dropped connections are the usual sign of an overloaded or rate limiting host
+        return THROTTLED
+    if result.status_code == 200:
+        return OK
+    if result.status_code in THROTTLE_STATUSES:
+        return THROTTLED
+    if result.status_code in PERMANENT_STATUSES:
+        return FAILED
+    return RETRY
+
+
+def get_backoff(attempt, base=1.0, cap=60.0):
+    """
+    Returns:
+        (float) seconds to wait before the next attempt, exponential in the attempts made so far with full jitter,
+        so pages that failed together don't all come back at once
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class AimdController(object):
+    """
+    Additive increase / multiplicative decrease of a request rate and a window of requests in flight, like
+    TCP congestion control. Every success adds about increase requests per second per second and one
+    request in flight per window of successes, every throttle signal cuts both by decrease. Throttle signals
+    from requests started before the last cut are ignored, they were sent at the pace already cut.
+    """
+
+    def __init__(self, rate, window, max_rate=None, max_window=None, min_rate=0.1, increase=1.0, decrease=0.5):
+        """
+        Params:
+            rate (float) requests per second to start at
+            window (int) requests in flight to start at
+            max_rate (float) ceiling of the rate, defaults to the starting rate
+            max_window (int) ceiling of the window, defaults to the starting window
+        """
+        self.rate = float(rate)
+        self.window = float(window)
+        self.max_rate = float(max(max_rate or rate, rate))
+        self.max_window = float(max(max_window or window, window))
+        self.min_rate = min(min_rate, self.rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.decreased_at = 0.0
+
+    def get_window(self):
+        return int(self.window)
+
+    def get_delay(self):
+        return 1.0 / self.rate
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+        self.window = min(self.max_window, self.window + 1.0 / self.window)
+
+    def on_throttle(self, started_at):
+        """
+        Params:
+            started_at (float) time.monotonic() when the throttled request was sent
+        """
+        if started_at < self.decreased_at:
+            return
+        self.decreased_at = time.monotonic()
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self.window = max(1.0, self.window * self.decrease)
+        logger.warning('Site is throttling, backing off to %.2f requests per second with %d in flight', self.rate,
+                       self.get_window())
+
+
+class TokenBucket(object):
+    """
+    Token bucket refilled at a fixed rate, allowing bursts of up to capacity requests.
+    Tokens are reserved without awaiting in between, so it is safe to share within one event loop.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        Params:
+            rate (float) tokens added per second
+            capacity (float) max tokens held, defaults to one second worth of tokens
+        """
+        if rate <= 0:
+            raise ValueError('Token bucket rate must be positive')
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def reserve(self):
+        """
+        Take one token, going into debt if none is available.
+
+        Returns:
+            (float) seconds to wait before the token may be used
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class AsyncFetcher(object):
+    """
+    Fetch many URLs concurrently with asyncio, running a blocking request callable in a thread pool.
+    The pace starts at rps and concurrency and is steered by an AimdController between them and their
+    max_ ceilings. A URL whose response is not OK goes back in line after a jittered exponential backoff,
+    up to max_attempts times.
+    """
+    DEFAULT_MAX_ATTEMPTS = 5
+
+    def __init__(self, request, rps=2, concurrency=4, max_rps=None, max_concurrency=None, classify=classify_response,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, backoff_base=1.0, backoff_cap=60.0):
+        """
+        Params:
+            request (callable) taking a URL and returning a response, e.g. Scraper.request
+            rps (float) requests per second allowed for each host to start with
+            concurrency (int) requests in flight at once to start with
+            max_rps (float) the rate may ramp up to, defaults to rps
+            max_concurrency (int) requests in flight the window may ramp up to, defaults to concurrency
+            classify (callable) taking a response or exception and returning OK, RETRY, THROTTLED or FAILED
+            max_attempts (int) per URL, including the first
+        """
+        if concurrency < 1:
+            raise ValueError('Fetcher concurrency must be at least 1')
+        self.request = request
+        self.rps = rps
+        self.concurrency = concurrency
+        self.classify = classify
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        # Kept across calls so consecutive batches carry on at the pace the site allowed
+        self.controller = AimdController(rps, concurrency, max_rate=max_rps, max_window=max_concurrency)
+        self.in_flight = 0
+        # Token bucket per host, kept across calls so consecutive batches share one budget
+        self.buckets = dict()
+
+    def get_bucket(self, url):
+        host = urlparse(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rps)
+        bucket = self.buckets[host]
+        bucket.rate = self.controller.rate
+        return bucket
+
+    async def acquire_slot(self, slots):
+        async with slots:
+            await slots.wait_for(lambda: self.in_flight < self.controller.get_window())
+            self.in_flight += 1
+
+    async def release_slot(self, slots):
+        async with slots:
+            self.in_flight -= 1
+            slots.notify_all()
+
+    async def fetch(self, url, slots, executor):
+        """
+        Returns:
+            (tuple) of the last response or exception for the URL and the number of attempts made
+        """
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.acquire_slot(slots)
+            try:
+                await self.get_bucket(url).acquire()
+                started_at = time.monotonic()
+                try:
+                    result = await loop.run_in_executor(executor, self.request, url)
+                except Exception as e:
+                    result = e
+            finally:
+                await self.release_slot(slots)
+            verdict = self.classify(result)
+            if verdict == OK:
+                self.controller.on_success()
+                return result, attempt
+            if verdict == THROTTLED:
+                self.controller.on_throttle(started_at)
+            if verdict == FAILED or attempt >= self.max_attempts:
+                return result, attempt
+            METRICS.inc('ajax_retries_total', verdict=verdict)
+            await asyncio.sleep(get_backoff(attempt, self.backoff_base, self.backoff_cap))
+
+    async def fetch_and_report(self, index, url, slots, executor, on_result, output_executor):
+        result, attempts = await self.fetch(url, slots, executor)
+        if on_result is None:
+            return result, attempts
+        # Handed over as soon as it is in, on a single output thread so writing never holds up the loop's fetches
+        try:
+            await asyncio.get_running_loop().run_in_executor(output_executor, on_result, index, result, attempts)
+        except Exception:
+            # Never let one page's output take down the batch, the other fetches carry on
+            METRICS.inc('page_failures_total', reason='output_error')
+            logger.error('Handling the response of %s failed', url, exc_info=True)
+
+    async def fetch_all_async(self, urls, on_result=None):
+        slots = asyncio.Condition()
+        with ThreadPoolExecutor(max_workers=int(self.controller.max_window)) as executor, \
+                ThreadPoolExecutor(max_workers=1) as output_executor:
+            return await asyncio.gather(*[self.fetch_and_report(index, url, slots, executor, on_result, output_executor)
+                                          for index, url in enumerate(urls)])
+
+    def fetch_all(self, urls, on_result=None):
+        """
+        Params:
+            urls (list) of str to fetch
+            on_result (callable) taking the index of a URL, its response or the exception raised and the attempts
+                made, called as each URL completes, one at a time on an output thread of its own. An exception it
+                raises is logged and does not stop the other URLs
+
+        Returns:
+            (list) of (response or the exception raised, attempts made) in the same order as urls, or of None
+            when they were handed to on_result
+        """
+        if not urls:
+            return []
+        started_at = time.monotonic()
+        loop = asyncio.new_event_loop()
+        try:
+            responses = loop.run_until_complete(self.fetch_all_async(urls, on_result))
+        finally:
+            loop.close()
+        elapsed = time.monotonic() - started_at
+        logger.info('Fetched %d urls in %.1f seconds (%.2f/s, now at rps=%.2f, concurrency=%d)',
+                    len(urls), elapsed, len(urls) / elapsed if elapsed else 0, self.controller.rate,
+                    self.controller.get_window())
+        return responses
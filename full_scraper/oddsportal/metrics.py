@@ -0,0 +1,273 @@
+"""
+metrics.py
+
+Counters and latency histograms of every stage of the pipeline (browser page load, ajax fetch, parse,
+cache and output), exposed in Prometheus text format as a file and/or over HTTP, plus an end of run summary
+
+"""
+
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import bisect
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'oddsportal_'
+
+
+class Histogram(object):
+    """
+    Bucketed histogram of durations in seconds.
+    """
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 15, 30, 60)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, fraction):
+        """
+        Returns:
+            (float) estimate of the given fraction's sample, interpolated within its bucket like Prometheus'
+            histogram_quantile and kept between the smallest and largest sample
+        """
+        if not self.count:
+            return 0.0
+        threshold = fraction * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= threshold:
+                lower = max(self.buckets[i - 1] if i > 0 else 0.0, self.min)
+                upper = min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+                return lower + (upper - lower) * (threshold - seen) / bucket_count
+            seen += bucket_count
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'min': self.min or 0.0,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'max': self.max or 0.0,
+        }
+
+
+def format_labels(labels, **extra):
+    pairs = list(labels) + sorted(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in pairs) + '}'
+
+
+class Metrics(object):
+    """
+    Thread safe registry of labelled counters and histograms.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        # name -> {sorted label pairs -> value}
+        self.counters = dict()
+        self.histograms = dict()
+
+    @staticmethod
+    def get_key(labels):
+        return tuple(sorted(labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self.get_key(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, dict())
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = self.get_key(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, dict())
+            if key not in series:
+                series[key] = Histogram()
+            series[key].record(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Observe how long a with block takes, failed or not.
+        """
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started_at, **labels)
+
+    def get_counter(self, name, **labels):
+        """
+        Returns:
+            (float) the counter's value summed over every series matching the given labels
+        """
+        wanted = set(labels.items())
+        with self.lock:
+            return sum(value for key, value in self.counters.get(name, dict()).items() if wanted <= set(key))
+
+    def get_counter_series(self, name, label):
+        """
+        Returns:
+            (dict) label value -> counter value summed over the other labels
+        """
+        by_value = dict()
+        with self.lock:
+            for key, value in self.counters.get(name, dict()).items():
+                label_value = dict(key).get(label)
+                by_value[label_value] = by_value.get(label_value, 0) + value
+        return by_value
+
+    def to_prometheus(self):
+        """
+        Returns:
+            (str) every metric in Prometheus text exposition format
+        """
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append('# TYPE %s%s counter' % (PREFIX, name))
+                for key, value in sorted(series.items()):
+                    lines.append('%s%s%s %s' % (PREFIX, name, format_labels(key), value))
+            for name, series in sorted(self.histograms.items()):
+                lines.append('# TYPE %s%s histogram' % (PREFIX, name))
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bucket, bucket_count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        cumulative += bucket_count
+                        lines.append('%s%s_bucket%s %d' % (PREFIX, name, format_labels(key, le=bucket), cumulative))
+                    lines.append('%s%s_sum%s %s' % (PREFIX, name, format_labels(key), histogram.total))
+                    lines.append('%s%s_count%s %d' % (PREFIX, name, format_labels(key), histogram.count))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """
+        Write the metrics to a file, replaced atomically so a collector never reads half of it.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(path + '.tmp', path)
+
+    def get_summary(self):
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        pages = self.get_counter('pages_total')
+        failures = self.get_counter_series('page_failures_total', 'reason')
+        attempts = pages + sum(failures.values())
+        hits = self.get_counter('cache_lookups_total', result='hit')
+        lookups = self.get_counter('cache_lookups_total')
+        with self.lock:
+            stages = {dict(key).get('stage'): histogram.summary()
+                      for key, histogram in self.histograms.get('stage_seconds', dict()).items()}
+        return {
+            'elapsed_seconds': elapsed,
+            'pages': pages,
+            'games': self.get_counter('games_total'),
+            'pages_per_second': pages / elapsed,
+            'games_per_second': self.get_counter('games_total') / elapsed,
+            'failure_rates': {reason: count / attempts for reason, count in failures.items()} if attempts else {},
+            'cache_hit_ratio': hits / lookups if lookups else 0.0,
+            'stages': stages,
+        }
+
+    def log_summary(self):
+        summary = self.get_summary()
+        logger.info('Run metrics: %d pages, %d games in %.1f seconds - %.2f pages/s, %.1f games/s, cache hit ratio %.2f',
+                    summary['pages'], summary['games'], summary['elapsed_seconds'], summary['pages_per_second'],
+                    summary['games_per_second'], summary['cache_hit_ratio'])
+        for reason, rate in sorted(summary['failure_rates'].items()):
+            logger.info('Page failure rate [%s]: %.3f', reason, rate)
+        for stage, stage_summary in sorted(summary['stages'].items()):
+            logger.info('Stage [%s]: %s', stage, stage_summary)
+
+
+METRICS = Metrics()
+
+
+class MetricsExporter(object):
+    """
+    Exposes a Metrics registry while the run goes: rewritten to a Prometheus text file every interval
+    seconds (i.e. for the node exporter textfile collector) and/or served at http://<host>:<port>/metrics.
+    """
+    DEFAULT_INTERVAL = 15  # seconds
+
+    def __init__(self, metrics=METRICS, path=None, port=None, host='127.0.0.1', interval=DEFAULT_INTERVAL):
+        self.metrics = metrics
+        self.path = path
+        self.port = port
+        self.host = host
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.writer = None
+        self.server = None
+
+    def start(self):
+        if self.path:
+            self.writer = threading.Thread(target=self.write_periodically, name='metrics-writer', daemon=True)
+            self.writer.start()
+            logger.info('Writing metrics to %s every %s seconds', self.path, self.interval)
+        if self.port:
+            metrics = self.metrics
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split('?')[0] not in ('/', '/metrics'):
+                        self.send_error(404)
+                        return
+                    body = metrics.to_prometheus().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    logger.debug('Metrics endpoint: ' + format, *args)
+
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+            threading.Thread(target=self.server.serve_forever, name='metrics-server', daemon=True).start()
+            logger.info('Serving metrics at http://%s:%d/metrics', self.host, self.port)
+        return self
+
+    def write_periodically(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.metrics.write_prometheus(self.path)
+            except OSError:
+                logger.warning('Could not write metrics to %s', self.path, exc_info=True)
+
+    def stop(self):
+        self.stopped.set()
+        if self.writer:
+            self.writer.join()
+            self.metrics.write_prometheus(self.path)
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
@@ -6,25 +6,192 @@ Odds Portal data model for storing stuff that's scraped
 """
 
 
+from .metrics import METRICS
+
+import array
 import json
+import math
 import os
+import shutil
+import sys
+import time
+
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def format_timestamp(timestamp):
+    if timestamp is None:
+        return str()
+    return time.strftime(DATETIME_FORMAT, time.localtime(timestamp))
+
+
+def parse_datetime(datetime_str):
+    if not datetime_str:
+        return None
+    return int(time.mktime(time.strptime(datetime_str, DATETIME_FORMAT)))
 
 
 class Game(object):
+    """
+    A scraped game, slotted with typed fields: epoch int times, float odds, int scores and team names interned as
+    they are decoded or unpickled.
+    Times are only formatted when read through game_datetime / retrieval_datetime, e.g. on output.
+    """
+    __slots__ = ('retrieval_url', 'retrieval_timestamp', 'game_timestamp', 'game_url', 'num_possible_outcomes',
+                 'team_home', 'team_away', 'odds_home', 'odds_away', 'odds_draw', 'outcome', 'score_home', 'score_away')
+    # Output field order, as the JSON output has always had it
+    FIELDS = ('retrieval_url', 'retrieval_datetime', 'game_datetime', 'game_url', 'num_possible_outcomes',
+              'team_home', 'team_away', 'odds_home', 'odds_away', 'odds_draw', 'outcome', 'score_home', 'score_away')
+
     def __init__(self):
         self.retrieval_url = str()
-        self.retrieval_datetime = str()
-        self.game_datetime = str()
+        self.retrieval_timestamp = None
+        self.game_timestamp = None
         self.game_url = str()
-        self.num_possible_outcomes = str()
+        self.num_possible_outcomes = None
         self.team_home = str()
         self.team_away = str()
-        self.odds_home = str()
-        self.odds_away = str()
-        self.odds_draw = str()
+        self.odds_home = None
+        self.odds_away = None
+        self.odds_draw = None
         self.outcome = str()
-        self.score_home = str()
-        self.score_away = str()
+        self.score_home = None
+        self.score_away = None
+
+    @property
+    def game_datetime(self):
+        return format_timestamp(self.game_timestamp)
+
+    @game_datetime.setter
+    def game_datetime(self, datetime_str):
+        self.game_timestamp = parse_datetime(datetime_str)
+
+    @property
+    def retrieval_datetime(self):
+        return format_timestamp(self.retrieval_timestamp)
+
+    @retrieval_datetime.setter
+    def retrieval_datetime(self, datetime_str):
+        self.retrieval_timestamp = parse_datetime(datetime_str)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        # Games pickled before slots carry their __dict__, with times as formatted strings
+        if isinstance(state, tuple):
+            state = state[1]
+        self.__init__()
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.team_home = sys.intern(self.team_home)
+        self.team_away = sys.intern(self.team_away)
+
+
+class GameColumns(object):
+    """
+    Struct-of-arrays container of games for a Season, holding numbers in typed arrays and team names and
+    retrieval URLs once each in lookup tables. Behaves like the list of games it replaces: append, len,
+    iteration and indexing, the latter two materializing Game objects on the fly.
+    """
+    OUTCOMES = ('', 'HOME', 'AWAY', 'DRAW')
+    MISSING = -1  # int columns, None on the way out
+    NUMERIC_COLUMNS = (('game_timestamp', 'q'), ('retrieval_timestamp', 'q'), ('num_possible_outcomes', 'b'),
+                       ('score_home', 'i'), ('score_away', 'i'))
+    FLOAT_COLUMNS = ('odds_home', 'odds_away', 'odds_draw')
+
+    def __init__(self):
+        for name, typecode in self.NUMERIC_COLUMNS:
+            setattr(self, name, array.array(typecode))
+        for name in self.FLOAT_COLUMNS:
+            setattr(self, name, array.array('d'))
+        self.outcome = array.array('b')
+        self.team_home = array.array('i')
+        self.team_away = array.array('i')
+        self.retrieval_url = array.array('i')
+        self.game_url = list()
+        self.teams = list()
+        self.team_ids = dict()
+        self.urls = list()
+        self.url_ids = dict()
+
+    @staticmethod
+    def lookup_id(value, values, ids):
+        if value not in ids:
+            ids[value] = len(values)
+            values.append(value)
+        return ids[value]
+
+    def append(self, game):
+        for name, _ in self.NUMERIC_COLUMNS:
+            value = getattr(game, name)
+            getattr(self, name).append(self.MISSING if value is None or value == '' else int(value))
+        for name in self.FLOAT_COLUMNS:
+            value = getattr(game, name)
+            getattr(self, name).append(math.nan if value is None or value == '' else float(value))
+        self.outcome.append(self.OUTCOMES.index(game.outcome) if game.outcome in self.OUTCOMES else 0)
+        self.team_home.append(self.lookup_id(game.team_home, self.teams, self.team_ids))
+        self.team_away.append(self.lookup_id(game.team_away, self.teams, self.team_ids))
+        self.retrieval_url.append(self.lookup_id(game.retrieval_url, self.urls, self.url_ids))
+        self.game_url.append(game.game_url)
+
+    def extend(self, games):
+        if not isinstance(games, GameColumns):
+            for game in games:
+                self.append(game)
+            return
+        # Column by column, only team and URL ids need remapping to this container's tables
+        for name, _ in self.NUMERIC_COLUMNS:
+            getattr(self, name).extend(getattr(games, name))
+        for name in self.FLOAT_COLUMNS:
+            getattr(self, name).extend(getattr(games, name))
+        self.outcome.extend(games.outcome)
+        self.game_url.extend(games.game_url)
+        team_ids = [self.lookup_id(team, self.teams, self.team_ids) for team in games.teams]
+        self.team_home.extend(team_ids[i] for i in games.team_home)
+        self.team_away.extend(team_ids[i] for i in games.team_away)
+        url_ids = [self.lookup_id(url, self.urls, self.url_ids) for url in games.urls]
+        self.retrieval_url.extend(url_ids[i] for i in games.retrieval_url)
+
+    def __len__(self):
+        return len(self.game_url)
+
+    def __getitem__(self, i):
+        game = Game()
+        for name, _ in self.NUMERIC_COLUMNS:
+            value = getattr(self, name)[i]
+            setattr(game, name, None if value == self.MISSING else value)
+        for name in self.FLOAT_COLUMNS:
+            value = getattr(self, name)[i]
+            setattr(game, name, None if math.isnan(value) else value)
+        game.outcome = self.OUTCOMES[self.outcome[i]]
+        game.team_home = self.teams[self.team_home[i]]
+        game.team_away = self.teams[self.team_away[i]]
+        game.retrieval_url = self.urls[self.retrieval_url[i]]
+        game.game_url = self.game_url[i]
+        return game
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Rebuilt from the tables on unpickling
+        del state['team_ids']
+        del state['url_ids']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Pickling drops interning, checkpointed and cached pages share their names again once loaded
+        self.teams = [sys.intern(team) for team in self.teams]
+        self.team_ids = {team: i for i, team in enumerate(self.teams)}
+        self.url_ids = {url: i for i, url in enumerate(self.urls)}
 
 
 class Season(object):
@@ -34,10 +201,25 @@ class Season(object):
         self.urls = list()
         self.possible_outcomes = int()
         self.index = int()
+        # Identity of the league this season belongs to, e.g. "basketball" and "usa/nba"
+        self.sport = str()
+        self.league = str()
 
     def add_game(self, game):
         self.games.append(game)
 
+    def add_games(self, games):
+        self.games.extend(games)
+
+    def make_compact(self):
+        """
+        Hold this season's games in a struct-of-arrays GameColumns instead of a list of Game objects.
+        """
+        if not isinstance(self.games, GameColumns):
+            games = self.games
+            self.games = GameColumns()
+            self.games.extend(games)
+
     def add_url(self,url):
         self.urls.append(url)
 
@@ -57,6 +239,10 @@ class League(object):
 
 class BasicJsonEncoder(json.JSONEncoder):
         def default(self, o):
+            if isinstance(o, GameColumns):
+                return [game.to_dict() for game in o]
+            if isinstance(o, Game):
+                return o.to_dict()
             return o.__dict__ 
 
 
@@ -80,6 +266,10 @@ class DataRepository(object):
     def __init__(self):
         self.collections = dict()
         self.output_dir = str()
+        self.output_format = 'json'
+        self.compression = None
+        self.game_sinks = dict()
+        self.sqlite_writer = None
 
     def start_new_data_collection(self,target_sport_obj):
         if target_sport_obj['collection_name'] not in self.collections:
@@ -101,17 +291,68 @@ class DataRepository(object):
     def set_output_directory(self,path):
         self.output_dir = path
 
+    def set_output_format(self,output_format,compression=None):
+        """
+        Params:
+            output_format (str) 'json' for one file per collection at the end, 'ndjson' to stream games as they are parsed,
+                'parquet' for a columnar dataset partitioned by sport/league/season, 'sqlite' to stream games into a
+                normalized database shared by every collection
+            compression (str) None, 'gzip' or 'zstd' for ndjson output
+        """
+        self.output_format = output_format
+        self.compression = compression
+
+    def prepare_output_directory(self,collection):
+        qualified_output_dir = os.path.normpath(self.output_dir + os.sep + collection.output_dir)
+        if os.path.isdir(qualified_output_dir):
+            filelist = [ f for f in os.listdir(qualified_output_dir) ]
+            for f in filelist:
+                if os.path.isdir(os.path.join(qualified_output_dir, f)):
+                    # Partitioned datasets (parquet output) are directories
+                    shutil.rmtree(os.path.join(qualified_output_dir, f))
+                else:
+                    os.remove(os.path.join(qualified_output_dir, f))
+        else:
+            os.makedirs(qualified_output_dir)
+        return qualified_output_dir
+
+    def open_game_sink(self,collection_name):
+        """
+        Returns:
+            (NdjsonWriter, ParquetWriter or SqliteWriter) streaming the games of this collection, or None when output is
+            written at the end
+        """
+        if self.output_format == 'json':
+            return None
+        if self.output_format == 'sqlite':
+            # One database for every collection and for soccer_to_sql, kept across runs
+            from .writers import SqliteWriter
+            if self.sqlite_writer is None:
+                self.sqlite_writer = SqliteWriter(SqliteWriter.DEFAULT_PATH)
+            self.game_sinks[collection_name] = self.sqlite_writer
+            return self.sqlite_writer
+        from .writers import FILE_EXTENSIONS
+        from .writers import NdjsonWriter
+        from .writers import ParquetWriter
+        collection = self.collections[collection_name]
+        qualified_output_dir = self.prepare_output_directory(collection)
+        if self.output_format == 'parquet':
+            self.game_sinks[collection_name] = ParquetWriter(os.path.join(qualified_output_dir, collection.name))
+        else:
+            path = os.path.join(qualified_output_dir, collection.name + FILE_EXTENSIONS[self.compression])
+            self.game_sinks[collection_name] = NdjsonWriter(path, compression=self.compression)
+        return self.game_sinks[collection_name]
+
+    def close_game_sinks(self):
+        for _, game_sink in self.game_sinks.items():
+            game_sink.close()
+
     def save_all_collections_to_json(self):
         for _, collection in self.collections.items():
-            qualified_output_dir = os.path.normpath(self.output_dir + os.sep + collection.output_dir)
-            if os.path.isdir(qualified_output_dir):
-                filelist = [ f for f in os.listdir(qualified_output_dir) ]
-                for f in filelist:
-                    os.remove(os.path.join(qualified_output_dir, f))
-            else:
-                os.makedirs(qualified_output_dir)
-            with open(os.path.join(qualified_output_dir, collection.name + '.json'), 'w') as outfile:
-                json.dump(collection, outfile, cls=BasicJsonEncoder)
+            qualified_output_dir = self.prepare_output_directory(collection)
+            with METRICS.timer('stage_seconds', stage='output_write'):
+                with open(os.path.join(qualified_output_dir, collection.name + '.json'), 'w') as outfile:
+                    json.dump(collection, outfile, cls=BasicJsonEncoder)
 
     def __getitem__(self,key):
         return self.collections[key]
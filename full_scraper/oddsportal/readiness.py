@@ -0,0 +1,151 @@
+"""
+readiness.py
+
+Explicit page readiness for the browser, waiting on the DOM signal each step needs instead of
+fixed sleeps, and recording load times per URL
+
+"""
+
+
+from .metrics import Histogram
+from .metrics import METRICS
+from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import StaleElementReferenceException
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+SEASON_LINKS_SELECTOR = '#app > div > div.w-full > div > main > div.relative.w-full.bg-white-main > div.flex.flex-col > div > div.flex.flex-wrap > a'
+NO_DATA_SELECTOR = 'div.message-info > ul > li > div.cms'
+PAGE_OUT_SCRIPT = "return Array.prototype.some.call(document.scripts, function (s) { return s.text.indexOf('pageOut') >= 0; });"
+
+MIN_POLL_SECONDS = 0.05
+MAX_POLL_SECONDS = 0.5
+
+
+def element_present(css_selector):
+    def condition(driver):
+        return len(driver.find_elements_by_css_selector(css_selector)) > 0
+    return condition
+
+
+def script_returns_true(script):
+    def condition(driver):
+        return bool(driver.execute_script(script))
+    return condition
+
+
+def any_of(*conditions):
+    def condition(driver):
+        return any(c(driver) for c in conditions)
+    return condition
+
+
+# DOM signal each crawling/scraping step waits on
+CONDITIONS = {
+    'login': element_present('.loginModalBtn'),
+    'season_links': any_of(element_present(SEASON_LINKS_SELECTOR), element_present(NO_DATA_SELECTOR)),
+    'pagination': any_of(element_present('.pagination-link'), element_present(NO_DATA_SELECTOR)),
+    'page_out': any_of(script_returns_true(PAGE_OUT_SCRIPT), element_present(NO_DATA_SELECTOR)),
+}
+
+
+class LoadTimes(object):
+    """
+    Thread safe registry of load time histograms per URL, plus the shortest latency seen per condition.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_url = dict()
+        self.by_condition = dict()
+        self.fastest = dict()
+        self.timeouts = dict()
+
+    @staticmethod
+    def get_url_key(url):
+        # Pages of a season share one histogram
+        return url.split('#')[0]
+
+    def record(self, url, condition_name, seconds):
+        with self.lock:
+            for registry, key in ((self.by_url, self.get_url_key(url)), (self.by_condition, condition_name)):
+                if key not in registry:
+                    registry[key] = Histogram()
+                registry[key].record(seconds)
+            if condition_name not in self.fastest or seconds < self.fastest[condition_name]:
+                self.fastest[condition_name] = seconds
+
+    def record_timeout(self, url, condition_name):
+        with self.lock:
+            self.timeouts[condition_name] = self.timeouts.get(condition_name, 0) + 1
+
+    def get_poll_frequency(self, condition_name):
+        """
+        Poll at a fraction of the shortest latency seen so far for this condition, so a page is picked up
+        very shortly after it is ready without hammering the driver.
+        """
+        with self.lock:
+            fastest = self.fastest.get(condition_name)
+        if fastest is None:
+            return MIN_POLL_SECONDS
+        return min(MAX_POLL_SECONDS, max(MIN_POLL_SECONDS, fastest / 10))
+
+    def log_summary(self):
+        with self.lock:
+            by_condition = {key: histogram.summary() for key, histogram in self.by_condition.items()}
+            by_url = sorted(self.by_url.items(), key=lambda item: -item[1].total)
+            timeouts = dict(self.timeouts)
+        for key, summary in by_condition.items():
+            logger.info('Page readiness [%s]: %s, timeouts %d', key, summary, timeouts.get(key, 0))
+        for key, histogram in by_url[:10]:
+            logger.info('Page load time [%s]: %s', key, histogram.summary())
+
+
+LOAD_TIMES = LoadTimes()
+
+
+class PageReadiness(object):
+    """
+    Waits until a named DOM signal is present on the driver's current page.
+    """
+
+    def __init__(self, driver, load_times=LOAD_TIMES):
+        self.driver = driver
+        self.load_times = load_times
+
+    def wait_for(self, url, condition_name, timeout, started_at=None):
+        """
+        Params:
+            url (str) page being loaded, for the load time histograms
+            condition_name (str) key of CONDITIONS to wait for
+            timeout (float) max seconds to wait
+            started_at (float) time.monotonic() when navigation started, defaults to now
+
+        Returns:
+            (bool) True once the condition holds, False on timeout
+        """
+        if started_at is None:
+            started_at = time.monotonic()
+        condition = CONDITIONS[condition_name]
+        poll_frequency = self.load_times.get_poll_frequency(condition_name)
+        try:
+            # Only the races of a page still rendering, a dead browser raises at once for the driver pool to recycle
+            WebDriverWait(self.driver, timeout, poll_frequency=poll_frequency,
+                          ignored_exceptions=(NoSuchElementException, StaleElementReferenceException)).until(condition)
+        except TimeoutException:
+            self.load_times.record_timeout(url, condition_name)
+            METRICS.inc('page_load_timeouts_total', condition=condition_name)
+            logger.warning('Page not ready [%s] after %s seconds - %s', condition_name, timeout, url)
+            return False
+        elapsed = time.monotonic() - started_at
+        self.load_times.record(url, condition_name, elapsed)
+        METRICS.observe('stage_seconds', elapsed, stage='page_load')
+        logger.debug('Page ready [%s] in %.2f seconds - %s', condition_name, elapsed, url)
+        return True
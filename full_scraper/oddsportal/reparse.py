@@ -0,0 +1,87 @@
+"""
+reparse.py
+
+Rebuild the games of a league from the raw archive without touching the network, decoding its
+seasons in parallel worker processes
+
+"""
+
+
+from .decode import decode_response
+from .metrics import METRICS
+from .scraper import BASE_URL
+from joblib import delayed
+from joblib import Parallel
+
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+def decode_season_entries(archive, entries, base_url=BASE_URL):
+    """
+    Runs in a worker process.
+
+    Params:
+        archive (ResponseArchive) the entries were stored in
+        entries (list) of ArchiveEntry of the ajax payloads of one season, in page order
+
+    Returns:
+        (tuple) of a list of (page, url, GameColumns) and the number of payloads that did not decode
+    """
+    pages = []
+    failures = 0
+    for entry in entries:
+        try:
+            games = decode_response(archive.read(entry), entry.url, base_url, entry.possible_outcomes, int(entry.fetched_at))
+        except Exception:
+            logger.error('Archived payload of %s fetched at %s did not decode', entry.url, entry.fetched_at, exc_info=True)
+            failures += 1
+            continue
+        pages.append((entry.page, entry.url, games))
+    return pages, failures
+
+
+def reparse_league(archive, sport, league, game_sink=None, retain_games=True, compact_games=False, n_jobs=-1,
+                   base_url=BASE_URL):
+    """
+    Decode the latest archived payload of every page of a league, one season per task.
+
+    Params:
+        archive (ResponseArchive) to read the ajax payloads from
+        sport (str) e.g. "basketball"
+        league (str) e.g. "usa/nba"
+        game_sink (NdjsonWriter or ParquetWriter) to stream the games of every page to
+        retain_games (bool) also keep games in Season.games
+        compact_games (bool) hold the seasons' games as GameColumns
+        n_jobs (int) worker processes, -1 for every core
+
+    Returns:
+        (list) of Season in the order they were listed on the site
+    """
+    entries_by_season = archive.get_season_entries(sport, league)
+    logger.info('Reparsing %d seasons of %s/%s from archive %s', len(entries_by_season), sport, league, archive.path)
+    # Seasons come back in order as they finish, so the output is written while later ones still decode
+    results = Parallel(n_jobs=n_jobs, return_as='generator')(
+        delayed(decode_season_entries)(archive, entries, base_url) for entries in entries_by_season.values())
+    seasons = []
+    for entries, (pages, failures) in zip(entries_by_season.values(), results):
+        season = entries[0].to_season()
+        if compact_games:
+            season.make_compact()
+        season.urls = [entry.url for entry in entries]
+        for page, url, games in pages:
+            METRICS.inc('pages_total', source='archive')
+            METRICS.inc('games_total', len(games))
+            if game_sink is not None:
+                game_sink.write_games(season, page, games)
+            if retain_games:
+                season.add_games(games)
+        if failures:
+            METRICS.inc('page_failures_total', failures, reason='parse_error')
+        if game_sink is not None:
+            game_sink.end_season(season)
+        logger.info('Season [%s] reparsed %d of %d pages', season.name, len(pages), len(entries))
+        seasons.append(season)
+    return seasons
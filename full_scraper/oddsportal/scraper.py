@@ -4,47 +4,94 @@ scraper.py
 Logic for the overall Odds Portal scraping utility focused on scraping
 
 """
-import json
+import collections
+import heapq
 import logging
-import pathlib
-import pickle
-import random
+import re
 import time
 
 import requests
-from pyquery import PyQuery as pyquery
-from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import TimeoutException
 from selenium.common.exceptions import WebDriverException
 
 from oddsportal.cache import Cache
-from .models import Game
+from . import extract
+from .decode import decode_response
+from .driverpool import launch_chrome_driver
+from . import fetcher
+from .fetcher import AimdController
+from .fetcher import AsyncFetcher
+from .fetcher import get_backoff
+from .metrics import METRICS
+from .readiness import PageReadiness
 
 logger = logging.getLogger(__name__)
 
+BASE_URL = 'https://www.oddsportal.com'
+ARCHIVE_URL_PATTERN = '{base_url}/ajax-sport-country-tournament-archive_/{sid}/{id}/X0/1/0/page/{page}'
+PAGE_NUMBER_PATTERN = re.compile(r'#/page/(\d+)')
+
 class Scraper(object):
     """
     A class to scrape/parse match results from oddsportal.com website.
     Makes use of Selenium and BeautifulSoup modules.
     """
+    DEFAULT_RPS = 2  # per-host ajax requests per second when fetching concurrently
+    DEFAULT_CONCURRENCY = 4  # max ajax requests in flight when fetching concurrently
+    RAMP_UP_FACTOR = 4  # how far the pace may ramp up past rps and concurrency while the site keeps up
+    DEFAULT_MAX_ATTEMPTS = 5  # per page before it goes to the dead letters
 
-    def __init__(self, wait_on_page_load=3, driver=None):
+    def __init__(self, wait_on_page_load=3, driver=None, browserless=False, request_delay=1, rps=None, concurrency=None,
+                 cache=None, checkpoint=None, game_sink=None, retain_games=True, base_url=BASE_URL, archive=None,
+                 max_rps=None, max_concurrency=None, max_attempts=DEFAULT_MAX_ATTEMPTS, dead_letters=None):
         """
         Constructor
+
+        Params:
+            browserless (bool) fetch every page over the ajax endpoint and never call driver.get for them
+            request_delay (float) seconds to start sleeping between ajax requests in browserless mode, adapted to the site
+            rps (float) per-host requests per second to start at, fetches browserless pages concurrently when set
+            concurrency (int) ajax requests in flight to start at, fetches browserless pages concurrently when set
+            max_rps (float) the pace may ramp up to while the site keeps up, defaults to RAMP_UP_FACTOR times rps
+            max_concurrency (int) requests in flight may ramp up to, defaults to RAMP_UP_FACTOR times concurrency
+            max_attempts (int) per page, failed pages are retried after a jittered exponential backoff
+            dead_letters (list) to append the pages that failed every attempt to, may be shared between scrapers
+            cache (Cache) of parsed games per page, a default one is opened when not given
+            checkpoint (Checkpoint) to record completed pages and seasons in, and to resume from
+            game_sink (NdjsonWriter or ParquetWriter) to stream the games of every page to as soon as they are parsed
+            retain_games (bool) also keep games in Season.games, turn off when they are only streamed
+            base_url (str) of the site, i.e. a local stand-in for benchmarks
+            archive (ResponseArchive) to append every raw ajax payload and results page HTML fetched to
         """
-        if not driver:
+        self.base_url = base_url
+        self.archive = archive
+        self.wait_on_page_load = wait_on_page_load
+        if wait_on_page_load == None:
+            self.wait_on_page_load = 3
+        self.browserless = browserless
+        self.request_delay = request_delay
+        self.max_attempts = max_attempts
+        self.dead_letters = dead_letters if dead_letters is not None else []
+        # Verdict and reason of the last page that failed, to tell pages worth retrying from the rest
+        self.last_failure = None
+        # Sequential browserless requests are paced by the same controller as concurrent ones, one in flight
+        self.pacer = AimdController(1.0 / request_delay, 1, max_rate=self.RAMP_UP_FACTOR / request_delay) \
+            if browserless and request_delay else None
+        self.next_request_at = 0.0
+        self.fetcher = None
+        self.cache = cache if cache is not None else Cache()
+        self.checkpoint = checkpoint
+        self.game_sink = game_sink
+        self.retain_games = retain_games
+        # Tournament "pageOut" params (sid/id) by season root URL, resolved once per season
+        self.tournament_params = dict()
+        if driver:
             self.driver = driver
+        elif browserless:
+            self.driver = None
         else:
-            self.base_url = 'https://www.oddsportal.com'
-            self.wait_on_page_load = wait_on_page_load
-            if wait_on_page_load == None:
-                self.wait_on_page_load = 3
-            self.options = webdriver.ChromeOptions()
-            self.options.add_argument('--headless')
-            self.options.add_argument('--no-sandbox')
-            self.options.add_argument('--disable-gpu')
-
-            self.driver = webdriver.Chrome('./chromedriver/chromedriver', chrome_options=self.options)
+            self.driver = launch_chrome_driver()
+        self.readiness = PageReadiness(self.driver) if self.driver else None
         self.session = requests.Session()
         self.headers = {
             'authority': 'www.oddsportal.com',
@@ -61,145 +108,518 @@ class Scraper(object):
             'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
             'x-requested-with': 'XMLHttpRequest',
         }
-
-        logger.info('Chrome browser opened in headless mode')
-
-        # exception when no driver created
+        if rps or concurrency:
+            rps = rps or self.DEFAULT_RPS
+            concurrency = concurrency or self.DEFAULT_CONCURRENCY
+            self.fetcher = AsyncFetcher(self.request, rps=rps, concurrency=concurrency,
+                                        max_rps=max_rps or rps * self.RAMP_UP_FACTOR,
+                                        max_concurrency=max_concurrency or concurrency * self.RAMP_UP_FACTOR,
+                                        classify=self.classify_response, max_attempts=max_attempts)
 
     def request(self, url, timeout=5):
-        return self.session.get(url, headers=self.headers, timeout=timeout)
+        try:
+            with METRICS.timer('stage_seconds', stage='ajax_fetch'):
+                ret = self.session.get(url, headers=self.headers, timeout=timeout)
+        except requests.RequestException:
+            METRICS.inc('page_failures_total', reason='request_error')
+            raise
+        METRICS.inc('ajax_requests_total', status=ret.status_code)
+        return ret
 
-    def go_to_link(self, link, sleep_time=0):
+    def go_to_link(self, link, ready='page_out'):
         """
         returns True if no error
         False whe page not found
-        """
 
-        self.driver.implicitly_wait(3)
+        Params:
+            ready (str) DOM signal to wait for, a key of readiness.CONDITIONS
+        """
+        # Readiness is waited for explicitly, an implicit wait would stall every absent-element poll
+        self.driver.implicitly_wait(0)
         self.driver.set_page_load_timeout(15)
         self.driver.set_script_timeout(15)
+        started_at = time.monotonic()
         try:
             self.driver.get(link)
-            time.sleep(sleep_time)
-        except:
+        except TimeoutException:
             logger.info('driver load url not finished and timeout')
         logger.info('Go to link: %s', link)
-        try:
-            # if no Login button -> page not found
-            # self.driver.find_element_by_css_selector('.button-dark')
-            self.driver.find_element_by_css_selector('.loginModalBtn')
-            # self.driver.find_element_by_partial_link_text('MY LEAGUES')
-        except NoSuchElementException:
-            logger.warning('Problem with link, scraper could not find Login button - %s', link)
+        if not self.readiness.wait_for(link, ready, self.wait_on_page_load, started_at):
+            logger.warning('Problem with link, scraper could not find %s signal - %s', ready, link)
             return False
-        # Workaround for ajax page loading issue
-        # time.sleep(self.wait_on_page_load)
         return True
 
     def get_html_source(self):
         return self.driver.page_source
 
     def close_browser(self):
-        time.sleep(5)
+        if not self.driver:
+            return
         try:
             self.driver.quit()
             logger.info('Browser closed')
         except WebDriverException:
             logger.warning('WebDriverException on closing browser - maybe closed?')
 
+    @staticmethod
+    def get_season_root_url(url):
+        return url.split('#')[0]
+
+    @staticmethod
+    def get_page_number(url):
+        """
+        Params:
+            (str) url e.g. https://www.oddsportal.com/basketball/usa/nba/results/#/page/3
+
+        Returns:
+            (int) page number, 1 for a season URL without pagination fragment
+        """
+        match = PAGE_NUMBER_PATTERN.search(url)
+        return int(match.group(1)) if match else 1
+
+    def get_archive_url(self, tournament_params, page):
+        return ARCHIVE_URL_PATTERN.format(base_url=self.base_url, sid=tournament_params['sid'],
+                                          id=tournament_params['id'], page=page)
+
+    def resolve_tournament_params(self, season):
+        """
+        Read the sid/id of a season once, so every page can be fetched over the ajax endpoint.
+        Tries a plain HTTP request first and only falls back to the browser when one is available.
+
+        Params:
+            season (Season) with at least its root URL
+
+        Returns:
+            (dict) the "pageOut" params, or None if they could not be resolved
+        """
+        root_url = self.get_season_root_url(season.urls[0])
+        if root_url in self.tournament_params:
+            return self.tournament_params[root_url]
+        tournament_params = None
+        try:
+            ret = self.session.get(root_url, headers=dict(self.headers, accept='text/html'), timeout=15)
+            if ret.status_code == 200:
+                self.archive_html(season, root_url, ret.text)
+                tournament_params = extract.extract_tournament_params(ret.text)
+            else:
+                logger.warning('Season [%s] results page request failed with %s', season.name, ret.status_code)
+        except requests.RequestException:
+            logger.warning('Season [%s] results page request failed', season.name, exc_info=True)
+        if tournament_params is None and self.driver:
+            logger.info('Season [%s] falling back to browser to resolve tournament params', season.name)
+            self.go_to_link(root_url)
+            html_source = self.get_html_source()
+            self.archive_html(season, root_url, html_source)
+            tournament_params = extract.extract_tournament_params(html_source)
+        if tournament_params is None:
+            logger.warning('Season [%s] could not resolve tournament params from %s', season.name, root_url)
+            return None
+        self.tournament_params[root_url] = tournament_params
+        logger.info('Season [%s] resolved tournament params sid=%s id=%s', season.name,
+                    tournament_params['sid'], tournament_params['id'])
+        return tournament_params
+
+    def archive_html(self, season, url, html_source, page=None):
+        if self.archive is not None:
+            self.archive.store(url, self.archive.HTML, html_source, season=season, page=page)
+
+    def fetch_archive_page(self, page_url, url):
+        """
+        Returns:
+            (requests.Response) or None if the ajax request failed, see last_failure
+        """
+        self.pace()
+        started_at = time.monotonic()
+        try:
+            ret = self.request(page_url)
+        except requests.RequestException as e:
+            logger.warning('Ajax [%s] request failed', page_url, exc_info=True)
+            ret = e
+        verdict = self.classify_response(ret)
+        if self.pacer is not None:
+            if verdict == fetcher.OK:
+                self.pacer.on_success()
+            elif verdict == fetcher.THROTTLED:
+                self.pacer.on_throttle(started_at)
+        if verdict != fetcher.OK:
+            self.last_failure = (verdict, self.get_failure_reason(ret))
+            if not isinstance(ret, Exception):
+                self.check_archive_response(ret, page_url, url)
+            return None
+        return self.check_archive_response(ret, page_url, url)
+
+    def pace(self):
+        """
+        Sleep until the pacer allows the next sequential request.
+        """
+        if self.pacer is None:
+            return
+        now = time.monotonic()
+        if self.next_request_at > now:
+            time.sleep(self.next_request_at - now)
+            now = self.next_request_at
+        self.next_request_at = now + self.pacer.get_delay()
+
+    @staticmethod
+    def classify_response(ret):
+        """
+        Returns:
+            (str) verdict of fetcher.classify_response, with the jsonp callback the site answers with when it
+            refuses a request counted as throttling
+        """
+        verdict = fetcher.classify_response(ret)
+        if verdict == fetcher.OK and 'globals.jsonpCallback' in ret.text:
+            return fetcher.THROTTLED
+        return verdict
+
+    @staticmethod
+    def get_failure_reason(ret):
+        if isinstance(ret, Exception):
+            return 'request_error'
+        if ret.status_code != 200:
+            return 'http_' + str(ret.status_code)
+        return 'jsonp_callback'
+
+    def check_archive_response(self, ret, page_url, url):
+        """
+        Returns:
+            (requests.Response) or None if the ajax response is not usable
+        """
+        if ret.status_code != 200:
+            METRICS.inc('page_failures_total', reason='http_' + str(ret.status_code))
+            logger.warning('Ajax request failed: %s', url)
+            return None
+        if 'globals.jsonpCallback' in ret.text:
+            METRICS.inc('page_failures_total', reason='jsonp_callback')
+            logger.warning('Ajax [%s] request failed: %s', page_url, ret.text)
+            return None
+        logger.info("==> Ajax [%s] request success", page_url)
+        return ret
+
+    def parse_games(self, response_text, url, season, retrieval_timestamp):
+        """
+        Params:
+            response_text (str) ajax archive JSON payload
+            url (str) results page the payload belongs to
+            season (Season) the games belong to
+            retrieval_timestamp (int) epoch seconds when the page was retrieved
+
+        Returns:
+            (GameColumns) of the page's games, iterable as Game
+        """
+        return decode_response(response_text, url, self.base_url, season.possible_outcomes, retrieval_timestamp)
+
     def populate_games_into_season(self, season):
         """
         Params:
             season (Season) with urls but not games populated, to modify
         """
         logger.info('season [%s] url count: %s', season.name, len(season.urls))
-        cache = Cache(season)
-        use_cache = season.index != 0
+        if self.load_completed_season(season):
+            return
+        if self.browserless:
+            self.populate_games_into_season_without_browser(season)
+            return
+        self.scrape_pages(season, self.scrape_page_with_browser)
+        self.finish_season(season)
 
-        for url in season.urls:
-            if use_cache:
-                cached_games = cache.get(url)
-                if cached_games:
-                    season.games = cached_games
-                    logger.info('Load url:[%s] from cache', url)
-                    continue
+    def scrape_page(self, season, url):
+        """
+        Scrape a single results page of a season, for work handed out one page at a time.
 
-            st = random.randint(3, 6)
-            self.go_to_link(url, sleep_time=st)
-            html_source = self.get_html_source()
-            html_querying = pyquery(html_source)
-            # Check if the page says "No data available"
-            no_data_div = html_querying.find('div.message-info > ul > li > div.cms')
-            if no_data_div != None and no_data_div.text() == 'No data available':
-                # Yes, found "No data available"
-                logger.warning('Found "No data available", skipping %s', url)
-                continue
-            retrieval_time_for_reference = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        Returns:
+            (bool) True once the page is done, False if it should be tried again
+        """
+        if self.load_cached_games(season, url):
+            return True
+        if self.browserless:
+            tournament_params = self.resolve_tournament_params(season)
+            if tournament_params is None:
+                return False
+            return self.scrape_page_without_browser(season, url, tournament_params)
+        return self.scrape_page_with_browser(season, url)
 
-            scripts = html_querying.find('script')
-            url_param_dom = [s.text for s in scripts if s.text and 'pageOut' in s.text]
-            if not url_param_dom:
-                continue
-            url_param_txt = url_param_dom[0]
-            url_param_txt = url_param_txt.split("'")[1]
-            url_param = json.loads(url_param_txt)
-            url_pattern = f'https://www.oddsportal.com/ajax-sport-country-tournament-archive_/{url_param["sid"]}/{url_param["id"]}/X0/1/0/page/%s'
-
-            page_url = url_pattern % url.split('/')[-1]
-            ret = self.request(url_pattern % url.split('/')[-1])
-
-            logger.info("==> Ajax [%s] request success, sleep %s", page_url, st)
-            if ret.status_code != 200:
-                print('Ajax request failed: %s' + url)
-                logger.warning('Ajax request failed: %s', url)
+    def scrape_page_with_browser(self, season, url):
+        """
+        Returns:
+            (bool) True if the page's games were parsed or the page has none, False on failure
+        """
+        if not self.go_to_link(url):
+            # Half loaded, there is nothing worth archiving or parsing yet
+            self.last_failure = (fetcher.RETRY, 'not_ready')
+            return False
+        html_source = self.get_html_source()
+        self.archive_html(season, url, html_source, self.get_page_number(url))
+        # Check if the page says "No data available"
+        if extract.is_no_data(html_source):
+            # Yes, found "No data available"
+            METRICS.inc('page_failures_total', reason='no_data')
+            logger.warning('Found "No data available", skipping %s', url)
+            if self.checkpoint is not None:
+                # Done with no games, like an empty parsed page, so the season can still complete
+                self.checkpoint.save_page(season, self.get_page_number(url), url, [])
+            return True
+        retrieval_time_for_reference = int(time.time())
+
+        url_param = extract.extract_tournament_params(html_source)
+        if not url_param:
+            self.last_failure = (fetcher.RETRY, 'no_tournament_params')
+            return False
+
+        page_url = self.get_archive_url(url_param, self.get_page_number(url))
+        ret = self.fetch_archive_page(page_url, url)
+        if ret is None:
+            return False
+
+        return self.add_parsed_games(season, url, ret.text, retrieval_time_for_reference)
+
+    def scrape_page_without_browser(self, season, url, tournament_params):
+        """
+        Returns:
+            (bool) True if the page's games were parsed, False on failure
+        """
+        retrieval_time_for_reference = int(time.time())
+        page_url = self.get_archive_url(tournament_params, self.get_page_number(url))
+        ret = self.fetch_archive_page(page_url, url)
+        if ret is None:
+            return False
+        return self.add_parsed_games(season, url, ret.text, retrieval_time_for_reference)
+
+    def populate_games_into_season_without_browser(self, season):
+        """
+        Resolve the season's tournament params once, then pull every page over the ajax endpoint.
+
+        Params:
+            season (Season) with urls but not games populated, to modify
+        """
+        if self.fetcher:
+            self.populate_games_into_seasons([season])
+            return
+        tournament_params = self.resolve_tournament_params(season)
+        if tournament_params is None:
+            self.add_unresolved_season(season)
+            return
+        self.scrape_pages(season, lambda season, url: self.scrape_page_without_browser(season, url, tournament_params))
+        self.finish_season(season)
+
+    def populate_games_into_seasons(self, seasons):
+        """
+        Fetch the ajax pages of many seasons concurrently through the fetcher. Each page is parsed, checkpointed,
+        cached and handed to the game sink as soon as it comes in, and each season is finished once its last page
+        is in, so a crash only loses the pages in flight.
+
+        Params:
+            seasons (list) of Season with urls but not games populated, to modify
+        """
+        pending = []
+        started_seasons = []
+        pages_left = collections.Counter()
+        for season in seasons:
+            if self.load_completed_season(season):
                 continue
-            if 'globals.jsonpCallback' in ret.text:
-                logger.warning('Ajax [%s] request failed: %s', page_url, ret.text)
+            started_seasons.append(season)
+            tournament_params = self.resolve_tournament_params(season)
+            if tournament_params is None:
+                self.add_unresolved_season(season)
                 continue
+            for url in season.urls:
+                if self.load_cached_games(season, url):
+                    continue
+                page_url = self.get_archive_url(tournament_params, self.get_page_number(url))
+                pending.append((season, url, page_url))
+                pages_left[id(season)] += 1
+        for season in started_seasons:
+            if not pages_left[id(season)]:
+                self.finish_season(season)
+        logger.info('Fetching %d ajax pages for %d seasons', len(pending), len(seasons))
 
-            def parse_game(response):
-                result = json.loads(response.text)
-                items = result['d']['rows']
-                games = []
-                for item in items:
-                    game = Game()
-                    games.append(game)
-
-                    game.game_datetime = time.strftime("%Y-%m-%d %H:%M:%S",
-                                                       time.localtime(item['date-start-timestamp']))
-                    game.retrieval_datetime = retrieval_time_for_reference
-                    game.retrieval_url = url
-                    game.num_possible_outcomes = season.possible_outcomes
-                    game.team_home = item['home-name']
-                    game.team_away = item['away-name']
-                    game.game_url = self.base_url + item['url']
-
-                    sh, sa = item['homeResult'], item['awayResult']
-                    game.score_home = int(sh) if sh else None
-                    game.score_away = int(sa) if sa else None
-
-                    if item['home-winner'] == 'win':
-                        game.outcome = 'HOME'
-                    elif item['home-winner'] == 'lost':
-                        game.outcome = 'AWAY'
-                    else:
-                        game.outcome = 'DRAW'
-                    odds = item['odds']
-                    if odds:
-                        game.odds_home = odds[0]['avgOdds']
-                        game.odds_away = odds[1]['avgOdds']
-                        game.odds_draw = None if len(odds) < 3 else odds[2]['avgOdds']
-
-                return games
-
+        def add_response(index, ret, attempts):
+            season, url, page_url = pending[index]
             try:
-                games = parse_game(ret)
-                if games:
-                    cache.set(url, games)
-                    for game in games:
-                        season.add_game(game)
-            except Exception as e:
-                logger.error('!!! Parse game failed', e)
+                self.add_fetched_page(season, url, page_url, ret, attempts)
+            except Exception:
+                # i.e. the checkpoint, cache or sink file is locked, the page is given up on rather than the batch
+                METRICS.inc('page_failures_total', reason='output_error')
+                logger.error('Storing %s of season [%s] failed', url, season.name, exc_info=True)
+                self.add_dead_letter(season, url, 'output_error', attempts)
+            pages_left[id(season)] -= 1
+            if not pages_left[id(season)]:
+                self.finish_season(season)
+
+        self.fetcher.fetch_all([page_url for _, _, page_url in pending], on_result=add_response)
+
+    def add_fetched_page(self, season, url, page_url, ret, attempts):
+        """
+        Parse a page the fetcher completed into its season, or dead letter it.
+
+        Params:
+            ret (requests.Response or Exception) last response for the page, or the exception raised
+            attempts (int) made by the fetcher
+        """
+        if isinstance(ret, Exception):
+            logger.warning('Ajax [%s] request failed: %s', page_url, ret)
+            self.add_dead_letter(season, url, self.get_failure_reason(ret), attempts)
+            return
+        if self.check_archive_response(ret, page_url, url) is None:
+            self.add_dead_letter(season, url, self.get_failure_reason(ret), attempts)
+            return
+        if not self.add_parsed_games(season, url, ret.text, int(time.time())):
+            self.add_dead_letter(season, url, 'parse_error', attempts)
+
+    def scrape_pages(self, season, scrape):
+        """
+        Scrape the season's pages one after another. A page that fails goes to a retry queue and comes
+        back after a jittered exponential backoff, once the pages due before it are done, until it used up
+        max_attempts and goes to the dead letters.
+
+        Params:
+            scrape (callable) taking the season and a page URL, returning True once the page is done
+
+        Raises:
+            WebDriverException once the browser is gone, after the pages left are dead lettered, so the driver
+            pool recycles the driver instead of every page left burning its attempts on it
+        """
+        retries = []
+        queued = collections.deque(season.urls)
+        url, attempt = None, 0
+        try:
+            while queued:
+                url, attempt = queued.popleft(), 1
+                if self.load_cached_games(season, url):
+                    continue
+                self.scrape_page_or_retry(season, url, scrape, attempt, retries)
+            while retries:
+                due_at, url, attempt = heapq.heappop(retries)
+                time.sleep(max(0.0, due_at - time.monotonic()))
+                logger.info('Retrying %s, attempt %d of %d', url, attempt, self.max_attempts)
+                self.scrape_page_or_retry(season, url, scrape, attempt, retries)
+        except WebDriverException:
+            logger.error('Browser lost while scraping %s of season [%s]', url, season.name, exc_info=True)
+            self.add_dead_letter(season, url, 'driver_crash', attempt)
+            for queued_url in queued:
+                self.add_dead_letter(season, queued_url, 'driver_crash', 0)
+            for _, retry_url, retry_attempt in retries:
+                self.add_dead_letter(season, retry_url, 'driver_crash', retry_attempt - 1)
+            raise
+
+    def scrape_page_or_retry(self, season, url, scrape, attempt, retries):
+        self.last_failure = None
+        try:
+            if scrape(season, url):
+                return
+        except WebDriverException:
+            # Retrying on a crashed browser can't help, scrape_pages hands the crash to the driver pool
+            raise
+        except Exception as e:
+            logger.error('Scraping %s failed', url, exc_info=True)
+            self.last_failure = (fetcher.RETRY, 'error')
+        verdict, reason = self.last_failure or (fetcher.RETRY, 'error')
+        if verdict == fetcher.FAILED or attempt >= self.max_attempts:
+            self.add_dead_letter(season, url, reason, attempt)
+            return
+        METRICS.inc('ajax_retries_total', verdict=verdict)
+        heapq.heappush(retries, (time.monotonic() + get_backoff(attempt), url, attempt + 1))
+
+    def add_dead_letter(self, season, url, reason, attempts):
+        """
+        Record a page given up on, it is neither cached nor checkpointed so the next run fetches it again.
+        """
+        METRICS.inc('dead_letters_total', reason=reason)
+        logger.error('Giving up on %s of season [%s] after %d attempts: %s', url, season.name, attempts, reason)
+        self.dead_letters.append({'sport': season.sport, 'league': season.league, 'season': season.name,
+                                  'page': self.get_page_number(url), 'url': url, 'reason': reason, 'attempts': attempts})
+
+    def add_unresolved_season(self, season):
+        for url in season.urls:
+            if not self.load_cached_games(season, url):
+                self.add_dead_letter(season, url, 'no_tournament_params', 1)
+
+    def load_completed_season(self, season):
+        """
+        Returns:
+            (bool) True if the season was already completed by a previous run and its games were loaded
+        """
+        if self.checkpoint is None or not self.checkpoint.is_season_complete(season):
+            return False
+        games_count = 0
+        for page, games in self.checkpoint.get_season_pages(season):
+            self.add_games(season, page, games)
+            games_count += len(games)
+        if self.game_sink is not None:
+            self.game_sink.end_season(season)
+        logger.info('Season [%s] already complete, loaded %d games from checkpoint', season.name, games_count)
+        return True
+
+    def finish_season(self, season):
+        """
+        Mark the season complete in the checkpoint once all its pages are in, and let the game sink
+        write out anything it holds back per season.
+        """
+        if self.checkpoint is not None and self.checkpoint.count_completed_pages(season) >= len(season.urls):
+            self.checkpoint.complete_season(season)
+        if self.game_sink is not None:
+            self.game_sink.end_season(season)
+
+    def load_cached_games(self, season, url):
+        """
+        Returns:
+            (bool) True if the games of this page were loaded from the checkpoint or the cache into the season
+        """
+        page = self.get_page_number(url)
+        if self.checkpoint is not None:
+            checkpointed_games = self.checkpoint.get_page(season, page)
+            if checkpointed_games is not None:
+                self.add_games(season, page, checkpointed_games)
+                METRICS.inc('pages_total', source='checkpoint')
+                logger.info('Load url:[%s] from checkpoint', url)
+                return True
+        cached_games = self.cache.get(season, page)
+        if not cached_games:
+            return False
+        self.add_games(season, page, cached_games)
+        METRICS.inc('pages_total', source='cache')
+        if self.checkpoint is not None:
+            self.checkpoint.save_page(season, page, url, cached_games)
+        logger.info('Load url:[%s] from cache', url)
+        return True
+
+    def add_parsed_games(self, season, url, response_text, retrieval_timestamp):
+        """
+        Returns:
+            (bool) True if the page parsed
+        """
+        page = self.get_page_number(url)
+        if self.archive is not None:
+            # Archived before parsing, so a payload the parser chokes on can be reparsed once it is fixed
+            self.archive.store(url, self.archive.AJAX, response_text, season=season, page=page, fetched_at=retrieval_timestamp)
+        try:
+            with METRICS.timer('stage_seconds', stage='parse'):
+                games = self.parse_games(response_text, url, season, retrieval_timestamp)
+        except Exception as e:
+            METRICS.inc('page_failures_total', reason='parse_error')
+            logger.error('!!! Parse game failed', exc_info=True)
+            # The same payload would fail again, it's archived for a reparse once the parser is fixed
+            self.last_failure = (fetcher.FAILED, 'parse_error')
+            return False
+        METRICS.inc('pages_total', source='fetched')
+        METRICS.inc('games_total', len(games))
+        if games:
+            self.cache.set(season, page, games)
+            self.add_games(season, page, games)
+        # Last, so a page only counts as done once its games are stored
+        if self.checkpoint is not None:
+            self.checkpoint.save_page(season, page, url, games)
+        return True
+
+    def add_games(self, season, page, games):
+        """
+        Hand the games of a page to the game sink as soon as they are known, and keep them in the season
+        unless they are only streamed.
+        """
+        if self.game_sink is not None:
+            self.game_sink.write_games(season, page, games)
+        if self.retain_games:
+            season.add_games(games)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,91 @@
+"""
+store.py
+
+Base of the SQLite files kept by the scraping utility (cache, checkpoint, catalog, work queue, archive index,
+sqlite output): one connection per process, opened on first use and shared by threads behind a lock
+
+"""
+
+
+import os
+import sqlite3
+import threading
+
+
+class LazySqlite(object):
+    """
+    A SQLite file opened lazily. Subclasses create their tables in on_connect and run every statement with
+    the lock held. The connection and lock are dropped on pickling, each worker process reconnects lazily.
+    SHARED files may be used by queue workers on several boxes over a shared filesystem, so they keep the
+    rollback journal: WAL relies on shared memory, which only works on one host. The others run in WAL.
+    """
+    SHARED = False
+    TIMEOUT = 30  # seconds waiting on another connection's lock
+    ISOLATION_LEVEL = ''  # sqlite3's default of implicit transactions, None for autocommit
+
+    def __init__(self, path):
+        """
+        Params:
+            path (str) SQLite database file, created along with its directory if missing
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def get_fresh_state(self):
+        """
+        Returns:
+            (dict) attribute -> value a process starts with after unpickling, in place of what can't be pickled
+        """
+        return {'conn': None, 'lock': None}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(self.get_fresh_state())
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def get_db_path(self):
+        return self.path
+
+    def connect(self):
+        if self.conn is None:
+            db_path = self.get_db_path()
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.conn = sqlite3.connect(db_path, timeout=self.TIMEOUT, check_same_thread=False,
+                                        isolation_level=self.ISOLATION_LEVEL)
+            self.conn.execute('PRAGMA journal_mode=' + ('DELETE' if self.SHARED else 'WAL'))
+            self.on_connect(self.conn)
+            self.conn.commit()
+        return self.conn
+
+    def on_connect(self, conn):
+        """
+        Create the tables and indexes of the file if missing.
+        """
+        pass
+
+    def on_close(self, conn):
+        """
+        Write anything held back before the connection closes, with the lock held.
+        """
+        pass
+
+    def close(self):
+        """
+        Returns:
+            (bool) True if a connection was open
+        """
+        with self.lock:
+            if self.conn is None:
+                return False
+            self.on_close(self.conn)
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+        return True
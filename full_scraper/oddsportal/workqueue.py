@@ -0,0 +1,232 @@
+"""
+workqueue.py
+
+SQLite-backed queue of (collection, season, page) work units, leased to worker processes on one box or
+several, with heartbeats so the units of a dead worker go back to the queue
+
+"""
+
+
+from .models import Season
+from .store import LazySqlite
+
+import logging
+import sqlite3
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class WorkUnit(object):
+    """
+    One results page of a season, as leased to a worker.
+    """
+
+    def __init__(self, collection, sport, league, season, season_index, possible_outcomes, page, url, attempts):
+        self.collection = collection
+        self.sport = sport
+        self.league = league
+        self.season = season
+        self.season_index = season_index
+        self.possible_outcomes = possible_outcomes
+        self.page = page
+        self.url = url
+        self.attempts = attempts
+
+    def get_key(self):
+        return (self.sport, self.league, self.season, self.page)
+
+    def to_season(self):
+        """
+        Returns:
+            (Season) carrying the identity of the unit's season, with only the unit's page URL
+        """
+        season = Season(self.season)
+        season.sport = self.sport
+        season.league = self.league
+        season.index = self.season_index
+        season.possible_outcomes = self.possible_outcomes
+        season.urls = [self.url]
+        return season
+
+
+class WorkQueue(LazySqlite):
+    """
+    Queue of work units in a single SQLite file, shared by a planner that enqueues the pages of every season
+    and any number of workers that claim them. A claimed unit is leased to its worker for lease_seconds and
+    the worker's heartbeats keep extending it. Once a lease runs out, e.g. because the worker died, the unit
+    can be claimed again, up to max_attempts times before it is set aside as failed.
+    Several boxes can share the queue as long as the file sits on a filesystem with working locks. It keeps
+    SQLite's rollback journal for that (SHARED).
+    """
+    SHARED = True
+    TIMEOUT = 60
+    # Autocommit, claims take the write lock explicitly with BEGIN IMMEDIATE
+    ISOLATION_LEVEL = None
+    DEFAULT_PATH = 'queue/oddsportal.sqlite3'
+    DEFAULT_LEASE_SECONDS = 120
+    DEFAULT_MAX_ATTEMPTS = 5
+
+    def __init__(self, path=DEFAULT_PATH, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        LazySqlite.__init__(self, path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def on_connect(self, conn):
+        conn.execute('''CREATE TABLE IF NOT EXISTS units
+                        (collection text, sport text, league text, season text, season_index integer,
+                        possible_outcomes integer, page integer, url text,
+                        status text, worker text, leased_until real, attempts integer, updated_at real,
+                        PRIMARY KEY (sport, league, season, page))''')
+        conn.execute('CREATE INDEX IF NOT EXISTS units_status ON units (status, leased_until)')
+
+    def reset(self):
+        with self.lock:
+            self.connect().execute('DELETE FROM units')
+        logger.info('Work queue %s reset', self.path)
+
+    def enqueue_season(self, collection, season, get_page_number):
+        """
+        Add a unit for every page of a season, leaving units already queued as they are.
+
+        Params:
+            collection (str) collection name the season belongs to
+            season (Season) paginated, with sport and league set
+            get_page_number (callable) page number of a season URL
+
+        Returns:
+            (int) units added
+        """
+        now = time.time()
+        rows = [(collection, season.sport, season.league, season.name, season.index, season.possible_outcomes,
+                 get_page_number(url), url, now) for url in season.urls]
+        with self.lock:
+            conn = self.connect()
+            before = conn.total_changes
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('''INSERT OR IGNORE INTO units VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pending', NULL, NULL, 0, ?)''',
+                             rows)
+            conn.execute('COMMIT')
+            return conn.total_changes - before
+
+    def claim(self, worker, limit=1):
+        """
+        Lease up to limit pending units, or units whose lease ran out, to a worker.
+
+        Returns:
+            (list) of WorkUnit, empty when nothing is claimable right now
+        """
+        now = time.time()
+        with self.lock:
+            conn = self.connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Units whose every attempt ended with a dead worker are not handed out again
+                conn.execute('''UPDATE units SET status='failed', worker=NULL, leased_until=NULL, updated_at=?
+                                WHERE status='leased' AND leased_until < ? AND attempts >= ?''',
+                             (now, now, self.max_attempts))
+                rows = conn.execute('''SELECT collection, sport, league, season, season_index, possible_outcomes, page, url,
+                                       attempts, status, worker FROM units
+                                       WHERE status='pending' OR (status='leased' AND leased_until < ?)
+                                       ORDER BY attempts, sport, league, season_index, page LIMIT ?''',
+                                    (now, limit)).fetchall()
+                units = []
+                for row in rows:
+                    unit = WorkUnit(*row[:8], attempts=row[8] + 1)
+                    if row[9] == 'leased':
+                        logger.warning('Reassigning %s page %d of season [%s], lease of worker %s ran out',
+                                       unit.collection, unit.page, unit.season, row[10])
+                    conn.execute('''UPDATE units SET status='leased', worker=?, leased_until=?, attempts=?, updated_at=?
+                                    WHERE sport=? AND league=? AND season=? AND page=?''',
+                                 (worker, now + self.lease_seconds, unit.attempts, now) + unit.get_key())
+                    units.append(unit)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return units
+
+    def heartbeat(self, worker):
+        """
+        Extend the leases of every unit the worker holds.
+        """
+        now = time.time()
+        with self.lock:
+            self.connect().execute('''UPDATE units SET leased_until=?, updated_at=? WHERE status='leased' AND worker=?''',
+                                   (now + self.lease_seconds, now, worker))
+
+    def complete(self, worker, unit):
+        self.set_status(worker, unit, 'done')
+
+    def release(self, worker, unit):
+        """
+        Give a unit that failed back to the queue, or set it aside once it used up its attempts.
+        """
+        status = 'failed' if unit.attempts >= self.max_attempts else 'pending'
+        if status == 'failed':
+            logger.error('Giving up on %s page %d of season [%s] after %d attempts', unit.collection, unit.page,
+                         unit.season, unit.attempts)
+        self.set_status(worker, unit, status)
+
+    def set_status(self, worker, unit, status):
+        with self.lock:
+            # A worker that lost its lease no longer owns the unit
+            self.connect().execute('''UPDATE units SET status=?, worker=NULL, leased_until=NULL, updated_at=?
+                                      WHERE sport=? AND league=? AND season=? AND page=? AND worker=? AND status='leased' ''',
+                                   (status, time.time()) + unit.get_key() + (worker,))
+
+    def is_season_done(self, unit):
+        """
+        Returns:
+            (bool) True once every unit of the unit's season is done
+        """
+        with self.lock:
+            row = self.connect().execute("""SELECT COUNT(*) FROM units WHERE sport=? AND league=? AND season=?
+                                            AND status != 'done'""", unit.get_key()[:3]).fetchone()
+        return row[0] == 0
+
+    def is_drained(self):
+        """
+        Returns:
+            (bool) True once no unit is pending or leased
+        """
+        with self.lock:
+            row = self.connect().execute("SELECT COUNT(*) FROM units WHERE status IN ('pending', 'leased')").fetchone()
+        return row[0] == 0
+
+    def get_stats(self):
+        with self.lock:
+            rows = self.connect().execute('SELECT status, COUNT(*) FROM units GROUP BY status').fetchall()
+        stats = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        stats.update(dict(rows))
+        return stats
+
+
+class Heartbeat(object):
+    """
+    Background thread extending a worker's leases every interval seconds while it works.
+    """
+
+    def __init__(self, work_queue, worker, interval=None):
+        self.work_queue = work_queue
+        self.worker = worker
+        self.interval = interval or work_queue.lease_seconds / 3
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='heartbeat-' + worker, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.work_queue.heartbeat(self.worker)
+            except sqlite3.Error:
+                logger.warning('Heartbeat of worker %s failed', self.worker, exc_info=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
@@ -0,0 +1,401 @@
+"""
+writers.py
+
+Streaming output sinks, writing games as soon as their season page (or season) is parsed
+
+"""
+
+
+from .models import BasicJsonEncoder
+from .models import GameColumns
+from .metrics import METRICS
+from .store import LazySqlite
+
+import gzip
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Normalized games schema, shared with soccer_to_sql
+SCHEMA_PATH = os.path.join(REPO_ROOT, 'schema', 'games.sql')
+
+FILE_EXTENSIONS = {
+    None: '.ndjson',
+    'gzip': '.ndjson.gz',
+    'zstd': '.ndjson.zst',
+}
+
+
+class NdjsonWriter(object):
+    """
+    Writes games as newline delimited JSON, one line per game tagged with its season.
+    With compression every page is written as its own gzip member or zstd frame, so the file stays
+    one valid stream while the index can point straight at any page of a season.
+    A background thread flushes the file every flush_interval seconds, and so does the end of each season,
+    rewriting the index each time to cover the blocks flushed, so a crash leaves an indexed file behind.
+    """
+    DEFAULT_FLUSH_INTERVAL = 5  # seconds
+
+    def __init__(self, path, compression=None, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        """
+        Params:
+            path (str) output file, its index is written next to it as <path>.index.json
+            compression (str) None, 'gzip' or 'zstd'
+            flush_interval (float) max seconds written data may sit in the file buffer
+        """
+        if compression not in FILE_EXTENSIONS:
+            raise ValueError('Unsupported NDJSON compression: ' + str(compression))
+        self.path = path
+        self.compression = compression
+        self.flush_interval = flush_interval
+        self.compressor = None
+        if compression == 'zstd':
+            try:
+                import zstandard
+            except ImportError:
+                raise RuntimeError('zstd compression needs the zstandard package - pip install zstandard')
+            self.compressor = zstandard.ZstdCompressor()
+        self.lock = threading.Lock()
+        self.file = open(path, 'wb')
+        self.games_written = 0
+        # Season name -> list of {page, offset, length, games} of each written block
+        self.index = dict()
+        # Blocks written since the last flush
+        self.dirty = False
+        self.stopped = threading.Event()
+        self.flusher = threading.Thread(target=self.run_flusher, name='flush-' + os.path.basename(path), daemon=True)
+        self.flusher.start()
+
+    def run_flusher(self):
+        while not self.stopped.wait(self.flush_interval):
+            with self.lock:
+                if not self.file.closed:
+                    self.flush()
+
+    def flush(self):
+        """
+        Flush the blocks written so far and rewrite the index to match, with the lock held.
+        """
+        if not self.dirty:
+            return
+        self.file.flush()
+        for blocks in self.index.values():
+            blocks.sort(key=lambda block: block['page'])
+        # Replaced in one go, so a reader or a crash never sees half an index
+        index_path = self.path + '.index.json'
+        with open(index_path + '.tmp', 'w') as index_file:
+            json.dump({'compression': self.compression, 'seasons': self.index}, index_file)
+        os.replace(index_path + '.tmp', index_path)
+        self.dirty = False
+
+    def end_season(self, season):
+        # Blocks are written as pages come in, a finished season is flushed and indexed right away
+        with self.lock:
+            if not self.file.closed:
+                self.flush()
+
+    def compress(self, data):
+        if self.compression == 'gzip':
+            return gzip.compress(data)
+        if self.compression == 'zstd':
+            return self.compressor.compress(data)
+        return data
+
+    @staticmethod
+    def to_line(season, game):
+        record = game.to_dict()
+        record['season'] = season.name
+        return json.dumps(record, cls=BasicJsonEncoder) + '\n'
+
+    def write_games(self, season, page, games):
+        """
+        Params:
+            season (Season) the games belong to
+            page (int) page number within the season
+            games (list) of Game
+        """
+        if not games:
+            return
+        started_at = time.perf_counter()
+        block = self.compress(''.join(self.to_line(season, game) for game in games).encode('utf-8'))
+        with self.lock:
+            offset = self.file.tell()
+            self.file.write(block)
+            self.games_written += len(games)
+            self.index.setdefault(season.name, []).append(
+                {'page': page, 'offset': offset, 'length': len(block), 'games': len(games)})
+            self.dirty = True
+        METRICS.observe('stage_seconds', time.perf_counter() - started_at, stage='output_write')
+
+    def close(self):
+        self.stopped.set()
+        self.flusher.join()
+        with self.lock:
+            if self.file.closed:
+                return
+            # The index is written even when nothing was, as it always has been
+            self.dirty = True
+            self.flush()
+            self.file.close()
+        logger.info('Wrote %d games to %s', self.games_written, self.path)
+
+
+class ParquetWriter(object):
+    """
+    Writes games as a typed columnar dataset, one Parquet file per season, partitioned Hive style as
+    sport=<sport>/league=<league>/season=<season>. Team names and outcomes are dictionary encoded, odds are
+    floats, scores ints and times epoch timestamps, so reading one column only touches that column.
+    A season's games are buffered until the season ends.
+    """
+
+    def __init__(self, root):
+        """
+        Params:
+            root (str) dataset directory
+        """
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError('Parquet output needs the pyarrow package - pip install pyarrow')
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.root = root
+        self.lock = threading.Lock()
+        # (sport, league, season name) -> GameColumns buffered
+        self.buffers = dict()
+        self.games_written = 0
+        self.schema = pyarrow.schema([
+            ('game_time', pyarrow.timestamp('s', tz='UTC')),
+            ('retrieval_time', pyarrow.timestamp('s', tz='UTC')),
+            ('team_home', pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+            ('team_away', pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+            ('outcome', pyarrow.dictionary(pyarrow.int8(), pyarrow.string())),
+            ('score_home', pyarrow.int32()),
+            ('score_away', pyarrow.int32()),
+            ('odds_home', pyarrow.float64()),
+            ('odds_away', pyarrow.float64()),
+            ('odds_draw', pyarrow.float64()),
+            ('num_possible_outcomes', pyarrow.int8()),
+            ('game_url', pyarrow.string()),
+            ('retrieval_url', pyarrow.string()),
+        ])
+
+    @staticmethod
+    def to_partition_value(value):
+        return str(value).replace('/', '-').replace(' ', '_')
+
+    def write_games(self, season, page, games):
+        with self.lock:
+            self.buffers.setdefault((season.sport, season.league, season.name), GameColumns()).extend(games)
+
+    def end_season(self, season):
+        key = (season.sport, season.league, season.name)
+        with self.lock:
+            games = self.buffers.pop(key, None)
+        if games:
+            self.write_season(key, games)
+
+    def to_nullable(self, values, missing, pa_type):
+        return self.pa.array([None if value == missing else value for value in values], type=pa_type)
+
+    def to_nullable_float(self, values):
+        return self.pa.array([None if math.isnan(value) else value for value in values], type=self.pa.float64())
+
+    def to_dictionary(self, indices, dictionary, pa_type, null_index=None):
+        indices = self.pa.array([None if i == null_index else i for i in indices], type=pa_type.index_type)
+        return self.pa.DictionaryArray.from_arrays(indices, self.pa.array(dictionary, type=pa_type.value_type))
+
+    def write_season(self, key, games):
+        with METRICS.timer('stage_seconds', stage='output_write'):
+            self.write_season_table(key, games)
+
+    def write_season_table(self, key, games):
+        sport, league, season_name = key
+        missing = GameColumns.MISSING
+        schema = self.schema
+        # Straight from the buffered columns, team and outcome codes are already the dictionary indices
+        columns = [
+            self.to_nullable(games.game_timestamp, missing, schema.field('game_time').type),
+            self.to_nullable(games.retrieval_timestamp, missing, schema.field('retrieval_time').type),
+            self.to_dictionary(games.team_home, games.teams, schema.field('team_home').type),
+            self.to_dictionary(games.team_away, games.teams, schema.field('team_away').type),
+            self.to_dictionary(games.outcome, GameColumns.OUTCOMES, schema.field('outcome').type, null_index=0),
+            self.to_nullable(games.score_home, missing, schema.field('score_home').type),
+            self.to_nullable(games.score_away, missing, schema.field('score_away').type),
+            self.to_nullable_float(games.odds_home),
+            self.to_nullable_float(games.odds_away),
+            self.to_nullable_float(games.odds_draw),
+            self.to_nullable(games.num_possible_outcomes, missing, schema.field('num_possible_outcomes').type),
+            self.pa.array(games.game_url, type=self.pa.string()),
+            self.pa.array([games.urls[i] for i in games.retrieval_url], type=self.pa.string()),
+        ]
+        table = self.pa.Table.from_arrays(columns, schema=schema)
+        directory = os.path.join(self.root, 'sport=' + self.to_partition_value(sport),
+                                 'league=' + self.to_partition_value(league),
+                                 'season=' + self.to_partition_value(season_name))
+        os.makedirs(directory, exist_ok=True)
+        self.pq.write_table(table, os.path.join(directory, 'part-0.parquet'))
+        self.games_written += len(games)
+        logger.info('Wrote %d games of season [%s] to %s', len(games), season_name, directory)
+
+    def close(self):
+        # Seasons that never got to their end, e.g. after a failure, are still written
+        with self.lock:
+            buffers = self.buffers
+            self.buffers = dict()
+        for key, games in buffers.items():
+            self.write_season(key, games)
+        logger.info('Wrote %d games to %s', self.games_written, self.root)
+
+
+class SqliteWriter(LazySqlite):
+    """
+    Writes games into the normalized SQLite schema shared with soccer_to_sql (sports, leagues, seasons, teams,
+    games), one transaction per page as soon as it is parsed. The database is kept across runs: a game scraped
+    again is upserted on its season, time and teams, and only rewritten when its outcome, score or odds changed.
+    One writer serves every collection, the area and name of a league come from the season's "area/league", the
+    slugs of its results URL, and game times are the site's epoch seconds, as soccer_to_sql stores them, so both
+    write a game under the same key. Both default to the same database at the root of the repository.
+    """
+    DEFAULT_PATH = os.path.join(REPO_ROOT, 'oddsportal.db')
+
+    UPSERT_GAME_SQL = '''INSERT INTO games (season_id, game_time, home_team_id, away_team_id, outcome, score_home,
+                         score_away, odds_home, odds_away, odds_draw, num_possible_outcomes, game_url, retrieval_url,
+                         retrieval_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                         ON CONFLICT (season_id, game_time, home_team_id, away_team_id) DO UPDATE SET
+                         outcome=excluded.outcome, score_home=excluded.score_home, score_away=excluded.score_away,
+                         odds_home=excluded.odds_home, odds_away=excluded.odds_away, odds_draw=excluded.odds_draw,
+                         num_possible_outcomes=excluded.num_possible_outcomes, game_url=excluded.game_url,
+                         retrieval_url=excluded.retrieval_url, retrieval_time=excluded.retrieval_time
+                         WHERE outcome IS NOT excluded.outcome OR score_home IS NOT excluded.score_home
+                         OR score_away IS NOT excluded.score_away OR odds_home IS NOT excluded.odds_home
+                         OR odds_away IS NOT excluded.odds_away OR odds_draw IS NOT excluded.odds_draw'''
+
+    def __init__(self, path):
+        """
+        Params:
+            path (str) SQLite database file, created with the schema if missing
+        """
+        LazySqlite.__init__(self, path)
+        self.games_written = 0
+        # Natural keys -> row ids, so a page only looks up the teams and seasons not seen before
+        self.season_ids = dict()
+        self.team_ids = dict()
+
+    def on_connect(self, conn):
+        conn.execute('PRAGMA synchronous=NORMAL')
+        with open(SCHEMA_PATH) as schema_file:
+            conn.executescript(schema_file.read())
+
+    def get_id(self, insert_sql, select_sql, params):
+        self.conn.execute(insert_sql, params)
+        return self.conn.execute(select_sql, params).fetchone()[0]
+
+    def get_season_id(self, season):
+        """
+        Returns:
+            (tuple) of the sport id and season id of the season, recorded along with its league if new
+        """
+        key = (season.sport, season.league, season.name)
+        if key not in self.season_ids:
+            sport_id = self.get_id('INSERT INTO sports (name) VALUES (?) ON CONFLICT (name) DO NOTHING',
+                                   'SELECT sport_id FROM sports WHERE name=?', (season.sport,))
+            area, _, name = season.league.rpartition('/')
+            league_id = self.get_id('''INSERT INTO leagues (sport_id, area, name) VALUES (?, ?, ?)
+                                       ON CONFLICT (sport_id, area, name) DO NOTHING''',
+                                    'SELECT league_id FROM leagues WHERE sport_id=? AND area=? AND name=?',
+                                    (sport_id, area, name))
+            season_id = self.get_id('INSERT INTO seasons (league_id, name) VALUES (?, ?) ON CONFLICT (league_id, name) DO NOTHING',
+                                    'SELECT season_id FROM seasons WHERE league_id=? AND name=?', (league_id, season.name))
+            self.season_ids[key] = (sport_id, season_id)
+        return self.season_ids[key]
+
+    def get_team_id(self, sport_id, team):
+        key = (team, sport_id)
+        if key not in self.team_ids:
+            self.team_ids[key] = self.get_id('INSERT INTO teams (name, sport_id) VALUES (?, ?) ON CONFLICT (name, sport_id) DO NOTHING',
+                                             'SELECT team_id FROM teams WHERE name=? AND sport_id=?', key)
+        return self.team_ids[key]
+
+    def write_games(self, season, page, games):
+        """
+        Params:
+            season (Season) the games belong to
+            page (int) page number within the season
+            games (list) of Game
+        """
+        if not games:
+            return
+        started_at = time.perf_counter()
+        with self.lock:
+            conn = self.connect()
+            with conn:
+                sport_id, season_id = self.get_season_id(season)
+                conn.executemany(self.UPSERT_GAME_SQL, [
+                    (season_id, game.game_timestamp, self.get_team_id(sport_id, game.team_home),
+                     self.get_team_id(sport_id, game.team_away), game.outcome or None, game.score_home, game.score_away,
+                     game.odds_home, game.odds_away, game.odds_draw, game.num_possible_outcomes, game.game_url,
+                     game.retrieval_url, game.retrieval_timestamp) for game in games])
+            self.games_written += len(games)
+        METRICS.observe('stage_seconds', time.perf_counter() - started_at, stage='output_write')
+
+    def end_season(self, season):
+        # Pages are committed as they come in, nothing is held back per season
+        pass
+
+    def get_team_games(self, team, sport=None):
+        """
+        Params:
+            team (str) team name, as scraped
+            sport (str) only games of this sport, i.e. "soccer", or of every sport when None
+
+        Returns:
+            (list) of dict of the team's games in every league, oldest first, looked up through the team name index
+        """
+        sport_filter = ' AND teams.sport_id IN (SELECT sport_id FROM sports WHERE name=?)' if sport else ''
+        params = (team, sport) if sport else (team,)
+        with self.lock:
+            cursor = self.connect().execute('''SELECT * FROM games_view WHERE game_id IN
+                                               (SELECT game_id FROM teams JOIN games ON games.home_team_id=teams.team_id
+                                               WHERE teams.name=?{0}
+                                               UNION ALL SELECT game_id FROM teams JOIN games ON games.away_team_id=teams.team_id
+                                               WHERE teams.name=?{0}) ORDER BY game_time'''.format(sport_filter), params * 2)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def close(self):
+        # Every collection's sink is this one writer, so it is closed once per collection
+        if not LazySqlite.close(self):
+            return
+        logger.info('Wrote %d games to %s', self.games_written, self.path)
+
+
+class GameSinkRouter(object):
+    """
+    Hands the games of each season to the game sink of its league, so seasons of several collections
+    can be scraped together by one Scraper.
+    """
+
+    def __init__(self):
+        # (sport, league) -> game sink
+        self.game_sinks = dict()
+
+    def add(self, sport, league, game_sink):
+        self.game_sinks[(sport, league)] = game_sink
+
+    def __len__(self):
+        return len(self.game_sinks)
+
+    def write_games(self, season, page, games):
+        self.game_sinks[(season.sport, season.league)].write_games(season, page, games)
+
+    def end_season(self, season):
+        self.game_sinks[(season.sport, season.league)].end_season(season)
@@ -6,20 +6,37 @@ OddsPortal scraping utility
 """
 
 from joblib import delayed
+from joblib import effective_n_jobs
 from joblib import Parallel
+from oddsportal import Cache
+from oddsportal import Checkpoint
 from oddsportal import Crawler
 from oddsportal import DataRepository
+from oddsportal import DriverPool
 from oddsportal import Scraper
+from oddsportal import extract
+from oddsportal.archive import ResponseArchive
+from oddsportal.catalog import LeagueCatalog
+from oddsportal.metrics import METRICS
+from oddsportal.metrics import MetricsExporter
+from oddsportal.readiness import LOAD_TIMES
+from oddsportal.reparse import reparse_league
+from oddsportal.writers import GameSinkRouter
+from oddsportal.workqueue import Heartbeat
+from oddsportal.workqueue import WorkQueue
 
 import argparse
 import json
 import logging
+import os
+import socket
 import time
 
 #######################################################################################################################
 
 TARGET_SPORTS_FILE = 'config/sports.json'
 OUTPUT_DIRECTORY_PATH = 'output'
+QUEUE_POLL_SECONDS = 5 # how long an idle worker waits before looking for units whose lease ran out
 
 #######################################################################################################################
 
@@ -31,6 +48,14 @@ logger = logging.getLogger('oddsportal')
 data = DataRepository()
 
 wait_on_page_load = 15 # seconds - default wait time for each page to load completely
+browserless = False # fetch season pages over the ajax endpoint only, without loading them in the browser
+requests_per_second = None # per-host politeness budget for concurrent ajax fetching (browserless only)
+concurrency = None # max ajax requests in flight (browserless only)
+max_requests_per_second = None # ceiling the ajax pace may ramp up to while the site keeps up (browserless only)
+max_concurrency = None # ceiling the ajax requests in flight may ramp up to (browserless only)
+dead_letters = [] # pages that failed every attempt, reported at the end of the run
+catalog = None # persistent record of the seasons of every league and their pagination, shared across runs
+archive = None # raw response archive every fetched payload and results page is appended to
 
 #######################################################################################################################
 
@@ -39,41 +64,265 @@ def get_target_sports_from_file():
         data = json.load(json_file)
         return data
 
-def scrape_games_for_season(this_season, driver=None):
-    global wait_on_page_load
-    try:
-        logger.info('---------------- %s --------------', this_season.name)
+def paginate_season(this_season, driver_pool, checkpoint=None, lease=None):
+    """
+    Fill in the pagination links of a season from the checkpoint, the catalog, a plain HTTP request of its
+    results page or, when none of those has them, the browser - the leased driver if given, else one from the pool
+    """
+    global wait_on_page_load, archive, catalog
+    if checkpoint and checkpoint.is_season_paginated(this_season):
+        logger.info('Season "%s" - pagination links loaded from checkpoint', this_season.name)
+        return
+    catalog_urls = catalog.get_season_urls(this_season) if catalog else None
+    if catalog_urls:
+        this_season.urls = catalog_urls
+        logger.info('Season "%s" - %d pagination links loaded from catalog', this_season.name, len(catalog_urls))
+    else:
         logger.info('Season "%s" - getting all pagination links', this_season.name)
-        current_crawler = Crawler(wait_on_page_load=wait_on_page_load, driver=driver)
+        current_crawler = Crawler(wait_on_page_load=wait_on_page_load, driver=lease.driver if lease else None, archive=archive,
+                                  launch_browser=False)
+        confirmed = current_crawler.fill_in_season_pagination_links(this_season)
+        if lease:
+            lease.record_pages(current_crawler.page_loads)
+        elif not confirmed:
+            with driver_pool.lease() as lease:
+                current_crawler = Crawler(wait_on_page_load=wait_on_page_load, driver=lease.driver, archive=archive, http_first=False)
+                confirmed = current_crawler.fill_in_season_pagination_links(this_season)
+                lease.record_pages(current_crawler.page_loads)
+        if catalog:
+            catalog.save_season_urls(this_season, confirmed)
+    if checkpoint:
+        checkpoint.save_season_pagination(this_season)
 
-        logger.info('Season "%s" - started this crawler', this_season.name)
-        current_crawler.fill_in_season_pagination_links(this_season)
-
-        if not driver:
-            current_crawler.close_browser()
-            logger.info('Season "%s" - closed this crawler', this_season.name)
-
-        logger.info('Season "%s" - populating all game data via pagination links', this_season.name)
-        scraper = Scraper(wait_on_page_load=wait_on_page_load, driver=driver)
+def fill_in_pagination_for_season(this_season, driver_pool, checkpoint=None):
+    try:
+        paginate_season(this_season, driver_pool, checkpoint)
+    except Exception as e:
+        logger.error("Pagination of season [%s] failed", this_season.name, exc_info=True)
+    return this_season
 
-        logger.info('Season "%s" - started this scraper', this_season.name)
-        scraper.populate_games_into_season(this_season)
+def scrape_games_for_season(this_season, driver_pool, cache=None, checkpoint=None, game_sink=None):
+    global wait_on_page_load, archive, dead_letters
+    try:
+        logger.info('---------------- %s --------------', this_season.name)
+        with driver_pool.lease() as lease:
+            logger.info('Season "%s" - leased driver %d', this_season.name, lease.slot)
+            paginate_season(this_season, driver_pool, checkpoint, lease)
 
-        if not driver:
-            scraper.close_browser()
-        logger.info('Season "%s" - closed this scraper\n', this_season.name)
+            logger.info('Season "%s" - populating all game data via pagination links', this_season.name)
+            scraper = Scraper(wait_on_page_load=wait_on_page_load, driver=lease.driver, cache=cache, checkpoint=checkpoint,
+                              game_sink=game_sink, retain_games=game_sink is None, archive=archive, dead_letters=dead_letters)
+            scraper.populate_games_into_season(this_season)
+            lease.record_pages(len(this_season.urls))
+        logger.info('Season "%s" - returned driver %d\n', this_season.name, lease.slot)
     except Exception as e:
         logger.error("Scrapy season [%s] failed", this_season.name, exc_info=True)
     return this_season
 
+def scrape_unit(unit, driver_pool, cache, checkpoint, scraper=None):
+    global wait_on_page_load, archive
+    if scraper:
+        return scraper.scrape_page(unit.to_season(), unit.url)
+    with driver_pool.lease() as lease:
+        scraper = Scraper(wait_on_page_load=wait_on_page_load, driver=lease.driver, cache=cache, checkpoint=checkpoint,
+                          retain_games=False, archive=archive)
+        done = scraper.scrape_page(unit.to_season(), unit.url)
+        lease.record_pages(1)
+    return done
+
+def work_through_queue(work_queue, worker, driver_pool, cache, checkpoint):
+    """
+    Claim and scrape units until none are left pending or leased, results go to the shared checkpoint
+    """
+    global wait_on_page_load, browserless, archive
+    # One browserless scraper per worker thread, so tournament params are resolved once per season
+    scraper = Scraper(wait_on_page_load=wait_on_page_load, browserless=True, cache=cache, checkpoint=checkpoint,
+                      retain_games=False, archive=archive) if browserless else None
+    units_done = 0
+    while True:
+        units = work_queue.claim(worker)
+        if not units:
+            if work_queue.is_drained():
+                break
+            # Other workers still hold leases, which may yet run out
+            time.sleep(QUEUE_POLL_SECONDS)
+            continue
+        for unit in units:
+            try:
+                done = scrape_unit(unit, driver_pool, cache, checkpoint, scraper)
+            except Exception as e:
+                logger.error('Unit %s page %d of season [%s] failed', unit.collection, unit.page, unit.season, exc_info=True)
+                done = False
+            if done:
+                work_queue.complete(worker, unit)
+                units_done += 1
+                if checkpoint is not None and work_queue.is_season_done(unit):
+                    # Whoever completes the last page marks the season, so --resume loads it in one go
+                    checkpoint.complete_season(unit.to_season())
+            else:
+                work_queue.release(worker, unit)
+    return units_done
+
+def run_queue_worker(work_queue, max_parallel_cpus, recycle_driver_after, cache, checkpoint):
+    global browserless
+    worker = socket.gethostname() + '-' + str(os.getpid())
+    n_jobs = effective_n_jobs(max_parallel_cpus)
+    driver_pool = None
+    if not browserless:
+        driver_pool = DriverPool(n_jobs, max_pages=recycle_driver_after)
+        driver_pool.start()
+    logger.info('Worker %s pulling units from %s with %d threads', worker, work_queue.path, n_jobs)
+    with Heartbeat(work_queue, worker):
+        units_done = Parallel(n_jobs=n_jobs, prefer='threads')(delayed(work_through_queue)(work_queue, worker, driver_pool, cache, checkpoint) for _ in range(n_jobs))
+    logger.info('Worker %s done after %d units, queue stats: %s', worker, sum(units_done), work_queue.get_stats())
+    if driver_pool:
+        logger.info('Driver pool stats: %s', driver_pool.get_stats())
+        driver_pool.close()
+
+def select_target_sports(args, target_sports):
+    """
+    Returns:
+        (list) of the target sport objects to scrape, from --collections, --all or else the interactive prompt
+    """
+    if args.all:
+        return target_sports
+    if args.collections:
+        by_name = {target_sport_obj['collection_name'].lower(): target_sport_obj for target_sport_obj in target_sports}
+        names = [name.strip().lower() for name in args.collections.split(',') if name.strip()]
+        unknown = [name for name in names if name not in by_name]
+        if unknown:
+            raise RuntimeError('Unknown collections ' + ', '.join(unknown) + ' - see ' + TARGET_SPORTS_FILE)
+        return [by_name[name] for name in names]
+    logger.info('Now prompting user for which sport/league to scrape')
+    print('Please input the corresponding number of which sport/league to scrape')
+    print('\t[0] ' + 'all sports')
+    for i, target_sport_obj in enumerate(target_sports):
+        print('\t[' + str(i+1) + '] ' + target_sport_obj['collection_name'])
+    sport_to_do = input('Selection: ')
+    if False == sport_to_do.isdigit() or int(sport_to_do) > len(target_sports):
+        raise RuntimeError('Invalid selection, please re-rerun and try again')
+    sport_to_do = int(sport_to_do)
+    if sport_to_do == 0:
+        return target_sports
+    return [target_sports[sport_to_do - 1]]
+
+def get_league(target_sport_obj):
+    """
+    Returns:
+        (str) "area/league" identity of the league, from the slugs of its results URL so soccer_to_sql names it the same
+    """
+    return extract.extract_league(target_sport_obj['root_url']) or target_sport_obj['region'] + '/' + target_sport_obj['league']
+
+def discover_seasons(target_sport_obj, driver_pool, checkpoint, resume=False):
+    """
+    Returns:
+        (list) of Season of the league, from the checkpoint when resuming or else crawled from its results page
+    """
+    global wait_on_page_load, archive, catalog
+    sport = target_sport_obj['sport']
+    league = get_league(target_sport_obj)
+    working_seasons = checkpoint.get_seasons(sport, league) if resume else []
+    if working_seasons:
+        logger.info('Loaded %d seasons of "%s" from checkpoint', len(working_seasons), target_sport_obj['collection_name'])
+        return working_seasons
+    working_seasons = catalog.get_seasons(sport, league) if catalog else None
+    if working_seasons:
+        logger.info('Loaded %d seasons of "%s" from catalog', len(working_seasons), target_sport_obj['collection_name'])
+    else:
+        try:
+            # Plain HTTP first, the browser only if the season links are not in the served HTML
+            crawler = Crawler(wait_on_page_load=wait_on_page_load, archive=archive, launch_browser=False)
+            working_seasons = crawler.get_seasons_for_league(target_sport_obj['root_url'])
+            if not working_seasons:
+                with driver_pool.lease() as lease:
+                    crawler = Crawler(wait_on_page_load=wait_on_page_load, driver=lease.driver, archive=archive, http_first=False)
+                    working_seasons = crawler.get_seasons_for_league(target_sport_obj['root_url'])
+                    lease.record_pages(crawler.page_loads)
+        except Exception as e:
+            logger.error('Season discovery of "%s" failed', target_sport_obj['collection_name'], exc_info=True)
+            return []
+        if catalog:
+            catalog.save_seasons(sport, league, target_sport_obj['root_url'], working_seasons)
+    # Make sure possible outcomes and league identity fields are set, because the parallel processor needs to know
+    for this_season in working_seasons:
+        this_season.possible_outcomes = target_sport_obj['outcomes']
+        this_season.sport = sport
+        this_season.league = league
+    checkpoint.save_seasons(sport, league, working_seasons)
+    return working_seasons
+
+def reparse_collections(selected_sports, n_jobs, compact_games=False):
+    """
+    Rebuild the output of the selected collections from the raw archive, without any network access
+    """
+    global data, archive
+    for target_sport_obj in selected_sports:
+        c_name = target_sport_obj['collection_name']
+        data.start_new_data_collection(target_sport_obj)
+        game_sink = data.open_game_sink(c_name)
+        working_seasons = reparse_league(archive, target_sport_obj['sport'], get_league(target_sport_obj),
+                                         game_sink=game_sink, retain_games=game_sink is None, compact_games=compact_games, n_jobs=n_jobs)
+        if not working_seasons:
+            logger.warning('Archive %s holds no pages of "%s"', archive.path, c_name)
+        data[c_name].league.seasons = working_seasons
+
+def report_dead_letters():
+    """
+    Log every page given up on and keep the list next to the logs, a --resume run fetches them again
+    """
+    global dead_letters
+    if not dead_letters:
+        logger.info('No pages given up on')
+        return
+    dead_letters_path = 'logs/dead_letters_' + str(int(time.time())) + '.json'
+    with open(dead_letters_path, 'w') as f:
+        json.dump(dead_letters, f, indent=2)
+    logger.error('Gave up on %d pages, listed in %s - run again with --resume to retry them', len(dead_letters), dead_letters_path)
+    for dead_letter in dead_letters:
+        logger.error('Dead letter: %s', dead_letter)
+
 def main():
-    global logger, data, wait_on_page_load
+    global logger, data, wait_on_page_load, browserless, requests_per_second, concurrency, max_requests_per_second, max_concurrency, archive, dead_letters, catalog
     # Instantiate the argument parser
     parser = argparse.ArgumentParser(description='oddsporter v1.0')
     # Declaring all our acceptable arguments below...
     parallel_cpus_desc = 'Number parallel CPUs for processing (default -1 for max available)'
     parser.add_argument('--number-of-cpus', type=int, nargs='?', help=parallel_cpus_desc)
-    parser.add_argument('--wait-time-on-page-load', type=int, nargs='?', help='How many seconds to wait on page load (default 3)')
+    parser.add_argument('--wait-time-on-page-load', type=int, nargs='?', help='Max seconds to wait for a page to be ready (default 3)')
+    recycle_desc = 'Page loads after which a pooled Chrome instance is replaced by a fresh one (default ' + str(DriverPool.DEFAULT_MAX_PAGES) + ')'
+    parser.add_argument('--recycle-driver-after', type=int, nargs='?', help=recycle_desc)
+    browserless_desc = 'Resolve tournament ids once per season then fetch every page over the ajax endpoint, without the browser'
+    parser.add_argument('--browserless', action='store_true', help=browserless_desc)
+    parser.add_argument('--rps', type=float, nargs='?', help='Ajax requests per second per host to start at, browserless only (default 2)')
+    parser.add_argument('--concurrency', type=int, nargs='?', help='Ajax requests in flight to start at, browserless only (default 4)')
+    parser.add_argument('--max-rps', type=float, nargs='?', help='Ajax requests per second the pace may ramp up to while the site keeps up (default 4 x --rps)')
+    parser.add_argument('--max-concurrency', type=int, nargs='?', help='Ajax requests in flight the pace may ramp up to (default 4 x --concurrency)')
+    parser.add_argument('--cache-path', type=str, nargs='?', help='SQLite file caching parsed pages (default ' + Cache.DEFAULT_PATH + ')')
+    parser.add_argument('--cache-size-mb', type=int, nargs='?', help='Max cache size before least recently used pages are evicted (default 512)')
+    parser.add_argument('--live-season-ttl', type=int, nargs='?', help='Seconds before cached pages of the live season expire (default 3600)')
+    parser.add_argument('--catalog-path', type=str, nargs='?', help='SQLite file of the league catalog, the seasons and page counts kept across runs (default ' + LeagueCatalog.DEFAULT_PATH + ')')
+    parser.add_argument('--refresh-catalog', action='store_true', help='Rediscover every season and page count instead of reading them from the catalog')
+    parser.add_argument('--resume', action='store_true', help='Continue the previous run from its last completed page instead of starting over')
+    parser.add_argument('--checkpoint-path', type=str, nargs='?', help='SQLite file recording run progress (default ' + Checkpoint.DEFAULT_PATH + ')')
+    output_format_desc = 'json writes one file per collection at the end, ndjson streams games as each page is parsed, ' \
+                         'parquet writes a typed columnar dataset per season, sqlite upserts games as each page is parsed into ' \
+                         'oddsportal.db at the root of the repository, shared with soccer_to_sql (default json)'
+    parser.add_argument('--output-format', choices=['json', 'ndjson', 'parquet', 'sqlite'], default='json', help=output_format_desc)
+    parser.add_argument('--compression', choices=['none', 'gzip', 'zstd'], default='none', help='Compression of ndjson output (default none)')
+    parser.add_argument('--collections', type=str, nargs='?', help='Comma separated collection names to scrape without prompting, i.e. NBA,NHL')
+    parser.add_argument('--all', action='store_true', help='Scrape every collection in ' + TARGET_SPORTS_FILE + ' without prompting')
+    parser.add_argument('--compact-games', action='store_true', help='Hold games in memory as typed columns instead of objects, for very large collections')
+    queue_desc = 'plan discovers and paginates seasons then queues every page as a work unit, work scrapes queued units ' \
+                 'into the checkpoint until none are left (run as many workers as wanted, then --resume to write output)'
+    parser.add_argument('--queue', choices=['plan', 'work'], help=queue_desc)
+    parser.add_argument('--queue-path', type=str, nargs='?', help='SQLite file holding the work queue (default ' + WorkQueue.DEFAULT_PATH + ')')
+    parser.add_argument('--lease-seconds', type=int, nargs='?', help='Seconds a worker holds a unit without a heartbeat before it is reassigned (default ' + str(WorkQueue.DEFAULT_LEASE_SECONDS) + ')')
+    parser.add_argument('--metrics-file', type=str, nargs='?', help='Prometheus text file to keep the run metrics in, rewritten every 15 seconds')
+    parser.add_argument('--archive', action='store_true', help='Append every raw ajax payload and results page HTML fetched to the archive')
+    parser.add_argument('--archive-path', type=str, nargs='?', help='Directory of the raw response archive (default ' + ResponseArchive.DEFAULT_PATH + ')')
+    reparse_desc = 'Rebuild the output of the selected collections from the archive on every core (or --number-of-cpus), without touching the network'
+    parser.add_argument('--reparse', action='store_true', help=reparse_desc)
+    parser.add_argument('--metrics-port', type=int, nargs='?', help='Serve the run metrics in Prometheus format at http://127.0.0.1:<port>/metrics')
     # Then grab them from the command line input
     # START parsing command line arguments and logging what's happening
     args = parser.parse_args()
@@ -88,54 +337,151 @@ def main():
         logger.info('Received argument --wait-time-on-page-load so will wait %s seconds', str(wait_on_page_load))
     else:
         logger.info('Did not receive argument --wait-time-on-page-load so will use default 3 seconds')
+    if args.browserless:
+        browserless = True
+        logger.info('Received argument --browserless so will fetch season pages over the ajax endpoint only')
+        requests_per_second = args.rps if args.rps != None else Scraper.DEFAULT_RPS
+        concurrency = args.concurrency if args.concurrency != None else Scraper.DEFAULT_CONCURRENCY
+        max_requests_per_second = args.max_rps if args.max_rps != None else requests_per_second * Scraper.RAMP_UP_FACTOR
+        max_concurrency = args.max_concurrency if args.max_concurrency != None else concurrency * Scraper.RAMP_UP_FACTOR
+        logger.info('Will fetch ajax pages starting at %s requests per second with %s in flight, ramping up to %s with %s in flight',
+                    str(requests_per_second), str(concurrency), str(max_requests_per_second), str(max_concurrency))
+    elif args.rps != None or args.concurrency != None or args.max_rps != None or args.max_concurrency != None:
+        logger.warning('Arguments --rps, --concurrency, --max-rps and --max-concurrency only apply with --browserless so will be ignored')
+    if args.archive or args.reparse:
+        archive = ResponseArchive(path=args.archive_path or ResponseArchive.DEFAULT_PATH)
+    if args.reparse:
+        reparse_jobs = args.number_of_cpus if args.number_of_cpus != None else -1
+        logger.info('Received argument --reparse so will rebuild output from archive %s with %d processes', archive.path, effective_n_jobs(reparse_jobs))
+        data.set_output_directory(OUTPUT_DIRECTORY_PATH)
+        data.set_output_format(args.output_format, compression=None if args.compression == 'none' else args.compression)
+        selected_sports = select_target_sports(args, get_target_sports_from_file())
+        metrics_exporter = MetricsExporter(path=args.metrics_file, port=args.metrics_port).start()
+        reparse_collections(selected_sports, reparse_jobs, args.compact_games)
+        archive.close()
+        logger.info('Saving output now')
+        if args.output_format == 'json':
+            data.save_all_collections_to_json()
+        else:
+            data.close_game_sinks()
+        METRICS.log_summary()
+        metrics_exporter.stop()
+        return
+    if archive:
+        logger.info('Received argument --archive so will append every raw response to archive %s', archive.path)
+    cache = Cache(path=args.cache_path or Cache.DEFAULT_PATH,
+                  max_bytes=args.cache_size_mb * 1024 * 1024 if args.cache_size_mb != None else Cache.DEFAULT_MAX_BYTES,
+                  live_ttl=args.live_season_ttl if args.live_season_ttl != None else Cache.DEFAULT_LIVE_TTL)
+    logger.info('Caching parsed pages in %s', cache.path)
+    checkpoint = Checkpoint(path=args.checkpoint_path or Checkpoint.DEFAULT_PATH)
+    if args.resume:
+        logger.info('Received argument --resume so will continue from checkpoint %s', checkpoint.path)
+    elif args.queue == 'work':
+        logger.info('Worker will add to checkpoint %s', checkpoint.path)
+    else:
+        checkpoint.reset()
+    metrics_exporter = MetricsExporter(path=args.metrics_file, port=args.metrics_port).start()
+    catalog = LeagueCatalog(path=args.catalog_path or LeagueCatalog.DEFAULT_PATH, refresh=args.refresh_catalog)
+    if args.refresh_catalog:
+        logger.info('Received argument --refresh-catalog so will rediscover seasons and page counts into catalog %s', catalog.path)
+    recycle_driver_after = args.recycle_driver_after if args.recycle_driver_after != None else DriverPool.DEFAULT_MAX_PAGES
+    work_queue = None
+    if args.queue:
+        work_queue = WorkQueue(path=args.queue_path or WorkQueue.DEFAULT_PATH,
+                               lease_seconds=args.lease_seconds if args.lease_seconds != None else WorkQueue.DEFAULT_LEASE_SECONDS)
+    if args.queue == 'work':
+        run_queue_worker(work_queue, max_parallel_cpus, recycle_driver_after, cache, checkpoint)
+        LOAD_TIMES.log_summary()
+        logger.info('Cache stats: %s', cache.get_stats())
+        METRICS.log_summary()
+        metrics_exporter.stop()
+        cache.close()
+        checkpoint.close()
+        work_queue.close()
+        catalog.close()
+        if archive:
+            archive.close()
+        return
+    if args.queue == 'plan' and not args.resume:
+        work_queue.reset()
+    data.set_output_directory(OUTPUT_DIRECTORY_PATH)
+    data.set_output_format(args.output_format, compression=None if args.compression == 'none' else args.compression)
+    logger.info('Will write %s output', args.output_format)
     # END parsing command line arguments and logging what's happening
     logger.info('About to load "target sports"')
     target_sports = get_target_sports_from_file()
     if len(target_sports) < 1:
         raise RuntimeError('config/sports.json file appears empty - cannot proceed')
-    logger.info('Now prompting user for which sport/league to scrape')
-    print('Please input the corresponding number of which sport/league to scrape')
-    print('\t[0] ' + 'all sports *buggy*')
-    for i, target_sport_obj in enumerate(target_sports):
-        print('\t[' + str(i+1) + '] ' + target_sport_obj['collection_name'])
-    sport_to_do = input('Selection: ')
-    if False == sport_to_do.isdigit():
-        raise RuntimeError('Invalid selection, please re-rerun and try again')
-    else:
-        sport_to_do = int(sport_to_do)
+    selected_sports = select_target_sports(args, target_sports)
     logger.info('Starting scrape of OddsPortal.com')
     logger.info('Loaded configuration for ' + str(len(target_sports)) + ' sports\' results to scrape')
-    if int(sport_to_do) == 0:
-        logger.info('Will attempt to scrape all sports')
-    else:
-        logger.info('Only scraping one sport though')
-    crawler = Crawler(wait_on_page_load=wait_on_page_load)
-    logger.info('Crawler for season links has been initialized')
-    ran_once = False
-    for i, target_sport_obj in enumerate(target_sports):
-        if (i + 1) != int(sport_to_do) and int(sport_to_do) != 0:
-            continue
-        ran_once = True
+    logger.info('Will scrape %s', ', '.join(target_sport_obj['collection_name'] for target_sport_obj in selected_sports))
+    ran_once = len(selected_sports) > 0
+    # One Chrome instance per parallel worker, each season task leases its own. Discovery and pagination go over
+    # plain HTTP where they can, so unless the browser scrapes the pages the drivers are only launched when needed
+    driver_pool = DriverPool(effective_n_jobs(max_parallel_cpus), max_pages=recycle_driver_after)
+    driver_pool.start(warm=not (browserless or work_queue))
+    # Discover the seasons of every league at once, falling back to a pooled driver per league
+    seasons_by_league = Parallel(n_jobs=driver_pool.size, prefer='threads')(delayed(discover_seasons)(target_sport_obj, driver_pool, checkpoint, args.resume) for target_sport_obj in selected_sports)
+    game_sinks = GameSinkRouter()
+    scheduled_seasons = []
+    for target_sport_obj, working_seasons in zip(selected_sports, seasons_by_league):
         c_name = target_sport_obj['collection_name']
-        logger.info('Starting data collection "%s"', c_name)
+        logger.info('Starting data collection "%s" with %d seasons', c_name, len(working_seasons))
         data.start_new_data_collection(target_sport_obj)
-        main_league_results_url = target_sport_obj['root_url']
-        working_seasons = crawler.get_seasons_for_league(main_league_results_url)
-        logger.info('Crawler for season links has been shut down')
-        # Make sure possible outcomes field is set, because the parallel processor needs to know
-        for i,_ in enumerate(working_seasons):
-            working_seasons[i].possible_outcomes = target_sport_obj['outcomes']
-        # Use parallel processing to scrape games for each season of this league's history
-        working_seasons_w_games = Parallel(n_jobs=max_parallel_cpus)(delayed(scrape_games_for_season)(this_season, crawler.get_driver()) for this_season in working_seasons)
-        data[c_name].league.seasons = working_seasons_w_games
-
-    crawler.close_browser()
-    if ran_once:
+        game_sink = data.open_game_sink(c_name)
+        if game_sink is not None:
+            game_sinks.add(target_sport_obj['sport'], get_league(target_sport_obj), game_sink)
+        if args.compact_games:
+            for this_season in working_seasons:
+                this_season.make_compact()
+        data[c_name].league.seasons = working_seasons
+        scheduled_seasons.extend((c_name, this_season, game_sink) for this_season in working_seasons)
+    # Page counts are the cost of each season, so all seasons are paginated before anything is scheduled
+    Parallel(n_jobs=driver_pool.size, prefer='threads')(delayed(fill_in_pagination_for_season)(this_season, driver_pool, checkpoint) for _, this_season, _ in scheduled_seasons)
+    # Longest seasons first across every league, so no worker is left with one long season at the end
+    scheduled_seasons.sort(key=lambda scheduled: len(scheduled[1].urls), reverse=True)
+    logger.info('Scheduled %d seasons of %d pages in total', len(scheduled_seasons), sum(len(this_season.urls) for _, this_season, _ in scheduled_seasons))
+    if work_queue:
+        # Only paginate here, workers scrape the pages
+        units = sum(work_queue.enqueue_season(c_name, this_season, Scraper.get_page_number) for c_name, this_season, _ in scheduled_seasons)
+        logger.info('Queued %d units for %d seasons', units, len(scheduled_seasons))
+    elif browserless:
+        # No browser for the pages, every season's pages are fetched concurrently in one go
+        scraper = Scraper(wait_on_page_load=wait_on_page_load, browserless=True, rps=requests_per_second, concurrency=concurrency, cache=cache, checkpoint=checkpoint,
+                          game_sink=game_sinks if game_sinks else None, retain_games=not game_sinks, archive=archive,
+                          max_rps=max_requests_per_second, max_concurrency=max_concurrency, dead_letters=dead_letters)
+        scraper.populate_games_into_seasons([this_season for _, this_season, _ in scheduled_seasons])
+    else:
+        # Use parallel processing to scrape games for each season of every league, one pooled driver per worker
+        Parallel(n_jobs=driver_pool.size, prefer='threads')(delayed(scrape_games_for_season)(this_season, driver_pool, cache, checkpoint, game_sink) for _, this_season, game_sink in scheduled_seasons)
+
+    logger.info('Driver pool stats: %s', driver_pool.get_stats())
+    LOAD_TIMES.log_summary()
+    driver_pool.close()
+    logger.info('Cache stats: %s', cache.get_stats())
+    cache.close()
+    checkpoint.close()
+    logger.info('Catalog stats: %s', catalog.get_stats())
+    catalog.close()
+    if archive:
+        archive.close()
+    if work_queue:
+        logger.info('Work queue stats: %s', work_queue.get_stats())
+        work_queue.close()
+        logger.info('Planned only, start workers with --queue work then collect output with --resume')
+    elif ran_once:
         logger.info('Saving output now')
-        data.set_output_directory(OUTPUT_DIRECTORY_PATH)
-        data.save_all_collections_to_json()
+        if args.output_format == 'json':
+            data.save_all_collections_to_json()
+        else:
+            data.close_game_sinks()
     else:
-        logger.warning('Did not run - invalid command line input for sport')
+        logger.warning('Did not run - no sport/league selected')
+    if not work_queue:
+        report_dead_letters()
+    METRICS.log_summary()
+    metrics_exporter.stop()
     logger.info('Ending scrape of OddsPortal.com')
 
 #######################################################################################################################
@@ -0,0 +1,58 @@
+-- Normalized games schema shared by full_scraper (--output-format sqlite) and
+-- soccer_to_sql, so one database can hold the games of either and be queried
+-- the same way. Every statement is idempotent, the schema is applied on connect.
+
+CREATE TABLE IF NOT EXISTS sports
+(sport_id integer PRIMARY KEY, name text NOT NULL UNIQUE);
+
+CREATE TABLE IF NOT EXISTS leagues
+(league_id integer PRIMARY KEY,
+sport_id integer NOT NULL REFERENCES sports (sport_id),
+area text NOT NULL, name text NOT NULL,
+UNIQUE (sport_id, area, name));
+
+CREATE TABLE IF NOT EXISTS seasons
+(season_id integer PRIMARY KEY,
+league_id integer NOT NULL REFERENCES leagues (league_id),
+name text NOT NULL,
+UNIQUE (league_id, name));
+
+-- Team names are unique per sport, the name comes first so that looking a
+-- team up across every sport is an index search
+CREATE TABLE IF NOT EXISTS teams
+(team_id integer PRIMARY KEY,
+sport_id integer NOT NULL REFERENCES sports (sport_id),
+name text NOT NULL,
+UNIQUE (name, sport_id));
+
+-- Times are epoch seconds, outcome is HOME, AWAY, DRAW or NULL when the game
+-- had none (i.e. postponed), odds are NULL when there were none
+CREATE TABLE IF NOT EXISTS games
+(game_id integer PRIMARY KEY,
+season_id integer NOT NULL REFERENCES seasons (season_id),
+game_time integer,
+home_team_id integer NOT NULL REFERENCES teams (team_id),
+away_team_id integer NOT NULL REFERENCES teams (team_id),
+outcome text, score_home integer, score_away integer,
+odds_home real, odds_away real, odds_draw real,
+num_possible_outcomes integer, game_url text, retrieval_url text,
+retrieval_time integer,
+UNIQUE (season_id, game_time, home_team_id, away_team_id));
+
+CREATE INDEX IF NOT EXISTS games_home_team ON games (home_team_id, game_time);
+CREATE INDEX IF NOT EXISTS games_away_team ON games (away_team_id, game_time);
+CREATE INDEX IF NOT EXISTS games_game_time ON games (game_time);
+
+CREATE VIEW IF NOT EXISTS games_view AS
+SELECT games.game_id, sports.name AS sport, leagues.area, leagues.name AS league,
+seasons.name AS season, games.game_time, home.name AS team_home,
+away.name AS team_away, games.outcome, games.score_home, games.score_away,
+games.odds_home, games.odds_away, games.odds_draw,
+games.num_possible_outcomes, games.game_url, games.retrieval_url,
+games.retrieval_time
+FROM games
+JOIN seasons ON seasons.season_id = games.season_id
+JOIN leagues ON leagues.league_id = seasons.league_id
+JOIN sports ON sports.sport_id = leagues.sport_id
+JOIN teams AS home ON home.team_id = games.home_team_id
+JOIN teams AS away ON away.team_id = games.away_team_id;
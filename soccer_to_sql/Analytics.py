@@ -0,0 +1,323 @@
+"""
+Materialized analytics over the matches table: implied probabilities and
+bookmaker margin per match, outcome and favourite hit rates per league season,
+and team records. Triggers keep the tables up to date as matches are written.
+"""
+
+from DbManager import CREATE_MATCHES_SQL, DB_FILENAME, PRAGMAS
+from DbManager import add_missing_columns, fill_in_seasons
+import sqlite3
+
+DECIDED_OUTCOMES = "('TEAM1', 'TEAM2', 'DRAW')"
+
+# Derived values of a match. Implied probabilities are the inverse odds
+# normalized to sum to one, the overround is the margin the inverse odds add up
+# to beyond one. The favourite is the team with the shorter odds, in a fully
+# priced match.
+MATCH_ODDS_SELECT_SQL = '''SELECT match_id, league, area, season, start_time,
+                           team1, team2, outcome, team1_odds, draw_odds, team2_odds,
+                           inv1 / (inv1 + invd + inv2), invd / (inv1 + invd + inv2),
+                           inv2 / (inv1 + invd + inv2), inv1 + invd + inv2 - 1,
+                           favourite,
+                           CASE WHEN favourite IS NULL
+                           OR outcome NOT IN ''' + DECIDED_OUTCOMES + ''' THEN NULL
+                           ELSE outcome = favourite END
+                           FROM (SELECT {p}rowid AS match_id, {p}league AS league,
+                           {p}area AS area, {p}season AS season,
+                           {p}start_time AS start_time, {p}team1 AS team1,
+                           {p}team2 AS team2, COALESCE({p}outcome, 'NONE') AS outcome,
+                           {p}team1_odds AS team1_odds, {p}draw_odds AS draw_odds,
+                           {p}team2_odds AS team2_odds,
+                           1.0 / {p}team1_odds AS inv1, 1.0 / {p}draw_odds AS invd,
+                           1.0 / {p}team2_odds AS inv2,
+                           CASE WHEN COALESCE(min({p}team1_odds, {p}draw_odds, {p}team2_odds), 0) <= 0 THEN NULL
+                           WHEN {p}team1_odds < {p}team2_odds THEN 'TEAM1'
+                           WHEN {p}team2_odds < {p}team1_odds THEN 'TEAM2' END
+                           AS favourite {source})'''
+
+CREATE_TABLES_SQL = (
+    '''CREATE TABLE IF NOT EXISTS match_odds
+       (match_id integer PRIMARY KEY, league text, area text, season text,
+       start_time integer, team1 text, team2 text, outcome text,
+       team1_odds real, draw_odds real, team2_odds real, team1_prob real,
+       draw_prob real, team2_prob real, overround real, favourite text,
+       favourite_won integer)''',
+    '''CREATE TABLE IF NOT EXISTS league_seasons
+       (league text, area text, season text, matches integer,
+       decided integer, team1_wins integer, draws integer, team2_wins integer,
+       priced integer, overround_sum real, favourite_decided integer,
+       favourite_wins integer, underdog_wins integer, favourite_prob_sum real,
+       PRIMARY KEY (league, area, season))''',
+    '''CREATE TABLE IF NOT EXISTS team_seasons
+       (league text, area text, season text, team text, played integer,
+       wins integer, draws integer, losses integer, home_played integer,
+       home_wins integer, favourite_played integer, favourite_wins integer,
+       PRIMARY KEY (league, area, season, team))''',
+    "CREATE INDEX IF NOT EXISTS match_odds_league_season ON match_odds (league, area, season)",
+    "CREATE INDEX IF NOT EXISTS team_seasons_team ON team_seasons (team, season)",
+)
+
+# A match's row in match_odds follows the match, the summaries follow match_odds
+CREATE_TRIGGERS_SQL = (
+    '''CREATE TRIGGER IF NOT EXISTS matches_analytics_insert AFTER INSERT ON matches
+       BEGIN
+       INSERT INTO match_odds ''' + MATCH_ODDS_SELECT_SQL.format(p="NEW.", source="") + ''';
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS matches_analytics_update AFTER UPDATE ON matches
+       BEGIN
+       DELETE FROM match_odds WHERE match_id = OLD.rowid;
+       INSERT INTO match_odds ''' + MATCH_ODDS_SELECT_SQL.format(p="NEW.", source="") + ''';
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS matches_analytics_delete AFTER DELETE ON matches
+       BEGIN
+       DELETE FROM match_odds WHERE match_id = OLD.rowid;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS match_odds_insert AFTER INSERT ON match_odds
+       BEGIN
+       INSERT INTO league_seasons VALUES (NEW.league, NEW.area, NEW.season, 1,
+       NEW.outcome IN ''' + DECIDED_OUTCOMES + ''', NEW.outcome = 'TEAM1',
+       NEW.outcome = 'DRAW', NEW.outcome = 'TEAM2',
+       NEW.overround IS NOT NULL, COALESCE(NEW.overround, 0),
+       NEW.favourite_won IS NOT NULL, NEW.favourite_won IS 1,
+       NEW.favourite_won IS 0 AND NEW.outcome != 'DRAW',
+       CASE WHEN NEW.favourite_won IS NULL THEN 0
+       WHEN NEW.favourite = 'TEAM1' THEN NEW.team1_prob ELSE NEW.team2_prob END)
+       ON CONFLICT (league, area, season) DO UPDATE SET
+       matches = matches + excluded.matches, decided = decided + excluded.decided,
+       team1_wins = team1_wins + excluded.team1_wins,
+       draws = draws + excluded.draws,
+       team2_wins = team2_wins + excluded.team2_wins,
+       priced = priced + excluded.priced,
+       overround_sum = overround_sum + excluded.overround_sum,
+       favourite_decided = favourite_decided + excluded.favourite_decided,
+       favourite_wins = favourite_wins + excluded.favourite_wins,
+       underdog_wins = underdog_wins + excluded.underdog_wins,
+       favourite_prob_sum = favourite_prob_sum + excluded.favourite_prob_sum;
+       INSERT INTO team_seasons
+       SELECT NEW.league, NEW.area, NEW.season, NEW.team1, 1,
+       NEW.outcome = 'TEAM1', NEW.outcome = 'DRAW', NEW.outcome = 'TEAM2', 1,
+       NEW.outcome = 'TEAM1', NEW.favourite IS 'TEAM1',
+       NEW.favourite IS 'TEAM1' AND NEW.outcome = 'TEAM1'
+       WHERE NEW.outcome IN ''' + DECIDED_OUTCOMES + '''
+       UNION ALL
+       SELECT NEW.league, NEW.area, NEW.season, NEW.team2, 1,
+       NEW.outcome = 'TEAM2', NEW.outcome = 'DRAW', NEW.outcome = 'TEAM1', 0, 0,
+       NEW.favourite IS 'TEAM2',
+       NEW.favourite IS 'TEAM2' AND NEW.outcome = 'TEAM2'
+       WHERE NEW.outcome IN ''' + DECIDED_OUTCOMES + '''
+       ON CONFLICT (league, area, season, team) DO UPDATE SET
+       played = played + excluded.played, wins = wins + excluded.wins,
+       draws = draws + excluded.draws, losses = losses + excluded.losses,
+       home_played = home_played + excluded.home_played,
+       home_wins = home_wins + excluded.home_wins,
+       favourite_played = favourite_played + excluded.favourite_played,
+       favourite_wins = favourite_wins + excluded.favourite_wins;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS match_odds_delete AFTER DELETE ON match_odds
+       BEGIN
+       UPDATE league_seasons SET matches = matches - 1,
+       decided = decided - (OLD.outcome IN ''' + DECIDED_OUTCOMES + '''),
+       team1_wins = team1_wins - (OLD.outcome = 'TEAM1'),
+       draws = draws - (OLD.outcome = 'DRAW'),
+       team2_wins = team2_wins - (OLD.outcome = 'TEAM2'),
+       priced = priced - (OLD.overround IS NOT NULL),
+       overround_sum = overround_sum - COALESCE(OLD.overround, 0),
+       favourite_decided = favourite_decided - (OLD.favourite_won IS NOT NULL),
+       favourite_wins = favourite_wins - (OLD.favourite_won IS 1),
+       underdog_wins = underdog_wins - (OLD.favourite_won IS 0 AND OLD.outcome != 'DRAW'),
+       favourite_prob_sum = favourite_prob_sum - CASE WHEN OLD.favourite_won IS NULL THEN 0
+       WHEN OLD.favourite = 'TEAM1' THEN OLD.team1_prob ELSE OLD.team2_prob END
+       WHERE league = OLD.league AND area = OLD.area AND season = OLD.season;
+       DELETE FROM league_seasons WHERE league = OLD.league AND area = OLD.area
+       AND season = OLD.season AND matches = 0;
+       UPDATE team_seasons SET played = played - 1,
+       wins = wins - (OLD.outcome = 'TEAM1'), draws = draws - (OLD.outcome = 'DRAW'),
+       losses = losses - (OLD.outcome = 'TEAM2'), home_played = home_played - 1,
+       home_wins = home_wins - (OLD.outcome = 'TEAM1'),
+       favourite_played = favourite_played - (OLD.favourite IS 'TEAM1'),
+       favourite_wins = favourite_wins - (OLD.favourite IS 'TEAM1' AND OLD.outcome = 'TEAM1')
+       WHERE league = OLD.league AND area = OLD.area AND season = OLD.season
+       AND team = OLD.team1 AND OLD.outcome IN ''' + DECIDED_OUTCOMES + ''';
+       UPDATE team_seasons SET played = played - 1,
+       wins = wins - (OLD.outcome = 'TEAM2'), draws = draws - (OLD.outcome = 'DRAW'),
+       losses = losses - (OLD.outcome = 'TEAM1'),
+       favourite_played = favourite_played - (OLD.favourite IS 'TEAM2'),
+       favourite_wins = favourite_wins - (OLD.favourite IS 'TEAM2' AND OLD.outcome = 'TEAM2')
+       WHERE league = OLD.league AND area = OLD.area AND season = OLD.season
+       AND team = OLD.team2 AND OLD.outcome IN ''' + DECIDED_OUTCOMES + ''';
+       DELETE FROM team_seasons WHERE league = OLD.league AND area = OLD.area
+       AND season = OLD.season AND team IN (OLD.team1, OLD.team2) AND played = 0;
+       END''',
+)
+
+ANALYTICS_TABLES = ("match_odds", "league_seasons", "team_seasons")
+# Seasons are named as in the games schema, i.e. "2015/2016" or "2016", tables
+# built by earlier versions named them by a start year guessed from the date
+SEASON_TYPE = "text"
+
+ANALYTICS_TRIGGERS = ("matches_analytics_insert", "matches_analytics_update",
+                      "matches_analytics_delete", "match_odds_insert",
+                      "match_odds_delete")
+
+LEAGUE_SEASONS_SQL = '''SELECT league, area, season, matches, decided,
+                        CAST(team1_wins AS real) / NULLIF(decided, 0) AS home_win_rate,
+                        CAST(draws AS real) / NULLIF(decided, 0) AS draw_rate,
+                        CAST(team2_wins AS real) / NULLIF(decided, 0) AS away_win_rate,
+                        overround_sum / NULLIF(priced, 0) AS mean_overround,
+                        CAST(favourite_wins AS real) / NULLIF(favourite_decided, 0)
+                        AS favourite_hit_rate,
+                        favourite_prob_sum / NULLIF(favourite_decided, 0)
+                        AS favourite_implied_rate,
+                        CAST(underdog_wins AS real) / NULLIF(favourite_decided, 0)
+                        AS underdog_hit_rate
+                        FROM league_seasons'''
+
+TEAM_SEASONS_SQL = '''SELECT league, area, season, team, played, wins, draws,
+                      losses, 3 * wins + draws AS points, home_played, home_wins,
+                      favourite_played, favourite_wins
+                      FROM team_seasons'''
+
+class AnalyticsManager():
+
+    def __init__(self, db_filename=DB_FILENAME):
+        """
+        Constructor. Connect to the matches database.
+
+        Args:
+            db_filename (str): Path of the SQLite database.
+        """
+
+        self.conn = sqlite3.connect(db_filename)
+        for pragma in PRAGMAS:
+            self.conn.execute(pragma)
+        self.conn.row_factory = sqlite3.Row
+
+    def is_built(self):
+        """
+        Determine whether the analytics tables and the triggers that maintain
+        them all exist, as built by this version.
+
+        Returns:
+            (bool)
+        """
+
+        names = set(row[0] for row in self.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')"))
+        if not names.issuperset(ANALYTICS_TABLES + ANALYTICS_TRIGGERS):
+            return False
+        return any(row[1] == "season" and row[2].lower() == SEASON_TYPE
+                   for row in self.conn.execute("PRAGMA table_info(match_odds)"))
+
+    def build(self, rebuild=False):
+        """
+        Create the analytics tables and their triggers, and fill them in from
+        the matches already stored. Once built, every match inserted, updated
+        or deleted is reflected in them in the same transaction.
+
+        Args:
+            rebuild (bool): Recompute the tables from scratch even if they
+                are already built.
+
+        Returns:
+            (int) Number of matches the tables were filled in from, 0 when
+                they were already built.
+        """
+
+        if self.is_built() and not rebuild:
+            return 0
+        with self.conn:
+            # the triggers need the matches table, even if nothing was scraped
+            # yet, with the seasons of its matches named
+            self.conn.execute(CREATE_MATCHES_SQL)
+            add_missing_columns(self.conn)
+            fill_in_seasons(self.conn)
+            for trigger in ANALYTICS_TRIGGERS:
+                self.conn.execute("DROP TRIGGER IF EXISTS " + trigger)
+            for table in ANALYTICS_TABLES:
+                self.conn.execute("DROP TABLE IF EXISTS " + table)
+            for create_sql in CREATE_TABLES_SQL + CREATE_TRIGGERS_SQL:
+                self.conn.execute(create_sql)
+            # the match_odds triggers fill in the summaries as rows go in
+            cursor = self.conn.execute("INSERT INTO match_odds " +
+                                       MATCH_ODDS_SELECT_SQL.format(p="", source="FROM matches"))
+        return cursor.rowcount
+
+    def get_league_seasons(self, league=None, area=None, season=None):
+        """
+        Get outcome rates, mean overround and favourite hit rates per league
+        season.
+
+        Args:
+            league (str): Only this league, all when None.
+            area (str): Only leagues of this area, all when None.
+            season (str): Only this season, i.e. "2015/2016".
+
+        Returns:
+            (list of dict) One per league season, most recent first.
+        """
+
+        where, params = self.get_filter(league=league, area=area, season=season)
+        return self.query(LEAGUE_SEASONS_SQL + where +
+                          " ORDER BY league, area, season DESC", params)
+
+    def get_standings(self, league, area, season):
+        """
+        Get the record of every team of a league season, best first.
+
+        Args:
+            league (str): League name.
+            area (str): League area.
+            season (str): Season name, i.e. "2015/2016".
+
+        Returns:
+            (list of dict)
+        """
+
+        where, params = self.get_filter(league=league, area=area, season=season)
+        return self.query(TEAM_SEASONS_SQL + where +
+                          " ORDER BY points DESC, wins DESC, team", params)
+
+    def get_team_history(self, team):
+        """
+        Get a team's record in every league season it played in.
+
+        Args:
+            team (str): Team name, as scraped.
+
+        Returns:
+            (list of dict) Most recent season first.
+        """
+
+        where, params = self.get_filter(team=team)
+        return self.query(TEAM_SEASONS_SQL + where +
+                          " ORDER BY season DESC, league", params)
+
+    def get_filter(self, **columns):
+        """
+        Build a WHERE clause matching the given columns, leaving out those that
+        are None.
+
+        Returns:
+            (tuple of str, list) The clause and its parameters.
+        """
+
+        conditions = [name + " = ?" for name, value in columns.items() if value is not None]
+        params = [value for value in columns.values() if value is not None]
+        if not conditions:
+            return "", params
+        return " WHERE " + " AND ".join(conditions), params
+
+    def query(self, sql, params):
+        """
+        Returns:
+            (list of dict) The rows of a query.
+        """
+
+        return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def __del__(self):
+        """
+        Destructor.
+        """
+
+        self.conn.close()
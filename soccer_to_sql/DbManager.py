@@ -2,10 +2,239 @@
 Manager class to handle database interactions.
 """
 
+from datetime import datetime
 import os
+import re
 import sqlite3
+import time
 
-DB_FILENAME = "oddsportal.db"
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+# One database at the root of the repository, full_scraper's sqlite output
+# defaults to the same file
+DB_FILENAME = os.path.join(REPO_ROOT, "oddsportal.db")
+# Where earlier versions wrote it, relative to the working directory they
+# were run from, normally this one
+LEGACY_DB_FILENAMES = (
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "oddsportal.db"),
+    os.path.abspath("oddsportal.db"),
+)
+
+# Normalized games schema, shared with full_scraper
+SCHEMA_PATH = os.path.join(REPO_ROOT, "schema", "games.sql")
+SPORT = "soccer"
+SEASON_YEARS = re.compile(r"-(\d{4})(?:-(\d{4}))?/results/?$")
+# Area and league slugs of a results URL, without the years of a past season,
+# i.e. "england" and "premier-league" of .../england/premier-league-2015-2016/results/
+LEAGUE_SLUGS = re.compile(r"/soccer/([^/]+)/([^/#?]+?)(?:-\d{4}(?:-\d{4})?)?/results/?(?:[#?]|$)")
+GAME_OUTCOMES = {"TEAM1": "HOME", "TEAM2": "AWAY", "DRAW": "DRAW"}
+
+# Connection tuning for bulk writes: write-ahead log so readers don't block the
+# writer, fsync only at checkpoints, a 64 MB page cache and in-memory temp tables.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA temp_store=MEMORY",
+)
+
+MATCH_KEY = ("league", "area", "start_time", "team1", "team2")
+
+# Earlier versions keyed matches on their displayed time taken as local time,
+# which is off from the site's epoch seconds by at most the widest UTC offset.
+# A match written under its epoch replaces a row of the same teams within that
+# window, so a database from then holds each match once. PRAGMA user_version
+# is set to EPOCH_KEYS_VERSION on databases that never held such rows.
+DISPLAY_TIME_WINDOW = 14 * 60 * 60
+EPOCH_KEYS_VERSION = 1
+
+DELETE_DISPLAY_TIME_MATCH_SQL = '''DELETE FROM matches WHERE league=? AND area=?
+                                   AND start_time BETWEEN ? AND ?
+                                   AND start_time != ? AND team1=? AND team2=?'''
+
+DELETE_DISPLAY_TIME_GAME_SQL = '''DELETE FROM games WHERE home_team_id=?
+                                  AND game_time BETWEEN ? AND ?
+                                  AND game_time != ? AND away_team_id=?
+                                  AND season_id=?'''
+
+# Rows left twice by runs between the switch to epoch keys and this cleanup,
+# the later row of a pair is the one written under the epoch
+DELETE_DISPLAY_TIME_DUPLICATES_SQL = (
+    '''DELETE FROM matches WHERE EXISTS (SELECT 1 FROM matches AS later
+       WHERE later.league = matches.league AND later.area = matches.area
+       AND later.start_time BETWEEN matches.start_time - {window}
+       AND matches.start_time + {window}
+       AND later.team1 = matches.team1 AND later.team2 = matches.team2
+       AND later.rowid > matches.rowid)'''.format(window=DISPLAY_TIME_WINDOW),
+    '''DELETE FROM games WHERE EXISTS (SELECT 1 FROM games AS later
+       WHERE later.home_team_id = games.home_team_id
+       AND later.game_time BETWEEN games.game_time - {window}
+       AND games.game_time + {window}
+       AND later.away_team_id = games.away_team_id
+       AND later.season_id = games.season_id
+       AND later.game_id > games.game_id)'''.format(window=DISPLAY_TIME_WINDOW),
+)
+
+CREATE_MATCHES_SQL = '''CREATE TABLE IF NOT EXISTS matches
+                        (league text NOT NULL, area text NOT NULL,
+                        retrieved_from_url text, start_time integer NOT NULL,
+                        end_time integer, team1 text NOT NULL,
+                        team2 text NOT NULL, outcome text, team1_odds real,
+                        team2_odds real, draw_odds real, team1_score integer,
+                        team2_score integer, season text,
+                        UNIQUE (league, area, start_time, team1, team2))'''
+
+# Columns added to the matches table since it was first keyed
+ADDED_MATCH_COLUMNS = (("team1_score", "integer"), ("team2_score", "integer"),
+                       ("season", "text"))
+
+CREATE_INDEXES_SQL = (
+    "CREATE INDEX IF NOT EXISTS matches_league_start_time ON matches (league, area, start_time)",
+    "CREATE INDEX IF NOT EXISTS matches_start_time ON matches (start_time)",
+    "CREATE INDEX IF NOT EXISTS matches_team1 ON matches (team1, start_time)",
+    "CREATE INDEX IF NOT EXISTS matches_team2 ON matches (team2, start_time)",
+)
+
+# A match already stored is only rewritten when something about it changed,
+# so a re-run leaves unchanged rows (and their pages on disk) alone.
+INSERT_MATCH_SQL = '''INSERT INTO matches VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                      ON CONFLICT (league, area, start_time, team1, team2)
+                      DO UPDATE SET retrieved_from_url=excluded.retrieved_from_url,
+                      end_time=excluded.end_time, outcome=excluded.outcome,
+                      team1_odds=excluded.team1_odds,
+                      team2_odds=excluded.team2_odds,
+                      draw_odds=excluded.draw_odds,
+                      team1_score=excluded.team1_score,
+                      team2_score=excluded.team2_score,
+                      season=excluded.season
+                      WHERE outcome IS NOT excluded.outcome
+                      OR team1_score IS NOT excluded.team1_score
+                      OR team2_score IS NOT excluded.team2_score
+                      OR end_time IS NOT excluded.end_time
+                      OR team1_odds IS NOT excluded.team1_odds
+                      OR team2_odds IS NOT excluded.team2_odds
+                      OR draw_odds IS NOT excluded.draw_odds
+                      OR season IS NOT excluded.season'''
+
+UPSERT_GAME_SQL = '''INSERT INTO games (season_id, game_time, home_team_id,
+                     away_team_id, outcome, score_home, score_away, odds_home,
+                     odds_away, odds_draw, num_possible_outcomes, retrieval_url)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 3, ?)
+                     ON CONFLICT (season_id, game_time, home_team_id, away_team_id)
+                     DO UPDATE SET outcome=excluded.outcome,
+                     score_home=excluded.score_home, score_away=excluded.score_away,
+                     odds_home=excluded.odds_home, odds_away=excluded.odds_away,
+                     odds_draw=excluded.odds_draw,
+                     retrieval_url=excluded.retrieval_url
+                     WHERE outcome IS NOT excluded.outcome
+                     OR score_home IS NOT excluded.score_home
+                     OR score_away IS NOT excluded.score_away
+                     OR odds_home IS NOT excluded.odds_home
+                     OR odds_away IS NOT excluded.odds_away
+                     OR odds_draw IS NOT excluded.odds_draw'''
+
+def to_real(odds):
+    """
+    Convert an odds string scraped from a match row to a number.
+
+    Args:
+        odds (str): Odds as scraped, i.e. "1.85", or "-" when there are none.
+
+    Returns:
+        (float) The odds, or None when there are none.
+    """
+
+    try:
+        return float(odds)
+    except (TypeError, ValueError):
+        return None
+
+def get_league_slugs(retrieved_from_url):
+    """
+    Get the area and league a match's results URL belongs to, as full_scraper
+    names them, so both key a league's games the same way in the games schema.
+
+    Args:
+        retrieved_from_url (str): URL the match was retrieved from.
+
+    Returns:
+        (tuple of str) Area and league slugs, i.e. ("england",
+            "premier-league"), or None when the URL is not a results URL.
+    """
+
+    match = LEAGUE_SLUGS.search(retrieved_from_url)
+    if match is None:
+        return None
+    return match.groups()
+
+def get_season_name(retrieved_from_url, start_time):
+    """
+    Name a match's season the way the site's season selector does, i.e.
+    "2015/2016", from the years in its results URL. The live season's URL has
+    none, its name is taken from the start time with July as the turn of the
+    season.
+
+    Args:
+        retrieved_from_url (str): URL the match was retrieved from.
+        start_time (int): Start time of the match, unix time.
+
+    Returns:
+        (str)
+    """
+
+    match = SEASON_YEARS.search(retrieved_from_url.split("#")[0])
+    if match:
+        return "/".join(year for year in match.groups() if year)
+    start = datetime.fromtimestamp(start_time)
+    year = start.year if start.month >= 7 else start.year - 1
+    return "{}/{}".format(year, year + 1)
+
+def add_missing_columns(conn):
+    """
+    Add the columns a matches table from an earlier version lacks, at the
+    end so its rows keep their column order.
+
+    Args:
+        conn (object): sqlite3 connection to the database.
+    """
+
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(matches)")}
+    for name, column_type in ADDED_MATCH_COLUMNS:
+        if name not in columns:
+            conn.execute("ALTER TABLE matches ADD COLUMN {} {}".format(name, column_type))
+
+def fill_in_seasons(conn):
+    """
+    Name the season of the matches stored before matches had one.
+
+    Args:
+        conn (object): sqlite3 connection to the database.
+    """
+
+    conn.create_function("get_season_name", 2, get_season_name)
+    conn.execute("UPDATE matches SET season=get_season_name("
+                 "COALESCE(retrieved_from_url, ''), start_time) "
+                 "WHERE season IS NULL")
+
+def move_legacy_database():
+    """
+    Move a database an earlier version wrote to the working directory to
+    DB_FILENAME, along with its write-ahead log, unless DB_FILENAME exists.
+    """
+
+    for legacy_filename in LEGACY_DB_FILENAMES:
+        if not os.path.exists(legacy_filename) or os.path.samefile(REPO_ROOT, os.path.dirname(legacy_filename)):
+            continue
+        if os.path.exists(DB_FILENAME):
+            print("Ignoring the database of an earlier version at", legacy_filename,
+                  "as", os.path.abspath(DB_FILENAME), "exists, move or merge it by hand")
+            return
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(legacy_filename + suffix):
+                os.replace(legacy_filename + suffix, DB_FILENAME + suffix)
+        print("Moved the database of an earlier version from", legacy_filename,
+              "to", os.path.abspath(DB_FILENAME))
+        return
 
 class DatabaseManager():
 
@@ -13,31 +242,146 @@ class DatabaseManager():
         """
         Constructor.
 
+        The database persists between runs, matches scraped again are
+        upserted on their natural key.
+
         Args:
             is_first_run (bool): Is this the first DatabaseManager
-                created in this run?
+                created in this run? The schema is only set up then.
         """
 
         if is_first_run:
-            try:
-                os.remove(DB_FILENAME)
-            except OSError:
-                pass
+            move_legacy_database()
         self.conn = sqlite3.connect(DB_FILENAME)
+        for pragma in PRAGMAS:
+            self.conn.execute(pragma)
         self.cursor = self.conn.cursor()
+        self.rows_written = 0
+        self.rows_changed = 0
+        self.seconds_writing = 0.0
+        # Natural keys -> row ids of the games schema, looked up once each
+        self.sport_id = None
+        self.season_ids = {}
+        self.team_ids = {}
+        self.has_display_times = False
         if is_first_run:
-            self.cursor.execute('''DROP TABLE IF EXISTS matches''')
-            self.cursor.execute('''CREATE TABLE matches
-                                    (league text, area text,
-                                    retrieved_from_url text, start_time integer,
-                                    end_time integer, team1 text, team2 text,
-                                    outcome text, team1_odds real,
-                                    team2_odds real, draw_odds real)''')
-            self.conn.commit()
+            self.create_schema()
+        # Whether rows keyed on a displayed time may still be around
+        self.has_display_times = self.conn.execute(
+            "PRAGMA user_version").fetchone()[0] < EPOCH_KEYS_VERSION
+
+    def create_schema(self):
+        """
+        Create the matches table and its indexes if they don't exist yet, and
+        bring a table from before matches had a natural key up to date.
+        """
+
+        user_version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        with self.conn:
+            if self.is_legacy_schema():
+                self.migrate_legacy_schema()
+            self.conn.execute(CREATE_MATCHES_SQL)
+            add_missing_columns(self.conn)
+            fill_in_seasons(self.conn)
+            for create_index_sql in CREATE_INDEXES_SQL:
+                self.conn.execute(create_index_sql)
+        with open(SCHEMA_PATH) as schema_file:
+            self.conn.executescript(schema_file.read())
+        with self.conn:
+            # matches stored before the games schema existed
+            if self.conn.execute("SELECT 1 FROM games LIMIT 1").fetchone() is None:
+                self.add_games(self.conn.execute("SELECT * FROM matches").fetchall())
+        if user_version < EPOCH_KEYS_VERSION:
+            self.upgrade_to_epoch_keys()
+
+    def upgrade_to_epoch_keys(self):
+        """
+        Drop the display time rows of matches already written again under
+        their epoch, or mark a database without rows as keyed on epochs only.
+        """
+
+        with self.conn:
+            if self.conn.execute("SELECT 1 FROM matches LIMIT 1").fetchone() is None:
+                self.conn.execute("PRAGMA user_version={}".format(EPOCH_KEYS_VERSION))
+                return
+            deleted = [self.conn.execute(delete_sql).rowcount
+                       for delete_sql in DELETE_DISPLAY_TIME_DUPLICATES_SQL]
+        if deleted[0]:
+            print("Dropped", deleted[0], "matches stored twice, under their "
+                  "displayed time and their epoch")
+
+    def is_legacy_schema(self):
+        """
+        Determine whether the matches table exists without its unique natural
+        key, as created by earlier versions that rebuilt it on every run.
+
+        Returns:
+            (bool)
+        """
+
+        if self.conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' "
+                             "AND name='matches'").fetchone() is None:
+            return False
+        for index in self.conn.execute("PRAGMA index_list(matches)"):
+            columns = tuple(row[2] for row in self.conn.execute(
+                "PRAGMA index_info('{}')".format(index[1])))
+            if index[2] and columns == MATCH_KEY:
+                return False
+        return True
+
+    def migrate_legacy_schema(self):
+        """
+        Move the rows of a legacy matches table into the keyed schema, keeping
+        the last row seen of any duplicate match and converting quoted odds
+        to numbers.
+        """
+
+        self.conn.execute("ALTER TABLE matches RENAME TO matches_legacy")
+        self.conn.execute(CREATE_MATCHES_SQL)
+        self.conn.execute('''INSERT OR REPLACE INTO matches (league, area,
+                             retrieved_from_url, start_time, end_time, team1,
+                             team2, outcome, team1_odds, team2_odds, draw_odds)
+                             SELECT league, area, retrieved_from_url,
+                             start_time, end_time, team1, team2, outcome,
+                             CASE WHEN CAST(team1_odds AS real) > 0
+                             THEN CAST(team1_odds AS real) END,
+                             CASE WHEN CAST(team2_odds AS real) > 0
+                             THEN CAST(team2_odds AS real) END,
+                             CASE WHEN CAST(draw_odds AS real) > 0
+                             THEN CAST(draw_odds AS real) END
+                             FROM matches_legacy ORDER BY rowid''')
+        self.conn.execute("DROP TABLE matches_legacy")
+
+    def get_match_row(self, league, retrieved_from_url, match):
+        """
+        Get the values of a soccer match, in the column order of the matches
+        table.
+
+        Args:
+            league (dict): The dict result from parsing a league.json file.
+
+            retrieved_from_url (str): URL this match was retrieved from.
+
+            match (object): The SoccerMatch to get the values of.
+
+        Returns:
+            (tuple)
+        """
+
+        start_time = match.get_start_time_unix_int()
+        return (league["league"], league["area"], retrieved_from_url,
+                start_time,
+                match.get_end_time_unix_int(), match.get_team1_string(),
+                match.get_team2_string(), match.get_outcome_string(),
+                to_real(match.get_team1_odds()),
+                to_real(match.get_team2_odds()),
+                to_real(match.get_draw_odds()), match.get_team1_score(),
+                match.get_team2_score(),
+                get_season_name(retrieved_from_url or "", start_time))
 
     def add_soccer_match(self, league, retrieved_from_url, match):
         """
-        Insert a soccer match entry into the database.
+        Insert or update a soccer match entry in the database.
 
         Args:
             league (dict): The dict result from parsing a league.json file.
@@ -47,21 +391,170 @@ class DatabaseManager():
             match (object): The SoccerMatch to insert into the database.
         """
 
-        sql_str = "INSERT INTO matches VALUES ('"
-        sql_str += league["league"] + "', '"
-        sql_str += league["area"] + "', '"
-        sql_str += retrieved_from_url + "', "
-        sql_str += str(match.get_start_time_unix_int()) + ", "
-        sql_str += str(match.get_end_time_unix_int()) + ", '"
-        sql_str += match.get_team1_string() + "', '"
-        sql_str += match.get_team2_string() + "', '"
-        sql_str += match.get_outcome_string() + "', '"
-        sql_str += str(match.get_team1_odds()) + "', '"
-        sql_str += str(match.get_team2_odds()) + "', '"
-        sql_str += str(match.get_draw_odds()) + "')"
-
-        self.cursor.execute(sql_str)
-        self.conn.commit()
+        self.add_soccer_matches(league, retrieved_from_url, [match])
+
+    def add_soccer_matches(self, league, retrieved_from_url, matches):
+        """
+        Insert or update a batch of soccer match entries, i.e. a page or a
+        season, in the database in a single transaction.
+
+        Args:
+            league (dict): The dict result from parsing a league.json file.
+
+            retrieved_from_url (str): URL these matches were retrieved from.
+
+            matches (list of object): The SoccerMatch objects to insert.
+
+        Returns:
+            (int) Number of rows inserted.
+        """
+
+        rows = [self.get_match_row(league, retrieved_from_url, match)
+                for match in matches]
+        return self.add_rows(rows)
+
+    def add_rows(self, rows):
+        """
+        Upsert rows of match values, in the column order of the matches table,
+        in a single transaction.
+
+        Args:
+            rows (list of tuple): Rows to upsert.
+
+        Returns:
+            (int) Number of rows written.
+        """
+
+        if not rows:
+            return 0
+        started_at = time.perf_counter()
+        with self.conn:
+            if self.has_display_times:
+                self.conn.executemany(DELETE_DISPLAY_TIME_MATCH_SQL, [
+                    (league, area, start_time - DISPLAY_TIME_WINDOW,
+                     start_time + DISPLAY_TIME_WINDOW, start_time, team1, team2)
+                    for league, area, _, start_time, _, team1, team2, *_ in rows])
+            # the row count leaves out the games and analytics rows written along
+            rows_changed = self.conn.executemany(INSERT_MATCH_SQL, rows).rowcount
+            self.add_games(rows)
+        self.seconds_writing += time.perf_counter() - started_at
+        self.rows_written += len(rows)
+        self.rows_changed += rows_changed
+        return len(rows)
+
+    def add_games(self, rows):
+        """
+        Upsert rows of match values into the normalized games schema shared
+        with full_scraper, within the current transaction. Leagues are keyed
+        on the slugs of their results URL there, as full_scraper keys them,
+        falling back to the names of the league file.
+
+        Args:
+            rows (list of tuple): Rows in the column order of the matches table.
+        """
+
+        games = []
+        for (league, area, retrieved_from_url, start_time, _, team1, team2,
+             outcome, team1_odds, team2_odds, draw_odds, team1_score,
+             team2_score, season) in rows:
+            slugs = get_league_slugs(retrieved_from_url or "")
+            if slugs is not None:
+                area, league = slugs
+            season_id = self.get_season_id(league, area, season)
+            games.append((season_id, start_time, self.get_team_id(team1),
+                          self.get_team_id(team2), GAME_OUTCOMES.get(outcome),
+                          team1_score, team2_score, team1_odds, team2_odds,
+                          draw_odds, retrieved_from_url))
+        if self.has_display_times:
+            self.conn.executemany(DELETE_DISPLAY_TIME_GAME_SQL, [
+                (game[2], game[1] - DISPLAY_TIME_WINDOW, game[1] + DISPLAY_TIME_WINDOW,
+                 game[1], game[3], game[0]) for game in games])
+        self.conn.executemany(UPSERT_GAME_SQL, games)
+
+    def get_id(self, insert_sql, select_sql, params):
+        """
+        Insert a row unless it exists, then get its id.
+
+        Returns:
+            (int)
+        """
+
+        self.conn.execute(insert_sql, params)
+        return self.conn.execute(select_sql, params).fetchone()[0]
+
+    def get_sport_id(self):
+        """
+        Returns:
+            (int) Id of soccer in the sports table.
+        """
+
+        if self.sport_id is None:
+            self.sport_id = self.get_id("INSERT INTO sports (name) VALUES (?) ON CONFLICT (name) DO NOTHING",
+                                        "SELECT sport_id FROM sports WHERE name=?", (SPORT,))
+        return self.sport_id
+
+    def get_season_id(self, league, area, season):
+        """
+        Args:
+            league (str): League slug, i.e. "premier-league".
+            area (str): League area slug, i.e. "england".
+            season (str): Season name, i.e. "2015/2016".
+
+        Returns:
+            (int) Id of the season, recorded along with its league if new.
+        """
+
+        key = (league, area, season)
+        if key not in self.season_ids:
+            league_id = self.get_id("INSERT INTO leagues (sport_id, area, name) VALUES (?, ?, ?) "
+                                    "ON CONFLICT (sport_id, area, name) DO NOTHING",
+                                    "SELECT league_id FROM leagues WHERE sport_id=? AND area=? AND name=?",
+                                    (self.get_sport_id(), area, league))
+            self.season_ids[key] = self.get_id("INSERT INTO seasons (league_id, name) VALUES (?, ?) "
+                                               "ON CONFLICT (league_id, name) DO NOTHING",
+                                               "SELECT season_id FROM seasons WHERE league_id=? AND name=?",
+                                               (league_id, season))
+        return self.season_ids[key]
+
+    def get_team_id(self, team):
+        """
+        Args:
+            team (str): Team name, as scraped.
+
+        Returns:
+            (int) Id of the team, recorded if new.
+        """
+
+        if team not in self.team_ids:
+            self.team_ids[team] = self.get_id("INSERT INTO teams (name, sport_id) VALUES (?, ?) "
+                                              "ON CONFLICT (name, sport_id) DO NOTHING",
+                                              "SELECT team_id FROM teams WHERE name=? AND sport_id=?",
+                                              (team, self.get_sport_id()))
+        return self.team_ids[team]
+
+    def get_rows_per_second(self):
+        """
+        Get the insert throughput so far.
+
+        Returns:
+            (float) Rows inserted per second spent writing.
+        """
+
+        if self.seconds_writing == 0:
+            return 0.0
+        return self.rows_written / self.seconds_writing
+
+    def get_write_report(self):
+        """
+        Get a summary of the writes made so far.
+
+        Returns:
+            (str)
+        """
+
+        return "{} rows written, {} new or changed, in {:.3f} s ({:.0f} rows/sec)".format(
+            self.rows_written, self.rows_changed, self.seconds_writing,
+            self.get_rows_per_second())
 
     def __del__(self):
         """
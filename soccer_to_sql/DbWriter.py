@@ -0,0 +1,124 @@
+"""
+Single writer thread that drains scraped pages from a bounded queue into the
+database, so concurrent scrapers never contend for the SQLite write lock.
+"""
+
+from DbManager import DatabaseManager
+import queue
+import threading
+
+class DatabaseWriter():
+
+    def __init__(self, initialize_db, queue_size=64, batch_size=2000):
+        """
+        Constructor. Start the writer thread, which owns the only
+        DatabaseManager connection of the run.
+
+        Args:
+            initialize_db (bool): Should the database be initialized?
+            queue_size (int): Pages that may wait to be written before
+                scrapers block on put.
+            batch_size (int): Rows upserted per transaction, at most. Pages
+                waiting in the queue are written together up to this many.
+        """
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.db_manager = None
+        self.error = None
+        self.report = "No rows written"
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(initialize_db,),
+                                       name="DatabaseWriter", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+
+    def put(self, league, retrieved_from_url, matches):
+        """
+        Queue a page of soccer matches to be written, blocking while the queue
+        is full.
+
+        Args:
+            league (dict): The dict result from parsing a league.json file.
+
+            retrieved_from_url (str): URL these matches were retrieved from.
+
+            matches (list of object): The SoccerMatch objects to insert.
+        """
+
+        if self.error is not None:
+            raise RuntimeError("Database writer failed") from self.error
+        if matches:
+            self.queue.put((league, retrieved_from_url, matches))
+
+    def run(self, initialize_db):
+        """
+        Writer thread body. Connect, then write batches until close() queues
+        the end of the run.
+
+        Args:
+            initialize_db (bool): Should the database be initialized?
+        """
+
+        try:
+            # sqlite3 connections belong to the thread that opened them
+            self.db_manager = DatabaseManager(initialize_db)
+        except Exception as e:
+            self.error = e
+            return
+        finally:
+            self.ready.set()
+
+        is_done = False
+        while not is_done:
+            rows, is_done = self.get_batch()
+            if self.error is not None:
+                # keep draining so scrapers blocked on put() can see the error
+                continue
+            try:
+                self.db_manager.add_rows(rows)
+            except Exception as e:
+                self.error = e
+                print("Database writer failed:", e)
+
+        # release the connection on the thread that owns it
+        self.report = self.db_manager.get_write_report()
+        self.db_manager = None
+
+    def get_batch(self):
+        """
+        Wait for a page, then take every page already queued behind it, up to
+        batch_size rows.
+
+        Returns:
+            (tuple of list, bool) Rows to upsert, and whether the end of the
+                run was reached.
+        """
+
+        rows = []
+        item = self.queue.get()
+        while item is not None:
+            league, retrieved_from_url, matches = item
+            rows.extend(self.db_manager.get_match_row(league, retrieved_from_url, match)
+                        for match in matches)
+            if len(rows) >= self.batch_size:
+                return rows, False
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return rows, False
+        return rows, True
+
+    def close(self):
+        """
+        Write whatever is still queued, then stop the writer thread.
+
+        Returns:
+            (str) Summary of the writes made during the run.
+        """
+
+        self.queue.put(None)
+        self.thread.join()
+        return self.report
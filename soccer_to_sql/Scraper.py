@@ -2,17 +2,26 @@
 Soccer match results scraping object.
 """
 
-from bs4 import BeautifulSoup
 from DbManager import DatabaseManager
 import json
-import re
-import time
 from selenium import webdriver
+from selenium.common.exceptions import StaleElementReferenceException
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
 from SoccerMatch import SoccerMatch
+from TableExtractor import TableExtractor
+
+# Longest wait for the match rows of a page to load, after which the table is
+# read as it is
+TABLE_TIMEOUT = 10 # seconds
+TABLE_POLL_FREQUENCY = 0.2 # seconds
+# The notice is the whole text of a div.cms, as full_scraper finds it
+NO_DATA_XPATH = "//div[contains(@class, 'cms')][contains(text(), 'No data available')]"
 
 class Scraper():
 
-    def __init__(self, league_json, initialize_db):
+    def __init__(self, league_json, initialize_db, writer=None, browser=None,
+                 extractor=None):
         """
         Constructor. Launch the web driver browser, initialize the league
         field by parsing the representative JSON file, and connect to the
@@ -22,11 +31,26 @@ class Scraper():
             league_json (str): JSON string of the league to associate with the
                 Scraper.
             initialize_db (bool): Should the database be initialized?
-        """
-
-        self.browser = webdriver.Chrome("./chromedriver/chromedriver")
+            writer (object): DatabaseWriter shared by concurrent scrapers.
+                Scraped pages are queued to it instead of written through a
+                connection of this Scraper's own.
+            browser (object): Web driver to reuse instead of launching one.
+                Its owner closes it.
+            extractor (object): TableExtractor to reuse, with the date
+                headers it already parsed, instead of a new one.
+        """
+
+        self.owns_browser = browser is None
+        if self.owns_browser:
+            browser = webdriver.Chrome("./chromedriver/chromedriver")
+        self.browser = browser
         self.league = self.parse_json(league_json)
-        self.db_manager = DatabaseManager(initialize_db)
+        self.writer = writer
+        self.db_manager = DatabaseManager(initialize_db) if writer is None else None
+        self.extractor = extractor if extractor is not None else TableExtractor()
+        # Pages of a season only change the URL fragment, the previous page's
+        # rows stay in the table until the new ones replace them
+        self.last_table_html = None
 
     def parse_json(self, json_str):
         """
@@ -56,228 +80,152 @@ class Scraper():
             print(output_str)
 
         for url in self.league["urls"]:
-            # loop through all pages in that season
-            page = 1
-            while self.scrape_url("#/page/".join((url, "{}/".format(page)))):
-                if do_verbose_output:
-                    print("Scraped page", page)
-                page += 1
-
-            if do_verbose_output:
-                print("Finished season")
+            self.scrape_season(url, do_verbose_output)
 
-
-        self.browser.close()
+        if self.owns_browser:
+            self.browser.close()
 
         if do_verbose_output is True:
             print("Done scraping this league.")
+            if self.db_manager is not None:
+                print(self.db_manager.get_write_report())
 
-    def scrape_url(self, url):
+    def scrape_season(self, url, do_verbose_output=False):
         """
-        Scrape the data for every match on a given URL and insert each into the
-        database.
+        Call the scrape method on every page of a season, in order. The page
+        count is read from the first page, so no page past the last is loaded.
 
         Args:
-            url (str): URL to scrape data from.
-
-        Returns:
-            Whether data existed for that season.
-        """
-
-        self.browser.get(url)
-
-        # waiting for table to load
-        # needed or else the data won't be complete
-        delay = 5 # seconds
-        time.sleep(delay)
-
-        tournament_tbl = self.browser.find_element_by_id("tournamentTable")
-        tournament_tbl_html = tournament_tbl.get_attribute("innerHTML")
-        tournament_tbl_soup = BeautifulSoup(tournament_tbl_html, "html.parser")
-        try:
-            significant_rows = tournament_tbl_soup(self.is_soccer_match_or_date)
-        except:
-            return False
-
-        current_date_str = None
-        for row in significant_rows:
-            if self.is_date(row) is True:
-                current_date_str = self.get_date(row)
-            elif self.is_date_string_supported(current_date_str) == False:
-                # not presently supported
-                continue
-            else:  # is a soccer match
-                this_match = SoccerMatch()
-                game_datetime_str = current_date_str + " " + self.get_time(row)
-                this_match.set_start(game_datetime_str)
-                participants = self.get_participants(row)
-                this_match.set_teams(participants)
-                scores = self.get_scores(row)
-                this_match.set_outcome_from_scores(scores)
-                odds = self.get_odds(row)
-                this_match.set_odds(odds)
-                self.db_manager.add_soccer_match(self.league, url, this_match)
-
-        return True
-
-    def is_soccer_match_or_date(self, tag):
-        """
-        Determine whether a provided HTML tag is a row for a soccer match or
-        date.
-
-        Args:
-            tag (obj): HTML tag object from BeautifulSoup.
-
-        Returns:
-            (bool)
-        """
-
-        if tag.name != "tr":
-            return False
-        if "center" in tag["class"] and "nob-border" in tag["class"]:
-            return True
-        if "deactivate" in tag["class"] and tag.has_attr("xeid"):
-            return True
-        return False
-
-    def is_date(self, tag):
+            url (str): URL of the season's results.
+            do_verbose_output (bool): True/false do verbose output.
         """
-        Determine whether a provided HTML tag is a row for a date.
 
-        Args:
-            tag (obj): HTML tag object from BeautifulSoup.
+        page_urls = self.scrape_first_page(url)
+        if do_verbose_output:
+            print("Scraped page 1 of", len(page_urls) + 1, "of", url)
 
-        Returns:
-            (bool)
-        """
+        for page, page_url in enumerate(page_urls, 2):
+            self.scrape_url(page_url)
+            if do_verbose_output:
+                print("Scraped page", page, "of", len(page_urls) + 1, "of", url)
 
-        return "center" in tag["class"] and "nob-border" in tag["class"]
+        if do_verbose_output:
+            print("Finished season", url)
 
-    def is_date_string_supported(self, date_string):
+    def scrape_first_page(self, url):
         """
-        Determine whether a given date string is currently supported by this
-        software's parsing capabilities.
+        Scrape the first page of a season and read how many pages it has.
 
         Args:
-            date_string (str): Date string to assess.
+            url (str): URL of the season's results.
 
         Returns:
-            (bool)
+            (list of str) URLs of the season's other pages, to be scraped in
+                any order. Empty when the first page held no data.
         """
 
-        if date_string is None:
-            return False
-        elif "Today" in date_string:
-            return False
-        elif "Yesterday" in date_string:
-            return False
-        elif "Qualification" in date_string:
-            return False
-        elif "Promotion" in date_string:
-            return False
-        return True
+        if not self.scrape_url(self.get_page_url(url, 1)):
+            return []
+        page_count = self.get_page_count()
+        return [self.get_page_url(url, page) for page in range(2, page_count + 1)]
 
-    def get_date(self, tag):
+    def get_page_url(self, url, page):
         """
-        Extract the date from an HTML tag for a date row.
-
         Args:
-            tag (obj): HTML tag object from BeautifulSoup.
+            url (str): URL of the season's results.
+            page (int): Page number, starting at 1.
 
         Returns:
-            (str) Extracted date string.
+            (str) URL of that page of the season's results.
         """
 
-        this_date = tag.find(class_="datet").string
-        if "Today" in this_date:
-            return "Today"
-        elif this_date.endswith(" - Play Offs"):
-            this_date = this_date[:-12]
-        return this_date
+        return "#/page/".join((url, "{}/".format(page)))
 
-    def get_time(self, tag):
+    def get_page_count(self):
         """
-        Extract the time from an HTML tag for a soccer match row.
-
-        Args:
-            tag (obj): HTML tag object from BeautifulSoup.
+        Read the season's page count from the pagination of the page loaded
+        in the browser.
 
         Returns:
-            (str) Extracted time.
+            (int)
         """
 
-        return tag.find(class_="datet").string
+        pagination = self.browser.find_elements_by_id("pagination")
+        if not pagination:
+            return 1
+        return self.extractor.get_page_count(pagination[0].get_attribute("innerHTML"))
 
-    def get_participants(self, tag):
+    def get_table_html(self):
         """
-        Extract the match's participants from an HTML tag for a soccer match
-        row.
-
-        Args:
-            tag (obj): HTML tag object from BeautifulSoup.
-
         Returns:
-            (list of str) Extracted match participants.
+            (str) Inner HTML of the tournamentTable, or None when the page has
+                none.
         """
 
-        parsed_strings = tag.find(class_="table-participant").text.split(" - ")
-        participants = []
-        participants.append(parsed_strings[0])
-        participants.append(parsed_strings[-1])
-        return participants
+        tables = self.browser.find_elements_by_id("tournamentTable")
+        if not tables:
+            return None
+        return tables[0].get_attribute("innerHTML")
 
-    def get_scores(self, tag):
+    def is_table_loaded(self, browser):
         """
-        Extract the scores for each team from an HTML tag for a soccer match
-        row.
+        Condition for WebDriverWait, met once the page loaded its match rows
+        or says it has none.
 
         Args:
-            tag (obj): HTML tag object from BeautifulSoup.
+            browser (object): The web driver waited on.
 
         Returns:
-            (list of str) Extracted match scores.
+            (bool)
         """
 
-        score_str = tag.find(class_="table-score").string
-        if self.is_invalid_game_from_score_string(score_str):
-            return [-1,-1]
-        non_decimal = re.compile(r"[^\d]+")
-        score_str = non_decimal.sub(" ", score_str)
-        scores = [int(s) for s in score_str.split()]
-        return scores
+        table_html = self.get_table_html()
+        if table_html is not None and "<tr" in table_html and table_html != self.last_table_html:
+            return True
+        return len(browser.find_elements_by_xpath(NO_DATA_XPATH)) > 0
 
-    def get_odds(self, tag):
+    def scrape_url(self, url):
         """
-        Extract the betting odds for a match from an HTML tag for a soccer
-        match row.
+        Scrape the data for every match on a given URL and insert each into the
+        database.
 
         Args:
-            tag (obj): HTML tag object from BeautifulSoup.
+            url (str): URL to scrape data from.
 
         Returns:
-            (list of str) Extracted match odds.
+            Whether the page held any match data.
         """
 
-        odds_cells = tag.find_all(class_="odds-nowrp")
-        odds = []
-        for cell in odds_cells:
-            odds.append(cell.text)
-        return odds
-
-    def is_invalid_game_from_score_string(self, score_str):
-        """
-        Assess, from the score string extracted from a soccer match row,
-        whether a game actually paid out one of the bet outcomes.
-
-        Args:
-            score_str (str): Score string to assess.
+        self.browser.get(url)
 
-        Returns:
-            (bool)
-        """
+        try:
+            WebDriverWait(self.browser, TABLE_TIMEOUT,
+                          poll_frequency=TABLE_POLL_FREQUENCY,
+                          ignored_exceptions=(StaleElementReferenceException,)).until(
+                              self.is_table_loaded)
+        except TimeoutException:
+            print("Match rows of", url, "still loading after", TABLE_TIMEOUT,
+                  "seconds, reading them as they are")
+        tournament_tbl_html = self.get_table_html()
+        if tournament_tbl_html is None:
+            return False
+        self.last_table_html = tournament_tbl_html
+        extracted_matches, has_rows = self.extractor.extract(tournament_tbl_html)
+        if not has_rows:
+            return False
 
-        if score_str == "postp.":
-            return True
-        elif score_str == "canc.":
-            return True
-        return False
+        matches = []
+        for start, participants, scores, odds in extracted_matches:
+            this_match = SoccerMatch()
+            this_match.set_start_datetime(start)
+            this_match.set_teams(participants)
+            this_match.set_outcome_from_scores(scores)
+            this_match.set_odds(odds)
+            matches.append(this_match)
+
+        if self.writer is not None:
+            self.writer.put(self.league, url, matches)
+        else:
+            # one transaction per page instead of one commit per match
+            self.db_manager.add_soccer_matches(self.league, url, matches)
+        return True
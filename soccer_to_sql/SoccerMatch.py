@@ -3,7 +3,6 @@ Soccer match object.
 """
 
 from datetime import datetime
-import time
 
 MINUTES_TO_SECONDS = 60
 
@@ -21,6 +20,7 @@ class SoccerMatch():
         self.team2_odds = ""
         self.draw_odds = ""
         self.outcome = ""
+        self.scores = None
 
     def set_start(self, start_time_str):
         """
@@ -33,6 +33,16 @@ class SoccerMatch():
 
         self.start = datetime.strptime(start_time_str, "%d %b %Y %H:%M")
 
+    def set_start_datetime(self, start):
+        """
+        Set the match's start time from an already parsed datetime.
+
+        Args:
+            start (datetime): The match start time.
+        """
+
+        self.start = start
+
     def set_teams(self, participants):
         """
         Set the match's participating teams.
@@ -47,12 +57,14 @@ class SoccerMatch():
 
     def set_outcome_from_scores(self, scores):
         """
-        Set the match's outcome string, based on team 1 and team 2 scores.
+        Set the match's scores and outcome string, based on team 1 and team 2
+        scores.
 
         Args:
             scores (list of int): Team 1 and team 2 scores, in that order.
         """
 
+        self.scores = scores
         if scores == None or len(scores) == 0:
             self.outcome = "NONE"
         elif scores[0] == -1 and scores[1] == -1:
@@ -79,7 +91,9 @@ class SoccerMatch():
 
     def get_start_time_unix_int(self):
         """
-        Get the start time of a match, as a Unix format timestamp (GMT+5).
+        Get the start time of a match, as a Unix format timestamp. A start read
+        from the site's epoch seconds is exact, a displayed one is taken as
+        local time.
 
         Returns:
             (int) Start time as a Unix timestamp.
@@ -87,12 +101,12 @@ class SoccerMatch():
 
         if self.start is None:
             return 0
-        return int(time.mktime(self.start.timetuple()))
+        return int(self.start.timestamp())
 
     def get_end_time_unix_int(self):
         """
         Get the estimated end time of a game, where the estimate is the start
-        time plus 90 minutes, as a Unix format timestamp (GMT+5).
+        time plus 90 minutes, as a Unix format timestamp.
 
         Returns:
             (int) Estimated end time as a Unix timestamp.
@@ -100,7 +114,7 @@ class SoccerMatch():
 
         if self.start is None:
             return 0
-        return (90 * MINUTES_TO_SECONDS) + int(time.mktime(self.start.timetuple()))
+        return (90 * MINUTES_TO_SECONDS) + self.get_start_time_unix_int()
 
     def get_team1_string(self):
         """
@@ -122,6 +136,40 @@ class SoccerMatch():
 
         return self.team2
 
+    def get_team1_score(self):
+        """
+        Get the score of team 1.
+
+        Return:
+            (int) Team 1 score, or None when the match has none.
+        """
+
+        return self.get_score(0)
+
+    def get_team2_score(self):
+        """
+        Get the score of team 2.
+
+        Return:
+            (int) Team 2 score, or None when the match has none.
+        """
+
+        return self.get_score(1)
+
+    def get_score(self, index):
+        """
+        Args:
+            index (int): 0 for team 1, 1 for team 2.
+
+        Return:
+            (int) That team's score, or None when the match has none, i.e.
+                postponement or cancellation.
+        """
+
+        if not self.scores or len(self.scores) < 2 or self.scores[index] < 0:
+            return None
+        return self.scores[index]
+
     def get_team1_odds(self):
         """
         Get the odds of a team 1 win.
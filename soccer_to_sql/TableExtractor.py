@@ -0,0 +1,195 @@
+"""
+Single-pass extraction of soccer matches from the HTML of a results page's
+tournamentTable.
+"""
+
+from datetime import datetime, timezone
+import lxml.html
+import re
+
+NON_DECIMAL = re.compile(r"[^\d]+")
+PAGE_HREF = re.compile(r"#/page/(\d+)/?$")
+# The time cell of a match row carries the start as epoch seconds in a class,
+# i.e. "table-time datet t1452272400-1-1-0-0"
+START_CLASS = re.compile(r"^t(\d+)-")
+
+DATE_FORMAT = "%d %b %Y"
+PLAY_OFFS_SUFFIX = " - Play Offs"
+UNSUPPORTED_DATE_MARKERS = ("Today", "Yesterday", "Qualification", "Promotion")
+INVALID_SCORES = ("postp.", "canc.")
+
+class TableExtractor():
+
+    def __init__(self):
+        """
+        Constructor. Date headers repeat on every page of a season, so each
+        one is only parsed once per extractor.
+        """
+
+        self.dates = {}
+
+    def extract(self, table_html):
+        """
+        Extract every soccer match under a supported date header from the inner
+        HTML of a tournamentTable, walking its rows once.
+
+        Args:
+            table_html (str): Inner HTML of the tournamentTable element.
+
+        Returns:
+            (tuple of list, bool) Tuples of (start datetime, participants,
+                scores, odds) for each match, in the shape the SoccerMatch
+                setters take, and whether the table held any date or match
+                rows at all.
+        """
+
+        if not table_html or not table_html.strip():
+            return [], False
+        table = lxml.html.fromstring("<table>" + table_html + "</table>")
+        matches = []
+        has_rows = False
+        current_date = None
+        for row in table.iter("tr"):
+            classes = row.get("class", "").split()
+            if "center" in classes and "nob-border" in classes:
+                has_rows = True
+                current_date = self.get_date(row)
+            elif "deactivate" in classes and row.get("xeid") is not None:
+                has_rows = True
+                if current_date is not None:
+                    matches.append(self.get_match(row, current_date))
+        return matches, has_rows
+
+    def get_date(self, row):
+        """
+        Parse the date of a date row, once per distinct header.
+
+        Args:
+            row (obj): lxml element of a date row.
+
+        Returns:
+            (date) The header's date, or None when it is not supported.
+        """
+
+        date_str = None
+        for element in row.iter():
+            if "datet" in element.get("class", "").split():
+                date_str = element.text_content()
+                break
+        if date_str not in self.dates:
+            self.dates[date_str] = self.parse_date(date_str)
+        return self.dates[date_str]
+
+    def parse_date(self, date_str):
+        """
+        Args:
+            date_str (str): Date header text, i.e. "08 Jan 2016 - Play Offs".
+
+        Returns:
+            (date) or None for headers that are not presently supported.
+        """
+
+        if date_str is None:
+            return None
+        for marker in UNSUPPORTED_DATE_MARKERS:
+            if marker in date_str:
+                return None
+        if date_str.endswith(PLAY_OFFS_SUFFIX):
+            date_str = date_str[:-len(PLAY_OFFS_SUFFIX)]
+        try:
+            return datetime.strptime(date_str, DATE_FORMAT).date()
+        except ValueError:
+            return None
+
+    def get_match(self, row, current_date):
+        """
+        Read a match row's cells in one walk over them.
+
+        Args:
+            row (obj): lxml element of a match row.
+            current_date (date): Date of the header the row is under.
+
+        Returns:
+            (tuple) of start datetime, participants, scores and odds.
+        """
+
+        start = None
+        participants = None
+        scores = [-1, -1]
+        odds = []
+        for cell in row:
+            classes = cell.get("class", "").split()
+            if "odds-nowrp" in classes:
+                odds.append(cell.text_content())
+            elif "table-participant" in classes:
+                parsed_strings = cell.text_content().split(" - ")
+                participants = [parsed_strings[0], parsed_strings[-1]]
+            elif "table-score" in classes:
+                scores = self.get_scores(cell.text_content())
+            elif "datet" in classes:
+                start = self.get_start(classes, cell.text_content(), current_date)
+        return start, participants, scores, odds
+
+    def get_start(self, classes, time_str, current_date):
+        """
+        Read a match's start from its time cell: the site's epoch seconds when
+        the cell carries them, as full_scraper stores them, or else the
+        displayed date and time.
+
+        Args:
+            classes (list of str): Classes of the time cell.
+            time_str (str): Time cell text, i.e. "20:00".
+            current_date (date): Date of the header the row is under.
+
+        Returns:
+            (datetime) In UTC from the epoch seconds, or naive local time.
+        """
+
+        for class_name in classes:
+            match = START_CLASS.match(class_name)
+            if match:
+                return datetime.fromtimestamp(int(match.group(1)), timezone.utc)
+        hour, minute = time_str.split(":")
+        return datetime(current_date.year, current_date.month,
+                        current_date.day, int(hour), int(minute))
+
+    def get_scores(self, score_str):
+        """
+        Args:
+            score_str (str): Score cell text, i.e. "2:1", "1:1 pen." or "postp.".
+
+        Returns:
+            (list of int) Team 1 and team 2 scores, [-1, -1] when the match
+                paid out no outcome.
+        """
+
+        if score_str in INVALID_SCORES:
+            return [-1, -1]
+        return [int(s) for s in NON_DECIMAL.sub(" ", score_str).split()]
+
+    def get_page_count(self, pagination_html):
+        """
+        Read the number of pages of a season from the inner HTML of the
+        pagination element of its first page. Every page link carries its
+        number, the last one ("»|") that of the final page.
+
+        Args:
+            pagination_html (str): Inner HTML of the pagination element, empty
+                or None when the season has a single page.
+
+        Returns:
+            (int)
+        """
+
+        if not pagination_html or not pagination_html.strip():
+            return 1
+        pagination = lxml.html.fromstring("<div>" + pagination_html + "</div>")
+        page_count = 1
+        for link in pagination.iter("a"):
+            page = link.get("x-page")
+            if page is None:
+                match = PAGE_HREF.search(link.get("href", ""))
+                page = match.group(1) if match else None
+            if page is not None and page.isdigit():
+                page_count = max(page_count, int(page))
+        return page_count
@@ -0,0 +1,83 @@
+"""
+Build and query the analytics tables of the matches database.
+
+    python analyze.py build [--rebuild]
+    python analyze.py leagues [--league LEAGUE] [--area AREA] [--season SEASON]
+    python analyze.py standings LEAGUE AREA SEASON
+    python analyze.py team TEAM
+"""
+
+from Analytics import AnalyticsManager
+import argparse
+from DbManager import DB_FILENAME, move_legacy_database
+
+def print_rows(rows):
+    """
+    Print query rows as an aligned table.
+
+    Args:
+        rows (list of dict): Rows to print, all with the same keys.
+    """
+
+    if not rows:
+        print("No rows")
+        return
+    columns = list(rows[0])
+    cells = [[format_value(row[column]) for column in columns] for row in rows]
+    widths = [max([len(column)] + [len(row[i]) for row in cells])
+              for i, column in enumerate(columns)]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in cells:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+
+def format_value(value):
+    """
+    Args:
+        value (object): Column value.
+
+    Returns:
+        (str) Rates and margins to three decimals, anything else as is.
+    """
+
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return "{:.3f}".format(value)
+    return str(value)
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--db", type=str, default=DB_FILENAME,
+                    help="SQLite database (default {})".format(DB_FILENAME))
+commands = parser.add_subparsers(dest="command")
+build_parser = commands.add_parser("build", help="Create and fill in the analytics tables")
+build_parser.add_argument("--rebuild", action="store_true",
+                          help="Recompute the tables even if they are already built")
+leagues_parser = commands.add_parser("leagues", help="Outcome and favourite rates per league season")
+leagues_parser.add_argument("--league", type=str)
+leagues_parser.add_argument("--area", type=str)
+leagues_parser.add_argument("--season", type=str, help="Season name, i.e. 2015/2016")
+standings_parser = commands.add_parser("standings", help="Team records of a league season")
+standings_parser.add_argument("league", type=str)
+standings_parser.add_argument("area", type=str)
+standings_parser.add_argument("season", type=str, help="Season name, i.e. 2015/2016")
+team_parser = commands.add_parser("team", help="A team's record per league season")
+team_parser.add_argument("team", type=str)
+args = parser.parse_args()
+
+if args.db == DB_FILENAME:
+    move_legacy_database()
+analytics = AnalyticsManager(args.db)
+if args.command == "build" and analytics.is_built() and not args.rebuild:
+    print("The analytics tables are already built, and kept up to date as matches are written")
+elif args.command == "build":
+    print("Filled in the analytics tables from", analytics.build(rebuild=True), "matches")
+elif not analytics.is_built():
+    print("The analytics tables are not built yet, or were built by an earlier version, run: python analyze.py build")
+elif args.command == "leagues":
+    print_rows(analytics.get_league_seasons(args.league, args.area, args.season))
+elif args.command == "standings":
+    print_rows(analytics.get_standings(args.league, args.area, args.season))
+elif args.command == "team":
+    print_rows(analytics.get_team_history(args.team))
+else:
+    parser.print_help()
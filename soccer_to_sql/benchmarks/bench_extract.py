@@ -0,0 +1,116 @@
+"""
+Benchmark of the tournamentTable row extraction: the BeautifulSoup
+html.parser path the scraper used to take against TableExtractor, in rows/sec.
+
+Usage: python benchmarks/bench_extract.py [--fixtures DIR] [--repeat N]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import load_tables
+from bs4 import BeautifulSoup
+from datetime import datetime
+from TableExtractor import TableExtractor
+
+def is_soccer_match_or_date(tag):
+    if tag.name != "tr":
+        return False
+    if "center" in tag["class"] and "nob-border" in tag["class"]:
+        return True
+    if "deactivate" in tag["class"] and tag.has_attr("xeid"):
+        return True
+    return False
+
+def is_date_string_supported(date_string):
+    if date_string is None:
+        return False
+    for marker in ("Today", "Yesterday", "Qualification", "Promotion"):
+        if marker in date_string:
+            return False
+    return True
+
+def get_scores(tag):
+    score_str = tag.find(class_="table-score").string
+    if score_str in ("postp.", "canc."):
+        return [-1, -1]
+    non_decimal = re.compile(r"[^\d]+")
+    return [int(s) for s in non_decimal.sub(" ", score_str).split()]
+
+def extract_with_soup(table_html):
+    """
+    The extraction Scraper.scrape_url used to do, row for row.
+    """
+
+    soup = BeautifulSoup(table_html, "html.parser")
+    matches = []
+    current_date_str = None
+    for row in soup(is_soccer_match_or_date):
+        if "center" in row["class"] and "nob-border" in row["class"]:
+            current_date_str = row.find(class_="datet").string
+            if "Today" in current_date_str:
+                current_date_str = "Today"
+            elif current_date_str.endswith(" - Play Offs"):
+                current_date_str = current_date_str[:-12]
+        elif not is_date_string_supported(current_date_str):
+            continue
+        else:
+            start = datetime.strptime(
+                current_date_str + " " + row.find(class_="datet").string,
+                "%d %b %Y %H:%M")
+            parsed_strings = row.find(class_="table-participant").text.split(" - ")
+            participants = [parsed_strings[0], parsed_strings[-1]]
+            odds = [cell.text for cell in row.find_all(class_="odds-nowrp")]
+            matches.append((start, participants, get_scores(row), odds))
+    return matches
+
+def get_comparable(matches):
+    """
+    The extractor reads start times from the epoch class of the time cell, the
+    old path from the displayed local time, so they are compared as epoch
+    seconds.
+    """
+
+    return [(int(start.timestamp()), participants, scores, odds)
+            for start, participants, scores, odds in matches]
+
+def extract_with_extractor(table_html):
+    # A fresh extractor per table, so date headers are only cached within a page
+    return TableExtractor().extract(table_html)[0]
+
+def bench(extract, tables, repeat):
+    started_at = time.perf_counter()
+    rows = 0
+    for _ in range(repeat):
+        for _, table_html in tables:
+            rows += len(extract(table_html))
+    return time.perf_counter() - started_at, rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixtures", type=str, nargs="?",
+                        help="Directory of saved tournamentTable *.html (default synthetic tables)")
+    parser.add_argument("--repeat", type=int, default=10,
+                        help="Passes over the tables (default 10)")
+    args = parser.parse_args()
+
+    tables = load_tables(args.fixtures)
+    if not tables:
+        sys.exit("No tables to benchmark")
+    mismatches = [name for name, table_html in tables
+                  if get_comparable(extract_with_soup(table_html)) !=
+                  get_comparable(extract_with_extractor(table_html))]
+    for name in mismatches:
+        print("Extraction differs on", name)
+
+    results = [("soup", bench(extract_with_soup, tables, args.repeat)),
+               ("extractor", bench(extract_with_extractor, tables, args.repeat))]
+    for name, (seconds, rows) in results:
+        print("{:<10} {:8.3f} s  {:10.0f} rows/sec".format(name, seconds, rows / seconds))
+    print("speedup    {:8.1f}x over {} tables, {} mismatches".format(
+        results[0][1][0] / results[1][1][0], len(tables), len(mismatches)))
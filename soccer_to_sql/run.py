@@ -1,22 +1,126 @@
 """
 Run the Odds Portal scraping suite, processing all the present soccer league
 JSON files in lexicographical order.
+
+Seasons are scraped concurrently, each worker with a browser of its own, and
+every scraped page is handed to a single database writer thread. The first
+page of a season tells how many pages it has, the rest are then scheduled
+all at once, so a long season is spread over every worker.
 """
 
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from DbWriter import DatabaseWriter
 from os import listdir, sep
 from os.path import isfile, join
+import json
 from Scraper import Scraper
+from TableExtractor import TableExtractor
+import threading
+from selenium import webdriver
 
 soccer_match_path = "." + sep + "leagues" + sep + "soccer"
 
-initialize_db = True
+parser = argparse.ArgumentParser()
+parser.add_argument("--scrapers", type=int, default=4,
+                    help="Seasons scraped at once, one browser each (default 4)")
+parser.add_argument("--queue-size", type=int, default=64,
+                    help="Scraped pages that may wait for the writer (default 64)")
+parser.add_argument("--batch-size", type=int, default=2000,
+                    help="Rows upserted per transaction, at most (default 2000)")
+args = parser.parse_args()
 
-for possible_file in listdir(soccer_match_path):
+# every season of every league is a unit of work
+seasons = []
+for possible_file in sorted(listdir(soccer_match_path)):
     if isfile(join(soccer_match_path, possible_file)):
         soccer_match_json_file = join(soccer_match_path, possible_file)
         with open(soccer_match_json_file, "r") as open_json_file:
             json_str = open_json_file.read().replace("\n", "")
-            match_scraper = Scraper(json_str, initialize_db)
-            match_scraper.scrape_all_urls(True)
-            if initialize_db is True:
-                initialize_db = False
\ No newline at end of file
+            for url in json.loads(json_str)["urls"]:
+                seasons.append((json_str, url))
+
+browsers = []
+browsers_lock = threading.Lock()
+worker_state = threading.local()
+
+def get_browser():
+    """
+    Get the browser of the calling worker thread, launching it the first time.
+
+    Returns:
+        (object) Web driver.
+    """
+
+    if getattr(worker_state, "browser", None) is None:
+        worker_state.browser = webdriver.Chrome("./chromedriver/chromedriver")
+        with browsers_lock:
+            browsers.append(worker_state.browser)
+    return worker_state.browser
+
+def get_extractor():
+    """
+    Get the table extractor of the calling worker thread, so the date headers
+    it parsed are reused on every page the worker scrapes.
+
+    Returns:
+        (object) TableExtractor.
+    """
+
+    if getattr(worker_state, "extractor", None) is None:
+        worker_state.extractor = TableExtractor()
+    return worker_state.extractor
+
+def scrape_first_page(json_str, url):
+    """
+    Scrape the first page of a season, queueing it to the shared writer.
+
+    Args:
+        json_str (str): JSON string of the season's league.
+        url (str): URL of the season's results.
+
+    Returns:
+        (list of str) URLs of the season's other pages.
+    """
+
+    match_scraper = Scraper(json_str, False, writer=writer, browser=get_browser(),
+                            extractor=get_extractor())
+    page_urls = match_scraper.scrape_first_page(url)
+    print("Scraped page 1 of", len(page_urls) + 1, "of", url)
+    return page_urls
+
+def scrape_page(json_str, url):
+    """
+    Scrape one page of a season, queueing it to the shared writer.
+
+    Args:
+        json_str (str): JSON string of the season's league.
+        url (str): URL of the page.
+    """
+
+    match_scraper = Scraper(json_str, False, writer=writer, browser=get_browser(),
+                            extractor=get_extractor())
+    match_scraper.scrape_url(url)
+    print("Scraped", url)
+
+writer = DatabaseWriter(True, queue_size=args.queue_size, batch_size=args.batch_size)
+try:
+    with ThreadPoolExecutor(max_workers=max(1, args.scrapers)) as executor:
+        pending = {executor.submit(scrape_first_page, json_str, url): (json_str, url, True)
+                   for json_str, url in seasons}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                json_str, url, is_first_page = pending.pop(future)
+                try:
+                    page_urls = future.result()
+                except Exception as e:
+                    print("Failed scraping", url, ":", e)
+                    continue
+                if is_first_page:
+                    for page_url in page_urls:
+                        pending[executor.submit(scrape_page, json_str, page_url)] = (json_str, page_url, False)
+finally:
+    for browser in browsers:
+        browser.quit()
+    print(writer.close())